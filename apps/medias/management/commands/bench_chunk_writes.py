@@ -0,0 +1,119 @@
+"""
+Benchmark the chunk upload write path (MB/s of one worker thread).
+
+Streams a synthetic upload through a pipe, which behaves like the buffered
+socket reader a WSGI server hands over, and writes it into a preallocated
+file with two loops:
+
+- read: one fresh ``bytes`` per block (the previous ``append_chunk`` loop)
+- readinto: ``write_body`` filling a reusable buffer
+
+Each block is fed to a running SHA-256 like a real upload unless --no-hash.
+
+Usage:
+    python manage.py bench_chunk_writes --size-mb 512 --chunk-mb 4
+"""
+
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from apps.medias.services.hashing import RunningHash
+from apps.medias.services.upload import CHUNK_SIZE, preallocate, write_body
+
+
+class ReadOnly:
+    """Hide ``readinto`` so write_body falls back to ``read``."""
+
+    def __init__(self, stream):
+        self.read = stream.read
+
+
+def _legacy_write(fd, body, offset, length, on_block):
+    position = offset
+    remaining = length
+    while remaining > 0:
+        chunk = body.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        written = os.pwrite(fd, chunk, position)
+        on_block(position, chunk[:written])
+        position += written
+        remaining -= written
+    return position - offset
+
+
+def _feed_pipe(write_fd: int, size: int) -> None:
+    block = os.urandom(CHUNK_SIZE)
+    with os.fdopen(write_fd, "wb") as pipe:
+        sent = 0
+        while sent < size:
+            count = min(len(block), size - sent)
+            pipe.write(block[:count])
+            sent += count
+
+
+class Command(BaseCommand):
+    help = "Compare read and readinto chunk write loops (upload MB/s per worker)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size-mb", type=int, default=256)
+        parser.add_argument("--chunk-mb", type=int, default=1)
+        parser.add_argument("--rounds", type=int, default=3)
+        parser.add_argument("--no-hash", action="store_true")
+        parser.add_argument(
+            "--dir", default=None, help="Directory of the scratch file (default: tmp)."
+        )
+
+    def run(self, mode: str, path: Path, size: int, chunk: int, hash_: bool) -> float:
+        read_fd, write_fd = os.pipe()
+        feeder = threading.Thread(target=_feed_pipe, args=(write_fd, size))
+        feeder.start()
+        running = RunningHash()
+        on_block = running.feed if hash_ else (lambda offset, block: None)
+        fd = os.open(path, os.O_WRONLY)
+        try:
+            with os.fdopen(read_fd, "rb") as stream:
+                started = time.perf_counter()
+                offset = 0
+                while offset < size:
+                    length = min(chunk, size - offset)
+                    if mode == "read":
+                        written = _legacy_write(
+                            fd, ReadOnly(stream), offset, length, on_block
+                        )
+                    else:
+                        written = write_body(fd, stream, offset, length, on_block)
+                    if not written:
+                        break
+                    offset += written
+                elapsed = time.perf_counter() - started
+        finally:
+            os.close(fd)
+            feeder.join()
+        return offset / elapsed / (1024 * 1024)
+
+    def handle(self, *args, **options):
+        size = options["size_mb"] * 1024 * 1024
+        chunk = options["chunk_mb"] * 1024 * 1024
+        hash_ = not options["no_hash"]
+
+        with tempfile.TemporaryDirectory(dir=options["dir"]) as scratch:
+            path = Path(scratch) / "bench.part"
+            path.touch()
+            preallocate(path, size)
+            for mode in ("read", "readinto"):
+                rates = [
+                    self.run(mode, path, size, chunk, hash_)
+                    for _ in range(options["rounds"])
+                ]
+                self.stdout.write(
+                    f"{mode:>8} size={options['size_mb']}MB "
+                    f"chunk={options['chunk_mb']}MB hash={'on' if hash_ else 'off'} "
+                    f"best={max(rates):,.0f}MB/s "
+                    f"median={sorted(rates)[len(rates) // 2]:,.0f}MB/s"
+                )
@@ -0,0 +1,115 @@
+"""
+Import a directory tree of audio files into a studio (back catalogue).
+
+Files are hashed and probed in thread pools, deduplicated against the
+studio's tracks and recorded in batches as finalized uploads with a queued
+transcode job each (see apps.medias.services.batch_import). Sources are
+hard-linked into the studio's incoming/ directory when on the same
+filesystem: do not edit them in place until their tracks are READY, or use
+--copy. The original kept under originals/ is always a copy.
+
+Progress is kept in a state file (by default under
+RADIO_ROOT/studios/<slug>/imports/): running the same command again resumes
+an interrupted import.
+
+Usage:
+    python manage.py import_directory my-studio /srv/catalogue
+    python manage.py import_directory my-studio /srv/catalogue --dry-run
+    python manage.py import_directory my-studio /mnt/nas --copy --hash-workers 8
+"""
+
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.medias.services import batch_import
+from apps.studio.models import Studio
+
+
+class Command(BaseCommand):
+    help = "Import the audio files of a directory tree into a studio."
+
+    def add_arguments(self, parser):
+        parser.add_argument("studio", help="Studio slug.")
+        parser.add_argument("directory", help="Directory to import.")
+        parser.add_argument(
+            "--hash-workers",
+            type=int,
+            default=4,
+            help="Files hashed concurrently.",
+        )
+        parser.add_argument(
+            "--probe-workers",
+            type=int,
+            default=4,
+            help="ffprobe processes run concurrently.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=200,
+            help="Files recorded per transaction.",
+        )
+        parser.add_argument(
+            "--extensions",
+            default=",".join(e[1:] for e in batch_import.AUDIO_EXTENSIONS),
+            help="Comma-separated file extensions to import.",
+        )
+        parser.add_argument(
+            "--copy",
+            action="store_true",
+            help="Copy files instead of hard-linking them.",
+        )
+        parser.add_argument(
+            "--state-file",
+            default=None,
+            help="Progress file (default: under the studio's imports/).",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        studio = Studio.objects.filter(slug=options["studio"]).first()
+        if studio is None:
+            raise CommandError(f"Unknown studio: {options['studio']}")
+        root = Path(options["directory"])
+        if not root.is_dir():
+            raise CommandError(f"Not a directory: {root}")
+        for name in ("hash_workers", "probe_workers", "batch_size"):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be positive")
+        extensions = tuple(
+            "." + e.strip().lower().lstrip(".")
+            for e in options["extensions"].split(",")
+            if e.strip()
+        )
+        state_path = (
+            Path(options["state_file"])
+            if options["state_file"]
+            else batch_import.default_state_path(studio, root)
+        )
+
+        def progress(stats):
+            if options["verbosity"] > 1:
+                self.stderr.write(json.dumps(stats.as_dict(), sort_keys=True))
+
+        try:
+            stats = batch_import.import_directory(
+                studio,
+                root,
+                hash_workers=options["hash_workers"],
+                probe_workers=options["probe_workers"],
+                batch_size=options["batch_size"],
+                extensions=extensions,
+                copy=options["copy"],
+                dry_run=options["dry_run"],
+                state_path=state_path,
+                on_batch=progress,
+            )
+        except RuntimeError as e:
+            # ffprobe not found
+            raise CommandError(str(e))
+        result = {"studio": studio.slug, **stats.as_dict()}
+        if not options["dry_run"]:
+            result["state_file"] = str(state_path)
+        self.stdout.write(json.dumps(result, sort_keys=True))
@@ -0,0 +1,117 @@
+"""
+Re-encode a studio's READY tracks at its current loudness target and bitrate.
+
+Tracks are queued as transcode jobs (fair per studio, see
+apps.medias.services.transcode_queue), read from their kept original and stay
+READY while they wait. Measurements cached per content_hash are reused, so
+most jobs run the encode only.
+
+Skipped: tracks already at the target and bitrate (unless --force, also the
+way to encode a changed rendition_ladder), tracks with a job already queued
+or running, duplicates (they follow the track they duplicate) and tracks
+without a RAW_ORIGINAL (uploaded before originals were kept, or with
+KEEP_ORIGINALS off).
+
+Usage:
+    python manage.py renormalize_studio my-studio
+    python manage.py renormalize_studio my-studio --target -16 --bitrate 192
+    python manage.py renormalize_studio my-studio --dry-run
+"""
+
+import json
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from apps.medias.models import LoudnessAnalysis, Track, TrackAsset, TranscodeJob
+from apps.medias.tasks import schedule_transcode
+from apps.studio.models import Studio
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = "Queue re-encodes of a studio's READY tracks at its loudness target."
+
+    def add_arguments(self, parser):
+        parser.add_argument("studio", help="Studio slug.")
+        parser.add_argument(
+            "--target",
+            type=Decimal,
+            default=None,
+            help="Set the studio's loudness_target_lufs first.",
+        )
+        parser.add_argument(
+            "--bitrate",
+            type=int,
+            default=None,
+            help="Set the studio's default_bitrate_kbps first.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Also re-encode tracks already at the target and bitrate.",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        studio = Studio.objects.filter(slug=options["studio"]).first()
+        if studio is None:
+            raise CommandError(f"Unknown studio: {options['studio']}")
+
+        update_fields = []
+        if options["target"] is not None:
+            studio.loudness_target_lufs = options["target"]
+            update_fields.append("loudness_target_lufs")
+        if options["bitrate"] is not None:
+            studio.default_bitrate_kbps = options["bitrate"]
+            update_fields.append("default_bitrate_kbps")
+        if update_fields and not options["dry_run"]:
+            studio.save(update_fields=update_fields)
+
+        tracks = Track.objects.filter(
+            studio=studio, state=Track.State.READY, is_duplicate_of__isnull=True
+        ).exclude(processed_rel_path="")
+        has_original = Exists(
+            TrackAsset.objects.filter(
+                track=OuterRef("pk"), asset_type=TrackAsset.AssetType.RAW_ORIGINAL
+            )
+        )
+        has_job = Exists(
+            TranscodeJob.objects.filter(
+                track=OuterRef("pk"),
+                status__in=[TranscodeJob.Status.QUEUED, TranscodeJob.Status.RUNNING],
+            )
+        )
+        measured = Exists(
+            LoudnessAnalysis.objects.filter(content_hash=OuterRef("content_hash"))
+        )
+        stats = {"studio": studio.slug, "ready": tracks.count()}
+        stats["no_original"] = tracks.exclude(has_original).count()
+        stats["in_progress"] = tracks.filter(has_job).count()
+
+        todo = tracks.filter(has_original).exclude(has_job)
+        if not options["force"]:
+            target = studio.loudness_target_lufs if studio.auto_normalize else None
+            current = Q(bitrate_kbps=studio.default_bitrate_kbps) & (
+                Q(normalized_lufs=target)
+                if target is not None
+                else Q(normalized_lufs__isnull=True)
+            )
+            stats["up_to_date"] = todo.filter(current).count()
+            todo = todo.exclude(current)
+        stats["queued"] = todo.count()
+        stats["cached_analysis"] = todo.filter(measured).count()
+
+        if not options["dry_run"]:
+            ids = list(todo.order_by("created_at").values_list("id", flat=True))
+            for start in range(0, len(ids), BATCH_SIZE):
+                with transaction.atomic():
+                    batch = Track.objects.select_related(
+                        "studio", "upload_session"
+                    ).filter(id__in=ids[start : start + BATCH_SIZE])
+                    for track in batch:
+                        schedule_transcode(track)
+        self.stdout.write(json.dumps(stats, sort_keys=True))
@@ -0,0 +1,33 @@
+"""
+Print transcode queue depth and average wait/run times per studio as JSON.
+
+Usage:
+    python manage.py transcode_queue_stats
+    python manage.py transcode_queue_stats --hours 6
+"""
+
+import datetime
+import json
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.medias.services import transcode_queue
+
+
+class Command(BaseCommand):
+    help = "Show queued/running transcode jobs and wait/run times per studio."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours",
+            type=int,
+            default=24,
+            help="Window of finished jobs averaged for wait and run times.",
+        )
+
+    def handle(self, *args, **options):
+        since = timezone.now() - datetime.timedelta(hours=options["hours"])
+        self.stdout.write(
+            json.dumps(transcode_queue.queue_stats(since), sort_keys=True)
+        )
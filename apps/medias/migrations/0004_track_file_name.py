@@ -0,0 +1,50 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:12
+
+import posixpath
+
+from django.db import migrations, models
+
+
+def backfill_file_name(apps, schema_editor):
+    Track = apps.get_model('medias', 'Track')
+    batch = []
+    qs = Track.objects.exclude(processed_rel_path='').only('id', 'processed_rel_path')
+    for track in qs.iterator(chunk_size=2000):
+        track.file_name = posixpath.basename(track.processed_rel_path)[:255]
+        batch.append(track)
+        if len(batch) >= 2000:
+            Track.objects.bulk_update(batch, ['file_name'])
+            batch = []
+    if batch:
+        Track.objects.bulk_update(batch, ['file_name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            'medias',
+            '0003_rename_processed_storage_key_track_processed_rel_path_and_more',
+        ),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='file_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(
+                fields=['studio', 'file_name'], name='tracks_studio__3f5aa1_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(
+                fields=['studio', 'title'], name='tracks_studio__cf1ba1_idx'
+            ),
+        ),
+        migrations.RunPython(backfill_file_name, migrations.RunPython.noop),
+    ]
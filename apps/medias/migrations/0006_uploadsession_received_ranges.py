@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:25
+
+from django.db import migrations, models
+
+
+def backfill_received_ranges(apps, schema_editor):
+    # In-flight uploads were written sequentially: their bytes are one prefix
+    UploadSession = apps.get_model('medias', 'UploadSession')
+    qs = UploadSession.objects.filter(bytes_received__gt=0).only('id', 'bytes_received')
+    for upload in qs.iterator(chunk_size=2000):
+        upload.received_ranges = [[0, upload.bytes_received]]
+        upload.save(update_fields=['received_ranges'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medias', '0005_uploadsession_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='received_ranges',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(backfill_received_ranges, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medias', '0006_uploadsession_received_ranges'),
+        ('studio', '0006_listenerdailyrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transcodejob',
+            index=models.Index(
+                fields=['status', 'created_at'], name='transcode_j_status_6d1f24_idx'
+            ),
+        ),
+    ]
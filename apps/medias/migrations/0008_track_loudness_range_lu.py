@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medias', '0007_transcodejob_status_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='loudness_range_lu',
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=6, null=True
+            ),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:41
+
+import uuid
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medias', '0008_track_loudness_range_lu'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoudnessAnalysis',
+            fields=[
+                (
+                    'id',
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    'created_at',
+                    models.DateTimeField(default=django.utils.timezone.now, null=True),
+                ),
+                (
+                    'updated_at',
+                    models.DateTimeField(default=django.utils.timezone.now, null=True),
+                ),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                (
+                    'integrated_lufs',
+                    models.DecimalField(decimal_places=2, max_digits=6),
+                ),
+                ('true_peak_dbtp', models.DecimalField(decimal_places=2, max_digits=6)),
+                (
+                    'loudness_range_lu',
+                    models.DecimalField(decimal_places=2, max_digits=6),
+                ),
+                ('threshold_lufs', models.DecimalField(decimal_places=2, max_digits=6)),
+            ],
+            options={
+                'db_table': 'loudness_analyses',
+            },
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='normalized_lufs',
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=5, null=True
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medias', '0009_loudness_analysis_normalized_lufs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trackasset',
+            name='bitrate_kbps',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
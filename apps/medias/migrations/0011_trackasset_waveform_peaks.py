@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medias', '0010_trackasset_bitrate_kbps'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='trackasset',
+            name='asset_type',
+            field=models.CharField(
+                choices=[
+                    ('RAW_ORIGINAL', 'Raw Original'),
+                    ('NORMALIZED_MP3', 'Normalized Mp3'),
+                    ('WAVEFORM_JSON', 'Waveform Json'),
+                    ('WAVEFORM_PEAKS', 'Waveform Peaks'),
+                    ('COVER_ART', 'Cover Art'),
+                    ('ALT_ENCODING', 'Alt Encoding'),
+                ],
+                max_length=32,
+            ),
+        ),
+    ]
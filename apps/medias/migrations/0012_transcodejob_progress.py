@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medias', '0011_trackasset_waveform_peaks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transcodejob',
+            name='progress_percent',
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=5, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name='transcodejob',
+            name='speed',
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=7, null=True
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medias', '0012_transcodejob_progress'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='source',
+            field=models.CharField(
+                choices=[
+                    ('DIRECT', 'Direct'),
+                    ('ADMIN_PANEL', 'Admin Panel'),
+                    ('API', 'Api'),
+                    ('IMPORT', 'Import'),
+                ],
+                default='DIRECT',
+                max_length=16,
+            ),
+        ),
+    ]
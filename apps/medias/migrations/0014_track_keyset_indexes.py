@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medias', '0013_uploadsession_import_source'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='track',
+            name='tracks_studio__e08ac3_idx',
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(
+                fields=['studio', 'created_at', 'id'], name='tracks_studio__549b9e_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(
+                fields=['studio', 'state', 'created_at', 'id'],
+                name='tracks_studio__124ebb_idx',
+            ),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from .analysis import LoudnessAnalysis
 from .pipeline import TranscodeJob
 from .tag import Tag, TrackTag
 from .track import Track, TrackAsset
@@ -10,4 +11,5 @@ __all__ = [
     "Tag",
     "TrackTag",
     "TranscodeJob",
+    "LoudnessAnalysis",
 ]
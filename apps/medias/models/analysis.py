@@ -0,0 +1,21 @@
+from django.db import models
+
+from config.model import BaseModel
+
+
+class LoudnessAnalysis(BaseModel):
+    """
+    Loudness measurements of a source file, keyed by its SHA-256.
+
+    They depend on the bytes only, so re-encodes (another loudness target or
+    bitrate) and re-uploads of the same file skip the analysis decode.
+    """
+
+    content_hash = models.CharField(max_length=64, unique=True)
+    integrated_lufs = models.DecimalField(max_digits=6, decimal_places=2)
+    true_peak_dbtp = models.DecimalField(max_digits=6, decimal_places=2)
+    loudness_range_lu = models.DecimalField(max_digits=6, decimal_places=2)
+    threshold_lufs = models.DecimalField(max_digits=6, decimal_places=2)
+
+    class Meta:
+        db_table = "loudness_analyses"
@@ -45,6 +45,13 @@ class TranscodeJob(BaseModel):
     )
     target_bitrate_kbps = models.PositiveIntegerField(null=True, blank=True)
 
+    # Encode progress of a RUNNING job, written every
+    # TRANSCODE_PROGRESS_INTERVAL seconds (speed: multiple of real time)
+    progress_percent = models.DecimalField(
+        max_digits=5, decimal_places=2, null=True, blank=True
+    )
+    speed = models.DecimalField(max_digits=7, decimal_places=2, null=True, blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
@@ -52,4 +59,6 @@ class TranscodeJob(BaseModel):
         indexes = [
             models.Index(fields=["studio", "status"]),
             models.Index(fields=["track", "status"]),
+            # Claiming the next job and finding stale ones
+            models.Index(fields=["status", "created_at"]),
         ]
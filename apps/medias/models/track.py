@@ -32,9 +32,19 @@ class Track(BaseModel):
     loudness_lufs = models.DecimalField(
         max_digits=6, decimal_places=2, null=True, blank=True
     )
+    # Measured on the source by the analysis pass: integrated loudness,
+    # true peak (dBTP) and loudness range
     peak_dbfs = models.DecimalField(
         max_digits=6, decimal_places=2, null=True, blank=True
     )
+    loudness_range_lu = models.DecimalField(
+        max_digits=6, decimal_places=2, null=True, blank=True
+    )
+    # Loudness target the published file was normalized to (None: the studio
+    # had auto_normalize off)
+    normalized_lufs = models.DecimalField(
+        max_digits=5, decimal_places=2, null=True, blank=True
+    )
 
     content_hash = models.CharField(max_length=64, db_index=True)
     is_duplicate_of = models.ForeignKey(
@@ -46,6 +56,8 @@ class Track(BaseModel):
     )
 
     processed_rel_path = models.CharField(max_length=512, blank=True)
+    # Basename of processed_rel_path, as reported by the automation player
+    file_name = models.CharField(max_length=255, blank=True)
     error_message = models.TextField(blank=True)
     upload_session = models.ForeignKey(
         "medias.UploadSession",
@@ -62,8 +74,12 @@ class Track(BaseModel):
         db_table = "tracks"
         unique_together = ("studio", "content_hash")
         indexes = [
-            models.Index(fields=["studio", "state"]),
+            # Keyset pagination of the library, see services.track_pages
+            models.Index(fields=["studio", "created_at", "id"]),
+            models.Index(fields=["studio", "state", "created_at", "id"]),
             models.Index(fields=["studio", "is_active", "state"]),
+            models.Index(fields=["studio", "file_name"]),
+            models.Index(fields=["studio", "title"]),
         ]
 
     def __str__(self):
@@ -75,6 +91,8 @@ class TrackAsset(BaseModel):
         RAW_ORIGINAL = "RAW_ORIGINAL"
         NORMALIZED_MP3 = "NORMALIZED_MP3"
         WAVEFORM_JSON = "WAVEFORM_JSON"
+        # Multi-resolution min/max peaks (apps.medias.services.waveform)
+        WAVEFORM_PEAKS = "WAVEFORM_PEAKS"
         COVER_ART = "COVER_ART"
         ALT_ENCODING = "ALT_ENCODING"
 
@@ -84,6 +102,8 @@ class TrackAsset(BaseModel):
     size_bytes = models.BigIntegerField(null=True, blank=True)
     mime_type = models.CharField(max_length=64, blank=True)
     checksum = models.CharField(max_length=64, blank=True)
+    # Encoded assets (ALT_ENCODING); the codec follows from mime_type
+    bitrate_kbps = models.PositiveIntegerField(null=True, blank=True)
 
     class Meta:
         db_table = "track_assets"
@@ -8,6 +8,7 @@ class UploadSession(BaseModel):
         DIRECT = "DIRECT"
         ADMIN_PANEL = "ADMIN_PANEL"
         API = "API"
+        IMPORT = "IMPORT"
 
     studio = models.ForeignKey(
         "studio.Studio", on_delete=models.CASCADE, related_name="upload_sessions"
@@ -25,6 +26,12 @@ class UploadSession(BaseModel):
     # Local disk upload state
     temp_rel_path = models.CharField(max_length=512, blank=True)
     bytes_received = models.BigIntegerField(default=0)
+    # Sorted, disjoint [start, end) byte ranges written so far (chunks may
+    # arrive out of order); bytes_received is their total length
+    received_ranges = models.JSONField(default=list, blank=True)
+    # SHA-256 announced by the client (optional) and computed from the bytes
+    expected_sha256 = models.CharField(max_length=64, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True)
 
     # Upload authorization (for PUT chunks)
     upload_token = models.CharField(max_length=64, blank=True)
@@ -6,13 +6,16 @@ from django.db import transaction
 from graphql_jwt.decorators import login_required
 
 from apps.medias.models import Track, UploadSession
+from apps.medias.services import transcode_queue
 from apps.medias.services.delete import delete_track_files
 from apps.medias.services.upload import (
+    check_upload_size,
     ensure_upload_token,
     finalize_upload,
     init_upload,
+    resolve_duplicate,
 )
-from apps.medias.tasks import start_pipeline_for_upload
+from apps.medias.tasks import schedule_transcode
 from apps.studio.models import Studio
 
 logger = logging.getLogger(__name__)
@@ -39,19 +42,26 @@ class RequestUpload(graphene.Mutation):
     ):
         user = info.context.user
         studio = Studio.objects.get(slug=studio_slug, is_active=True)
+        if size_bytes < 0:
+            raise Exception("size_bytes must not be negative")
+        # Before anything is created or preallocated on disk
+        check_upload_size(size_bytes)
 
         up = UploadSession.objects.create(
             studio=studio,
             original_filename=file_name,
             size_bytes=size_bytes,
             mime_type=mime_type,
+            expected_sha256=(checksum_sha256 or "").strip().lower()[:64],
         )
+        # Provisional hash until finalize computes the real digest of the bytes
+        # (see resolve_duplicate); a client checksum could already belong to
+        # another track of the studio
         track = Track.objects.create(
             studio=studio,
             title=file_name,
             state=Track.State.UPLOADING,
-            content_hash=checksum_sha256
-            or hashlib.sha256(f"{up.id}:{file_name}".encode()).hexdigest(),
+            content_hash=hashlib.sha256(f"{up.id}:{file_name}".encode()).hexdigest(),
             upload_session=up,
         )
         init_upload(studio, up)
@@ -81,16 +91,27 @@ class FinalizeUpload(graphene.Mutation):
         upload = UploadSession.objects.select_for_update().get(id=upload_id)
         track = Track.objects.get(upload_session=upload)
 
-        finalize_upload(upload)
-        upload.finalized = True
-        upload.save(update_fields=["finalized", "updated_at"])
+        temp_abs = finalize_upload(upload, checksum_sha256 or "")
+
+        if upload.sha256:
+            duplicate_of = resolve_duplicate(track, upload.sha256)
+            if duplicate_of is not None:
+                # Same bytes already transcoded: share the file, skip ffmpeg
+                transaction.on_commit(lambda: temp_abs.unlink(missing_ok=True))
+                logger.info(
+                    "Upload %s duplicates READY track %s; pipeline skipped",
+                    upload.id,
+                    duplicate_of.id,
+                )
+                return FinalizeUpload(ok=True, track_id=track.id)
+
+        job = schedule_transcode(track)
         logger.info(
-            "Finalizing upload %s; scheduling start_pipeline_for_upload for track %s",
+            "Finalized upload %s; transcode job %s queued for track %s",
             upload.id,
+            job.id,
             track.id,
         )
-        start_pipeline_for_upload.delay(track.id)
-        logger.info("Called start_pipeline_for_upload.delay for %s", track.id)
         return FinalizeUpload(ok=True, track_id=track.id)
 
 
@@ -118,7 +139,8 @@ class DeleteTrack(graphene.Mutation):
 
         # TODO: permission check (user can manage track in this studio)
 
-        # Remove files first (best effort)
+        # Stop its transcode, then remove files (best effort)
+        transcode_queue.cancel_jobs(track)
         delete_track_files(track)
 
         # Optionally delete the related UploadSession to clean up database (if you prefer to keep history, remove this)
@@ -136,7 +158,28 @@ class DeleteTrack(graphene.Mutation):
         return DeleteTrack(ok=True)
 
 
+class CancelTranscode(graphene.Mutation):
+    class Arguments:
+        track_id = graphene.UUID(required=True)
+
+    ok = graphene.Boolean()
+    canceled = graphene.Int()
+
+    @staticmethod
+    @transaction.atomic
+    @login_required
+    def mutate(self, info, track_id):
+        try:
+            track = Track.objects.get(id=track_id)
+        except Track.DoesNotExist:
+            return CancelTranscode(ok=False, canceled=0)
+        # A running ffmpeg stops at its next progress report
+        canceled = transcode_queue.cancel_jobs(track)
+        return CancelTranscode(ok=True, canceled=canceled)
+
+
 class MediasMutations(graphene.ObjectType):
     request_upload = RequestUpload.Field()
     finalize_upload = FinalizeUpload.Field()
     delete_track = DeleteTrack.Field()
+    cancel_transcode = CancelTranscode.Field()
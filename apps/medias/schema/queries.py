@@ -1,7 +1,9 @@
 import graphene
+from graphene.relay import PageInfo
 
-from apps.medias.models import Track
-from apps.medias.schema.types import TrackConnection
+from apps.medias.models import Track, TranscodeJob
+from apps.medias.schema.types import TrackConnection, TranscodeJobType
+from apps.medias.services import track_pages
 from apps.studio.services.helpers import get_studio
 
 
@@ -12,12 +14,54 @@ class MediasQuery(graphene.ObjectType):
         state=graphene.String(),
         search=graphene.String(),
     )
+    transcode_jobs = graphene.List(
+        graphene.NonNull(TranscodeJobType),
+        studio_slug=graphene.String(required=True),
+        track_id=graphene.UUID(),
+        active=graphene.Boolean(default_value=True),
+    )
 
     def resolve_tracks(self, info, studio_slug, state=None, search=None, **kwargs):
         studio = get_studio(studio_slug)
-        qs = Track.objects.filter(studio=studio).order_by("-created_at")
+        qs = Track.objects.filter(studio=studio)
         if state:
             qs = qs.filter(state=state)
         if search:
             qs = qs.filter(title__icontains=search)
-        return qs
+        # Keyset pages: cursors hold (created_at, id), see track_pages
+        rows, has_previous, has_next = track_pages.keyset_page(
+            qs,
+            first=kwargs.get("first"),
+            after=kwargs.get("after"),
+            last=kwargs.get("last"),
+            before=kwargs.get("before"),
+        )
+        edges = [
+            TrackConnection.Edge(
+                node=track, cursor=track_pages.encode_cursor(track.created_at, track.pk)
+            )
+            for track in rows
+        ]
+        connection = TrackConnection(
+            edges=edges,
+            page_info=PageInfo(
+                start_cursor=edges[0].cursor if edges else None,
+                end_cursor=edges[-1].cursor if edges else None,
+                has_previous_page=has_previous,
+                has_next_page=has_next,
+            ),
+        )
+        connection.iterable = qs
+        connection.count_key = track_pages.count_key(studio.pk, state, search)
+        return connection
+
+    def resolve_transcode_jobs(self, info, studio_slug, track_id=None, active=True):
+        studio = get_studio(studio_slug)
+        qs = TranscodeJob.objects.filter(studio=studio).order_by("-created_at")
+        if track_id:
+            qs = qs.filter(track_id=track_id)
+        if active:
+            qs = qs.filter(
+                status__in=[TranscodeJob.Status.QUEUED, TranscodeJob.Status.RUNNING]
+            )
+        return qs[:200]
@@ -1,7 +1,8 @@
 import graphene
 from graphene_django import DjangoObjectType
 
-from apps.medias.models import Track, UploadSession
+from apps.medias.models import Track, TranscodeJob, UploadSession
+from apps.medias.services import streaming, track_pages
 
 
 class TrackType(DjangoObjectType):
@@ -22,6 +23,13 @@ class TrackType(DjangoObjectType):
             "updated_at",
         )
 
+    stream_version = graphene.String(
+        description="Value of ?v= on the track URL, changed by every encode."
+    )
+
+    def resolve_stream_version(self, info):
+        return streaming.track_version(self)
+
 
 class UploadSessionType(DjangoObjectType):
     class Meta:
@@ -38,14 +46,33 @@ class UploadSessionType(DjangoObjectType):
         )
 
 
+class TranscodeJobType(DjangoObjectType):
+    class Meta:
+        model = TranscodeJob
+        fields = (
+            "id",
+            "track",
+            "status",
+            "attempt",
+            "progress_percent",
+            "speed",
+            "error_message",
+            "created_at",
+            "started_at",
+            "finished_at",
+        )
+
+
 class TrackConnection(graphene.relay.Connection):
     class Meta:
         node = TrackType
 
-    total_count = graphene.Int()
+    total_count = graphene.Int(
+        description="Tracks matching the filters, cached for TRACK_COUNT_CACHE_TTL seconds."
+    )
 
     def resolve_total_count(self, info, **kwargs):
         try:
-            return self.iterable.count()
+            return track_pages.cached_count(self.iterable, self.count_key)
         except Exception:
             return 0
@@ -0,0 +1,266 @@
+"""
+Single-decode analysis of uploaded audio.
+
+``analyze`` runs one ffmpeg process that decodes the input once and splits
+the stream in two:
+
+- ``ebur128=peak=true``: integrated loudness, gating threshold, loudness
+  range and true peak (EBU R128 / BS.1770, the measurements loudnorm's own
+  first pass makes), parsed from the summary printed on stderr. It is several
+  times cheaper than a ``loudnorm`` measurement pass, which resamples
+  everything to 192 kHz;
+- a mono, ``ANALYSIS_SAMPLE_RATE`` Hz, 16-bit stream piped to stdout and
+  reduced to min/max pairs of ``WAVEFORM_SAMPLES_PER_PIXEL`` samples while it
+  is read (the finest level of the waveform peaks file, see
+  apps.medias.services.waveform).
+
+``normalize_filter`` turns the measurements into the second pass used by the
+encode: one gain for the whole track (loudnorm's linear mode), which is far
+cheaper than the single-pass dynamic loudnorm and does not pump.
+
+Measurements are cached per source ``content_hash`` (LoudnessAnalysis), so a
+re-encode at another target or bitrate only runs the encode.
+"""
+
+import io
+import logging
+import math
+import re
+import subprocess
+import tempfile
+import threading
+from array import array
+from dataclasses import dataclass, field
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+from django.utils import timezone
+
+from apps.medias.models import LoudnessAnalysis
+
+logger = logging.getLogger(__name__)
+
+# Loudness target of the encode
+LOUDNORM_TARGET_I = -14.0
+LOUDNORM_TARGET_TP = -1.5
+LOUDNORM_TARGET_LRA = 11.0
+
+# The envelope stream only drives peak detection: a low rate keeps the pipe
+# and the Python loop small
+ANALYSIS_SAMPLE_RATE = 8000
+# 100 min/max pairs per second
+WAVEFORM_SAMPLES_PER_PIXEL = 80
+
+READ_BLOCK = 64 * 1024
+# Bytes of stderr read back after the decode: the ebur128 summary and an error
+# are printed last, per-frame lines before them can run to megabytes
+STDERR_TAIL = 64 * 1024
+
+_NUMBER = r"(-?(?:\d+(?:\.\d+)?|inf))"
+_SUMMARY_RE = re.compile(
+    rf"Summary:.*?I:\s*{_NUMBER}\s*LUFS\s*Threshold:\s*{_NUMBER}"
+    rf".*?LRA:\s*{_NUMBER}\s*LU.*?Peak:\s*{_NUMBER}",
+    re.S,
+)
+
+
+@dataclass(frozen=True)
+class LoudnessMeasurement:
+    input_i: float
+    input_tp: float
+    input_lra: float
+    input_thresh: float
+
+
+@dataclass
+class Analysis:
+    loudness: Optional[LoudnessMeasurement]
+    # Lowest and highest s16 sample of each samples_per_pixel slot
+    mins: array = field(default_factory=lambda: array("h"))
+    maxs: array = field(default_factory=lambda: array("h"))
+    sample_rate: int = ANALYSIS_SAMPLE_RATE
+    samples_per_pixel: int = WAVEFORM_SAMPLES_PER_PIXEL
+
+
+def parse_ebur128_summary(stderr: str) -> Optional[LoudnessMeasurement]:
+    """
+    Measurements of the last ebur128 summary printed on stderr.
+
+    Returns None when there is none or when it cannot drive loudnorm: digital
+    silence measures as -inf.
+    """
+    matches = _SUMMARY_RE.findall(stderr)
+    if not matches:
+        return None
+    integrated, threshold, lra, peak = (float(v) for v in matches[-1])
+    if any(math.isinf(v) for v in (integrated, threshold, lra, peak)):
+        return None
+    return LoudnessMeasurement(
+        input_i=integrated, input_tp=peak, input_lra=lra, input_thresh=threshold
+    )
+
+
+def cached_loudness(content_hash: str) -> Optional[LoudnessMeasurement]:
+    """Measurements cached for a source, or None."""
+    row = LoudnessAnalysis.objects.filter(content_hash=content_hash).first()
+    if row is None:
+        return None
+    return LoudnessMeasurement(
+        input_i=float(row.integrated_lufs),
+        input_tp=float(row.true_peak_dbtp),
+        input_lra=float(row.loudness_range_lu),
+        input_thresh=float(row.threshold_lufs),
+    )
+
+
+def cache_loudness(content_hash: str, measured: LoudnessMeasurement) -> None:
+    LoudnessAnalysis.objects.update_or_create(
+        content_hash=content_hash,
+        defaults={
+            "integrated_lufs": round(Decimal(measured.input_i), 2),
+            "true_peak_dbtp": round(Decimal(measured.input_tp), 2),
+            "loudness_range_lu": round(Decimal(measured.input_lra), 2),
+            "threshold_lufs": round(Decimal(measured.input_thresh), 2),
+            "updated_at": timezone.now(),
+        },
+    )
+
+
+def normalize_filter(
+    measured: Optional[LoudnessMeasurement],
+    target_i: float = LOUDNORM_TARGET_I,
+    target_tp: float = LOUDNORM_TARGET_TP,
+    target_lra: float = LOUDNORM_TARGET_LRA,
+) -> str:
+    """
+    Audio filter bringing a measured track to ``target_i``.
+
+    When the gain keeps the true peak under ``target_tp`` and the range is
+    within ``target_lra`` this is loudnorm's linear mode, applied as a plain
+    ``volume`` (loudnorm would also resample to 192 kHz and back). Otherwise
+    loudnorm would switch to dynamic mode; the same gain is applied and a
+    limiter holds the peaks at the ceiling instead, keeping the dynamics and
+    the cost of a linear pass. Unmeasured tracks get single-pass loudnorm.
+    """
+    if measured is None:
+        return f"loudnorm=I={target_i}:TP={target_tp}:LRA={target_lra}"
+    gain = target_i - measured.input_i
+    if measured.input_tp + gain <= target_tp and measured.input_lra <= target_lra:
+        return f"volume={gain:.2f}dB"
+    ceiling = 10 ** (target_tp / 20)
+    return f"volume={gain:.2f}dB,alimiter=limit={ceiling:.4f}:level=false"
+
+
+class MinMaxEnvelope:
+    """Min and max sample per slot of a little-endian s16 mono stream."""
+
+    def __init__(self, samples_per_pixel: int):
+        self.samples_per_pixel = samples_per_pixel
+        self.mins = array("h")
+        self.maxs = array("h")
+        self._pending = b""
+        self._low = 0
+        self._high = 0
+        self._filled = 0
+
+    def feed(self, data: bytes) -> None:
+        data = self._pending + data
+        usable = len(data) - len(data) % 2
+        self._pending = data[usable:]
+        samples = array("h", data[:usable])
+        position = 0
+        while position < len(samples):
+            take = min(self.samples_per_pixel - self._filled, len(samples) - position)
+            block = samples[position : position + take]
+            low, high = min(block), max(block)
+            if self._filled:
+                low, high = min(low, self._low), max(high, self._high)
+            self._low, self._high = low, high
+            self._filled += take
+            position += take
+            if self._filled == self.samples_per_pixel:
+                self._flush()
+
+    def _flush(self) -> None:
+        self.mins.append(self._low)
+        self.maxs.append(self._high)
+        self._filled = 0
+
+    def close(self) -> Tuple[array, array]:
+        if self._filled:
+            self._flush()
+        return self.mins, self.maxs
+
+
+def analyze(
+    ffmpeg: str,
+    in_path: Path,
+    preexec_fn: Optional[Callable[[], None]] = None,
+    timeout: Optional[float] = None,
+) -> Analysis:
+    """
+    Decode ``in_path`` once and return its loudness and min/max envelope.
+
+    Raises RuntimeError when ffmpeg fails or is killed after ``timeout``
+    seconds; ``loudness`` is None when the measurements cannot be used (e.g.
+    digital silence).
+    """
+    graph = (
+        f"[0:a:0]asplit=2[measure][envelope];"
+        f"[measure]ebur128=peak=true,anullsink;"
+        f"[envelope]aresample={ANALYSIS_SAMPLE_RATE},"
+        f"aformat=sample_fmts=s16:channel_layouts=mono[out]"
+    )
+    cmd = [
+        ffmpeg,
+        "-hide_banner",
+        "-nostats",
+        "-i",
+        str(in_path),
+        "-filter_complex",
+        graph,
+        "-map",
+        "[out]",
+        "-f",
+        "s16le",
+        "-",
+    ]
+    envelope = MinMaxEnvelope(WAVEFORM_SAMPLES_PER_PIXEL)
+    # stderr goes to a file: the summary is printed after stdout is drained
+    with tempfile.TemporaryFile() as stderr_file:
+        proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+            preexec_fn=preexec_fn,
+        )
+        timer = threading.Timer(timeout, proc.kill) if timeout else None
+        if timer is not None:
+            timer.start()
+        try:
+            while True:
+                block = proc.stdout.read(READ_BLOCK)
+                if not block:
+                    break
+                envelope.feed(block)
+            returncode = proc.wait()
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+        finally:
+            proc.stdout.close()
+            if timer is not None:
+                timer.cancel()
+        size = stderr_file.seek(0, io.SEEK_END)
+        stderr_file.seek(max(size - STDERR_TAIL, 0))
+        stderr = stderr_file.read().decode("utf-8", "replace")
+
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg analysis failed ({returncode}): {stderr[-2000:]}")
+    loudness = parse_ebur128_summary(stderr)
+    if loudness is None:
+        logger.warning("No usable loudness measurements for %s", in_path)
+    mins, maxs = envelope.close()
+    return Analysis(loudness=loudness, mins=mins, maxs=maxs)
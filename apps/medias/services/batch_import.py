@@ -0,0 +1,360 @@
+"""
+Import a directory tree of audio files into a studio (``import_directory``).
+
+Files go through the pipeline in batches of ``batch_size``:
+
+1. hash: SHA-256 of each file, ``hash_workers`` files at a time;
+2. dedupe: one query for the batch against ``Track.content_hash`` of the
+   studio (soft-deleted tracks included: the hash is unique per studio), and
+   against files seen earlier in the same run;
+3. probe: ``ffprobe_json`` of the new files, ``probe_workers`` at a time;
+   files without an audio stream are rejected. Each accepted file is
+   hard-linked (copied across filesystems or with ``copy``) to
+   ``incoming/<upload id>.part``, as if it had been uploaded;
+4. record: finalized UploadSession and PENDING Track rows are bulk-created
+   and their TranscodeJob rows queued in one transaction.
+
+Progress is appended to a JSONL state file once a batch is committed: a file
+already recorded with the same size and mtime is skipped without being read
+again, so an interrupted import resumes where it stopped. A batch committed
+but not recorded is found again by its hashes and counted as duplicates.
+"""
+
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Set, TextIO
+
+from django.conf import settings
+from django.db import transaction
+
+from apps.medias.models import Track, UploadSession
+from apps.medias.services.paths import relpath_from_root, studio_paths
+from apps.medias.tasks import (
+    extract_tags_from_probe,
+    ffprobe_json,
+    resolve_bin,
+    schedule_transcodes,
+)
+from apps.studio.models import Studio
+
+AUDIO_EXTENSIONS = (
+    ".aac",
+    ".aif",
+    ".aiff",
+    ".flac",
+    ".m4a",
+    ".mp3",
+    ".ogg",
+    ".opus",
+    ".wav",
+    ".wma",
+)
+READ_BLOCK = 1024 * 1024
+# Seconds one file may be probed before it is rejected (a stalled network
+# mount or a pathological file must not hang a probe worker)
+PROBE_TIMEOUT = 120
+
+
+@dataclass
+class SourceFile:
+    path: Path
+    # Relative to the imported directory, the key of the state file
+    rel: str
+    size: int
+    mtime_ns: int
+    sha256: str = ""
+    probe: Dict = field(default_factory=dict)
+    error: str = ""
+
+
+@dataclass
+class ImportStats:
+    scanned: int = 0
+    resumed: int = 0
+    hashed: int = 0
+    hashed_bytes: int = 0
+    hash_seconds: float = 0.0
+    duplicates: int = 0
+    rejected: int = 0
+    imported: int = 0
+    imported_bytes: int = 0
+    seconds: float = 0.0
+
+    def as_dict(self) -> Dict:
+        data = dict(self.__dict__)
+        elapsed = self.seconds or 1e-9
+        hashing = self.hash_seconds or 1e-9
+        data["files_per_second"] = round(self.scanned / elapsed, 1)
+        data["hash_mb_per_second"] = round(self.hashed_bytes / hashing / 1e6, 1)
+        data["hash_seconds"] = round(self.hash_seconds, 2)
+        data["seconds"] = round(self.seconds, 2)
+        return data
+
+
+def scan(root: Path, extensions=AUDIO_EXTENSIONS) -> Iterator[SourceFile]:
+    """Regular files under ``root`` with one of ``extensions``, sorted by path."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if not name.lower().endswith(tuple(extensions)):
+                continue
+            path = Path(dirpath) / name
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            if not path.is_file():
+                continue
+            yield SourceFile(
+                path=path,
+                rel=str(path.relative_to(root)),
+                size=st.st_size,
+                mtime_ns=st.st_mtime_ns,
+            )
+
+
+def sha256_file(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(READ_BLOCK):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def default_state_path(studio: Studio, root: Path) -> Path:
+    key = hashlib.sha1(str(root.resolve()).encode()).hexdigest()[:16]
+    return Path(settings.RADIO_STUDIOS_ROOT) / studio.slug / "imports" / f"{key}.jsonl"
+
+
+class ImportState:
+    """Append-only record of the files an import is done with."""
+
+    def __init__(self, path: Optional[Path]):
+        self.path = path
+        self.done: Dict[str, Dict] = {}
+        self._file: Optional[TextIO] = None
+        if path is not None and path.exists():
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn last line of an interrupted run
+                        continue
+                    self.done[entry["path"]] = entry
+
+    def is_done(self, source: SourceFile) -> bool:
+        entry = self.done.get(source.rel)
+        return (
+            entry is not None
+            and entry.get("size") == source.size
+            and entry.get("mtime_ns") == source.mtime_ns
+        )
+
+    def record(self, entries: List[Dict]) -> None:
+        if self.path is None or not entries:
+            return
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        for entry in entries:
+            self._file.write(json.dumps(entry, sort_keys=True) + "\n")
+            self.done[entry["path"]] = entry
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _entry(source: SourceFile, status: str, **extra) -> Dict:
+    return {
+        "path": source.rel,
+        "size": source.size,
+        "mtime_ns": source.mtime_ns,
+        "sha256": source.sha256,
+        "status": status,
+        **extra,
+    }
+
+
+def _hash(source: SourceFile) -> SourceFile:
+    try:
+        source.sha256 = sha256_file(source.path)
+    except OSError as e:
+        source.error = f"Unreadable: {e}"
+    return source
+
+
+def _probe(ffprobe: str, source: SourceFile) -> SourceFile:
+    try:
+        source.probe = ffprobe_json(ffprobe, source.path, timeout=PROBE_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        source.error = f"ffprobe timed out after {PROBE_TIMEOUT}s"
+        return source
+    except (subprocess.CalledProcessError, ValueError) as e:
+        source.error = f"ffprobe failed: {getattr(e, 'stderr', '') or e}".strip()[:500]
+        return source
+    streams = source.probe.get("streams", [])
+    if not any(s.get("codec_type") == "audio" for s in streams):
+        source.error = "No audio stream"
+    return source
+
+
+def _place(source: SourceFile, dest: Path, copy: bool) -> None:
+    """Put ``source`` at ``dest``, hard-linked unless ``copy`` or impossible."""
+    if not copy:
+        try:
+            os.link(source.path, dest)
+            return
+        except OSError:
+            pass
+    shutil.copyfile(source.path, dest)
+
+
+def _build_rows(studio: Studio, source: SourceFile, incoming: Path):
+    duration, tags = extract_tags_from_probe(source.probe)
+    upload = UploadSession(
+        studio=studio,
+        original_filename=source.path.name[:255],
+        size_bytes=source.size,
+        mime_type=(mimetypes.guess_type(source.path.name)[0] or "")[:64],
+        source=UploadSession.Source.IMPORT,
+        finalized=True,
+        bytes_received=source.size,
+        received_ranges=[[0, source.size]],
+        sha256=source.sha256,
+    )
+    upload.temp_rel_path = relpath_from_root(incoming / f"{upload.id}.part")
+    # Other tags are filled by process_track, like for uploads
+    track = Track(
+        studio=studio,
+        title=(tags.get("title") or tags.get("tit2") or source.path.stem)[:255],
+        state=Track.State.PENDING,
+        content_hash=source.sha256,
+        upload_session=upload,
+        duration_seconds=round(Decimal(duration), 2) if duration else None,
+    )
+    return upload, track
+
+
+def import_directory(
+    studio: Studio,
+    root: Path,
+    *,
+    hash_workers: int = 4,
+    probe_workers: int = 4,
+    batch_size: int = 200,
+    extensions=AUDIO_EXTENSIONS,
+    copy: bool = False,
+    dry_run: bool = False,
+    state_path: Optional[Path] = None,
+    on_batch: Optional[Callable[[ImportStats], None]] = None,
+) -> ImportStats:
+    """
+    Import the audio files under ``root`` into ``studio`` (see module
+    docstring). Nothing is written with ``dry_run``; ``on_batch`` is called
+    with the running stats after each batch.
+    """
+    ffprobe = resolve_bin("ffprobe", getattr(settings, "FFPROBE_PATH", None))
+    incoming = studio_paths(studio).incoming
+    state = ImportState(None if dry_run else state_path)
+    stats = ImportStats()
+    seen: Set[str] = set()
+    started = time.monotonic()
+
+    def run_batch(batch: List[SourceFile], hasher, prober) -> None:
+        entries: List[Dict] = []
+        hash_started = time.monotonic()
+        hashed = list(hasher.map(_hash, batch))
+        stats.hash_seconds += time.monotonic() - hash_started
+        candidates = []
+        for source in hashed:
+            if source.error:
+                stats.rejected += 1
+                entries.append(_entry(source, "rejected", error=source.error))
+                continue
+            stats.hashed += 1
+            stats.hashed_bytes += source.size
+            candidates.append(source)
+
+        existing = set(
+            Track.all_objects.filter(
+                studio=studio,
+                content_hash__in={s.sha256 for s in candidates},
+            ).values_list("content_hash", flat=True)
+        )
+        new = []
+        for source in candidates:
+            if source.sha256 in existing or source.sha256 in seen:
+                stats.duplicates += 1
+                entries.append(_entry(source, "duplicate"))
+                continue
+            seen.add(source.sha256)
+            new.append(source)
+
+        accepted = []
+        for source in prober.map(lambda s: _probe(ffprobe, s), new):
+            if source.error:
+                stats.rejected += 1
+                entries.append(_entry(source, "rejected", error=source.error))
+            else:
+                accepted.append(source)
+
+        if not dry_run and accepted:
+            rows = [_build_rows(studio, s, incoming) for s in accepted]
+            placed: List[Path] = []
+            try:
+                for source, (upload, _track) in zip(accepted, rows):
+                    dest = Path(settings.RADIO_STUDIOS_ROOT) / upload.temp_rel_path
+                    _place(source, dest, copy)
+                    placed.append(dest)
+                with transaction.atomic():
+                    UploadSession.objects.bulk_create([u for u, _t in rows])
+                    tracks = Track.objects.bulk_create([t for _u, t in rows])
+                    schedule_transcodes(tracks)
+            except BaseException:
+                for dest in placed:
+                    dest.unlink(missing_ok=True)
+                raise
+            for source, (_upload, track) in zip(accepted, rows):
+                entries.append(_entry(source, "imported", track_id=str(track.id)))
+        for source in accepted:
+            stats.imported += 1
+            stats.imported_bytes += source.size
+        state.record(entries)
+        stats.seconds = time.monotonic() - started
+        if on_batch is not None:
+            on_batch(stats)
+
+    try:
+        with ThreadPoolExecutor(hash_workers) as hasher, ThreadPoolExecutor(
+            probe_workers
+        ) as prober:
+            batch: List[SourceFile] = []
+            for source in scan(root, extensions):
+                stats.scanned += 1
+                if state.is_done(source):
+                    stats.resumed += 1
+                    continue
+                batch.append(source)
+                if len(batch) >= batch_size:
+                    run_batch(batch, hasher, prober)
+                    batch = []
+            if batch:
+                run_batch(batch, hasher, prober)
+    finally:
+        state.close()
+    stats.seconds = time.monotonic() - started
+    return stats
@@ -5,7 +5,7 @@ from typing import Optional
 
 from django.conf import settings
 
-from apps.medias.models import Track
+from apps.medias.models import Track, TrackAsset
 from apps.medias.services.paths import studio_paths
 
 
@@ -18,18 +18,39 @@ def _safe_unlink(p: Optional[Path]) -> None:
         pass
 
 
+def _delete_assets(track: Track, asset_type: str) -> None:
+    """Unlink the files of ``track``'s ``asset_type`` assets, then drop the rows."""
+    base = Path(settings.RADIO_STUDIOS_ROOT)
+    assets = TrackAsset.objects.filter(track=track, asset_type=asset_type)
+    for storage_key in assets.values_list("storage_key", flat=True):
+        _safe_unlink(base / storage_key)
+    assets.hard_delete()
+
+
 def delete_track_files(track: Track) -> None:
     """
     Remove any files associated with this track from local disk:
     - processed file in library (processed_rel_path)
     - incoming partial upload (.part)
     - processing artifact (processing/{track.id}.mp3)
+    - kept original (RAW_ORIGINAL asset, originals/{track.id}.src)
+    - other renditions (ALT_ENCODING assets, library/<codec>/<kbps>/) and
+      waveform peaks (waveform/{track.id}.peaks), unless a live duplicate of
+      the track still serves them
     """
     base = Path(settings.RADIO_STUDIOS_ROOT)
 
-    # Processed file
-    if track.processed_rel_path:
-        _safe_unlink(base / track.processed_rel_path)
+    # Processed file (relative to the studio directory), unless a duplicate
+    # upload or the track it duplicates still plays it
+    shared = (
+        Track.objects.filter(
+            studio_id=track.studio_id, processed_rel_path=track.processed_rel_path
+        )
+        .exclude(pk=track.pk)
+        .exists()
+    )
+    if track.processed_rel_path and not shared:
+        _safe_unlink(base / track.studio.slug / track.processed_rel_path)
 
     # Incoming temp (.part)
     up = getattr(track, "upload_session", None)
@@ -42,3 +63,12 @@ def delete_track_files(track: Track) -> None:
     )
     paths = studio_paths(track.studio, target_kbps)
     _safe_unlink(paths.processing / f"{track.id}.mp3")
+
+    # Source kept for re-encoding (KEEP_ORIGINALS)
+    _delete_assets(track, TrackAsset.AssetType.RAW_ORIGINAL)
+
+    # Duplicates are served the renditions and waveform of the track they
+    # duplicate
+    if not Track.objects.filter(is_duplicate_of=track).exists():
+        _delete_assets(track, TrackAsset.AssetType.ALT_ENCODING)
+        _delete_assets(track, TrackAsset.AssetType.WAVEFORM_PEAKS)
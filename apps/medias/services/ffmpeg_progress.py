@@ -0,0 +1,144 @@
+"""
+Run ffmpeg with machine-readable progress, cancellation and a bounded stderr.
+
+``run`` adds ``-progress pipe:1`` and reads the ``key=value`` blocks ffmpeg
+writes to stdout (about every half second) as they come. Every ``interval``
+seconds, and at the end, the latest position and speed go to
+``on_progress``; when it returns False ffmpeg is stopped with SIGTERM (it
+closes its outputs) and ``TranscodeCanceled`` is raised.
+
+stderr is drained by a thread into a ring of the last ``STDERR_TAIL_LINES``
+lines, so a long run never holds its whole log in memory.
+"""
+
+import subprocess
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+STDERR_TAIL_LINES = 50
+STDERR_LINE_MAX = 512
+# Seconds given to ffmpeg to exit after SIGTERM before it is killed
+TERMINATE_GRACE = 10
+
+
+class TranscodeCanceled(Exception): ...
+
+
+@dataclass(frozen=True)
+class Progress:
+    # Position reached in the output, seconds
+    out_seconds: float
+    # Multiple of real time, None until ffmpeg reports it
+    speed: Optional[float]
+    done: bool
+
+    @classmethod
+    def from_block(cls, block: Dict[str, str]) -> "Progress":
+        # out_time_ms is in microseconds as well (historical name)
+        raw = block.get("out_time_us") or block.get("out_time_ms") or ""
+        try:
+            out_seconds = max(int(raw), 0) / 1_000_000
+        except ValueError:
+            out_seconds = 0.0
+        try:
+            speed = float(block.get("speed", "").rstrip("x"))
+        except ValueError:
+            speed = None
+        return cls(out_seconds, speed, block.get("progress") == "end")
+
+    def percent(self, duration: float) -> Optional[float]:
+        if self.done:
+            return 100.0
+        if duration <= 0:
+            return None
+        return min(self.out_seconds * 100 / duration, 100.0)
+
+
+@dataclass(frozen=True)
+class FfmpegResult:
+    returncode: int
+    stderr_tail: str
+
+
+def _drain(stream, tail: deque) -> None:
+    for line in stream:
+        tail.append(line[:STDERR_LINE_MAX].decode("utf-8", "replace").rstrip())
+    stream.close()
+
+
+def run(
+    cmd: List[str],
+    on_progress: Callable[[Progress], bool],
+    interval: float,
+    preexec_fn: Optional[Callable[[], None]] = None,
+    timeout: Optional[float] = None,
+) -> FfmpegResult:
+    """
+    Run ffmpeg ``cmd`` (binary first), reporting progress to ``on_progress``.
+
+    Raises TranscodeCanceled when ``on_progress`` returned False and
+    subprocess.TimeoutExpired when the run took longer than ``timeout``.
+    """
+    cmd = [cmd[0], "-nostdin", "-nostats", "-progress", "pipe:1", *cmd[1:]]
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        preexec_fn=preexec_fn,
+    )
+    tail: deque = deque(maxlen=STDERR_TAIL_LINES)
+    reader = threading.Thread(target=_drain, args=(proc.stderr, tail), daemon=True)
+    reader.start()
+    timed_out = threading.Event()
+
+    def expire():
+        timed_out.set()
+        proc.kill()
+
+    timer = threading.Timer(timeout, expire) if timeout else None
+    if timer is not None:
+        timer.start()
+    canceled = False
+    try:
+        block: Dict[str, str] = {}
+        reported = time.monotonic()
+        for raw in proc.stdout:
+            key, _sep, value = raw.decode("utf-8", "replace").strip().partition("=")
+            block[key] = value
+            if key != "progress":
+                continue
+            progress = Progress.from_block(block)
+            block = {}
+            now = time.monotonic()
+            if not progress.done and now - reported < interval:
+                continue
+            reported = now
+            if not on_progress(progress):
+                canceled = True
+                proc.terminate()
+                break
+        proc.stdout.close()
+        try:
+            returncode = proc.wait(timeout=TERMINATE_GRACE if canceled else None)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            returncode = proc.wait()
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        proc.stdout.close()
+        if timer is not None:
+            timer.cancel()
+        reader.join(timeout=TERMINATE_GRACE)
+
+    if canceled:
+        raise TranscodeCanceled()
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout, stderr="\n".join(tail))
+    return FfmpegResult(returncode, "\n".join(tail))
@@ -0,0 +1,139 @@
+"""
+Running SHA-256 of chunked uploads.
+
+``hashlib`` objects cannot be serialized, so the durable hash state of an
+upload is its ``.part`` file: every process keeps one running hasher per
+upload (bounded LRU, ``UPLOAD_HASHERS_MAX``), shared by the threads writing
+its chunks, along with the number of bytes it has consumed. Chunks are fed
+to the hasher as they are written; a chunk landing past the hashed prefix
+(parallel or out-of-order PUTs) is held in memory until the prefix reaches
+it, within ``HOLD_MAX_BYTES`` per process. A process that missed bytes
+(earlier chunks went to another worker, held chunks over the budget, the
+worker restarted, the client resumed later) catches up by reading only the
+missing span from disk, so each byte is read back at most once per process.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+from django.conf import settings
+
+READ_BLOCK = 1024 * 1024
+# Bytes of out-of-order chunks held in memory by all hashers of a process
+HOLD_MAX_BYTES = 64 * 1024 * 1024
+
+_lock = threading.Lock()
+_running: "OrderedDict[str, RunningHash]" = OrderedDict()
+_held_bytes = [0]
+
+
+def _reserve(size: int) -> bool:
+    with _lock:
+        if _held_bytes[0] + size > HOLD_MAX_BYTES:
+            return False
+        _held_bytes[0] += size
+        return True
+
+
+def _release(size: int) -> None:
+    with _lock:
+        _held_bytes[0] -= size
+
+
+class RunningHash:
+    """Hash of the prefix of one upload; every method takes ``lock``."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.offset = 0
+        self.hasher = hashlib.sha256()
+        # offset -> bytes written there, past the hashed prefix
+        self.held: Dict[int, bytes] = {}
+
+    def _update(self, offset: int, data) -> None:
+        skip = self.offset - offset
+        if 0 <= skip < len(data):
+            self.hasher.update(memoryview(data)[skip:])
+            self.offset += len(data) - skip
+
+    def _drain(self) -> None:
+        """Hash held chunks the prefix has reached, drop the ones it passed."""
+        for offset in sorted(self.held):
+            if offset > self.offset:
+                break
+            data = self.held.pop(offset)
+            self._update(offset, data)
+            _release(len(data))
+
+    def feed(self, offset: int, data) -> None:
+        """
+        Hash ``data`` written at ``offset`` if it extends the hashed prefix,
+        otherwise hold a copy of it until the prefix gets there.
+        """
+        with self.lock:
+            if offset > self.offset:
+                if offset not in self.held and _reserve(len(data)):
+                    self.held[offset] = bytes(data)
+                return
+            self._update(offset, data)
+            self._drain()
+
+    def catch_up(self, path: Path, upto: int) -> None:
+        """Hash bytes ``[offset, upto)`` of ``path`` not held in memory."""
+        with self.lock:
+            self._drain()
+            if self.offset >= upto:
+                return
+            with open(path, "rb") as f:
+                f.seek(self.offset)
+                while self.offset < upto:
+                    block = f.read(min(READ_BLOCK, upto - self.offset))
+                    if not block:
+                        break
+                    self.hasher.update(block)
+                    self.offset += len(block)
+                    self._drain()
+
+    def release(self) -> None:
+        with self.lock:
+            _release(sum(len(data) for data in self.held.values()))
+            self.held.clear()
+
+
+def running_hash(upload_id) -> RunningHash:
+    """The running hash of an upload in this process (started if needed)."""
+    key = str(upload_id)
+    max_entries = getattr(settings, "UPLOAD_HASHERS_MAX", 64)
+    evicted = []
+    with _lock:
+        running = _running.get(key)
+        if running is None:
+            running = _running[key] = RunningHash()
+        _running.move_to_end(key)
+        while len(_running) > max_entries:
+            evicted.append(_running.popitem(last=False)[1])
+    for old in evicted:
+        old.release()
+    return running
+
+
+def discard(upload_id) -> None:
+    with _lock:
+        running = _running.pop(str(upload_id), None)
+    if running is not None:
+        running.release()
+
+
+def upload_digest(upload_id, path: Path, size: int) -> Optional[str]:
+    """Hex SHA-256 of the first ``size`` bytes of ``path`` (None if short)."""
+    running = running_hash(upload_id)
+    running.catch_up(path, size)
+    with running.lock:
+        if running.offset != size:
+            return None
+        digest = running.hasher.hexdigest()
+    discard(upload_id)
+    return digest
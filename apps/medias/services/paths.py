@@ -15,6 +15,7 @@ class StudioPaths:
     library_mp3: Path
     waveform: Path
     artwork: Path
+    originals: Path
 
 
 def studio_paths(studio: Studio, bitrate_kbps: int | None = None) -> StudioPaths:
@@ -25,9 +26,12 @@ def studio_paths(studio: Studio, bitrate_kbps: int | None = None) -> StudioPaths
     library_mp3 = root / 'library' / 'mp3' / kbks
     waveform = root / 'waveform'
     artwork = root / 'artwork'
-    for p in (incoming, processing, library_mp3, waveform, artwork):
+    originals = root / 'originals'
+    for p in (incoming, processing, library_mp3, waveform, artwork, originals):
         p.mkdir(parents=True, exist_ok=True)
-    return StudioPaths(root, incoming, processing, library_mp3, waveform, artwork)
+    return StudioPaths(
+        root, incoming, processing, library_mp3, waveform, artwork, originals
+    )
 
 
 def relpath_from_root(p: Path) -> str:
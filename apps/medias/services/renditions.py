@@ -0,0 +1,261 @@
+"""
+Rendition ladder: the encodings published for every track of a studio.
+
+The primary rendition is the MP3 at ``Studio.default_bitrate_kbps``
+(``Track.processed_rel_path``, read by the automation player). A studio adds
+more with ``Studio.rendition_ladder``, e.g. ``"mp3:64,aac:96,opus:48"``; each
+is stored under ``library/<codec>/<kbps>/`` and recorded as an ALT_ENCODING
+TrackAsset.
+
+All renditions come out of one ffmpeg run: the source is decoded and
+normalized once and ``asplit`` feeds one encoder per rendition
+(``encode_args``).
+
+``serve_track`` picks a rendition with ``choose``: ``?codec=`` and/or
+``?kbps=`` (highest bitrate not above it), else the codec the ``Accept``
+header prefers over MP3, else the primary.
+"""
+
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from django.core.exceptions import ValidationError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Codec:
+    encoder: str
+    extension: str
+    mime_type: str
+    # Accepted sample rates, the first one is the fallback
+    sample_rates: Tuple[int, ...]
+    extra_args: Tuple[str, ...] = ()
+
+
+CODECS: Dict[str, Codec] = {
+    "mp3": Codec(
+        "libmp3lame",
+        "mp3",
+        "audio/mpeg",
+        (44100, 8000, 11025, 12000, 16000, 22050, 24000, 32000, 48000),
+    ),
+    "aac": Codec(
+        "aac",
+        "m4a",
+        "audio/mp4",
+        (44100, 8000, 11025, 12000, 16000, 22050, 24000, 32000, 48000),
+        # moov first: players can start before the whole file is fetched
+        ("-movflags", "+faststart"),
+    ),
+    "opus": Codec("libopus", "opus", "audio/ogg", (48000,)),
+}
+PRIMARY_CODEC = "mp3"
+
+# Accept media types answered by each codec besides its own MIME type
+ACCEPT_ALIASES = {
+    "audio/mp3": "mp3",
+    "audio/aac": "aac",
+    "audio/x-m4a": "aac",
+    "audio/opus": "opus",
+}
+
+
+@dataclass(frozen=True)
+class Rendition:
+    codec: str
+    bitrate_kbps: int
+
+    @property
+    def spec(self) -> str:
+        return f"{self.codec}:{self.bitrate_kbps}"
+
+    @property
+    def mime_type(self) -> str:
+        return CODECS[self.codec].mime_type
+
+    def file_name(self, track_id) -> str:
+        return f"{track_id}.{CODECS[self.codec].extension}"
+
+
+def parse_ladder(value: str) -> List[Rendition]:
+    """
+    Renditions of a ``"codec:kbps,..."`` string, in order, without repeats.
+
+    Raises ValueError on an unknown codec or a bad bitrate.
+    """
+    ladder: List[Rendition] = []
+    for item in (value or "").split(","):
+        item = item.strip().lower()
+        if not item:
+            continue
+        codec, _sep, kbps = item.partition(":")
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec in rendition ladder: {codec!r}")
+        if not kbps.isdigit() or not 6 <= int(kbps) <= 512:
+            raise ValueError(f"Bad bitrate in rendition ladder: {item!r}")
+        rendition = Rendition(codec, int(kbps))
+        if rendition not in ladder:
+            ladder.append(rendition)
+    return ladder
+
+
+def validate_ladder(value: str) -> None:
+    """Model field validator of ``Studio.rendition_ladder``."""
+    try:
+        parse_ladder(value)
+    except ValueError as e:
+        raise ValidationError(str(e))
+
+
+def extra_renditions(studio, primary_kbps: int) -> List[Rendition]:
+    """The studio's ladder without the primary MP3 (empty when invalid)."""
+    try:
+        ladder = parse_ladder(studio.rendition_ladder)
+    except ValueError as e:
+        logger.warning("Ignoring rendition ladder of %s: %s", studio.slug, e)
+        return []
+    primary = Rendition(PRIMARY_CODEC, primary_kbps)
+    return [r for r in ladder if r != primary]
+
+
+def rendition_dir(studio_root: Path, rendition: Rendition) -> Path:
+    return studio_root / "library" / rendition.codec / str(rendition.bitrate_kbps)
+
+
+def source_sample_rate(probe: Dict) -> Optional[int]:
+    for stream in probe.get("streams", []):
+        if stream.get("codec_type") == "audio":
+            try:
+                return int(stream.get("sample_rate") or 0) or None
+            except ValueError:
+                return None
+    return None
+
+
+def sample_rate(codec: str, probe: Dict) -> int:
+    """The source rate when ``codec`` supports it, else the codec's fallback."""
+    rates = CODECS[codec].sample_rates
+    rate = source_sample_rate(probe)
+    return rate if rate in rates else rates[0]
+
+
+def _output_args(rendition: Rendition, probe: Dict, out_path: Path) -> List[str]:
+    codec = CODECS[rendition.codec]
+    return [
+        # Single-pass loudnorm outputs 192 kHz; keep the source rate
+        "-ar",
+        str(sample_rate(rendition.codec, probe)),
+        "-map_metadata",
+        "0",
+        "-c:a",
+        codec.encoder,
+        "-b:a",
+        f"{rendition.bitrate_kbps}k",
+        *codec.extra_args,
+        str(out_path),
+    ]
+
+
+def encode_args(
+    outputs: Sequence[Tuple[Rendition, Path]],
+    audio_filter: Optional[str],
+    probe: Dict,
+) -> List[str]:
+    """
+    ffmpeg arguments (after the input) writing every ``(rendition, path)``.
+
+    One output keeps the plain ``-af`` form; several share one filter graph
+    whose normalized output is split to one encoder each.
+    """
+    if len(outputs) == 1:
+        rendition, out_path = outputs[0]
+        filter_args = ["-af", audio_filter] if audio_filter else []
+        return filter_args + _output_args(rendition, probe, out_path)
+
+    chain = f"{audio_filter}," if audio_filter else ""
+    labels = "".join(f"[r{i}]" for i in range(len(outputs)))
+    args = ["-filter_complex", f"[0:a:0]{chain}asplit={len(outputs)}{labels}"]
+    for i, (rendition, out_path) in enumerate(outputs):
+        args += ["-map", f"[r{i}]", *_output_args(rendition, probe, out_path)]
+    return args
+
+
+def asset_rendition(mime_type: str, bitrate_kbps: Optional[int]) -> Optional[Rendition]:
+    """Rendition of an ALT_ENCODING asset (None for unknown types)."""
+    for name, codec in CODECS.items():
+        if codec.mime_type == mime_type and bitrate_kbps:
+            return Rendition(name, bitrate_kbps)
+    return None
+
+
+def _accept_quality(accept: str) -> Dict[str, float]:
+    """``{media type: q}`` of an Accept header (parameters other than q ignored)."""
+    qualities: Dict[str, float] = {}
+    for part in accept.split(","):
+        media_type, *params = (p.strip() for p in part.split(";"))
+        if not media_type:
+            continue
+        q = 1.0
+        for param in params:
+            name, _sep, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        media_type = media_type.lower()
+        qualities[media_type] = max(q, qualities.get(media_type, 0.0))
+    return qualities
+
+
+def preferred_codec(accept: str) -> Optional[str]:
+    """
+    The codec ``accept`` ranks strictly above MP3 by an explicit media type,
+    or None (wildcards alone never move a client off the primary).
+    """
+    if not accept:
+        return None
+    qualities = _accept_quality(accept)
+
+    def explicit(codec: str) -> float:
+        types = [CODECS[codec].mime_type] + [
+            t for t, c in ACCEPT_ALIASES.items() if c == codec
+        ]
+        return max((qualities.get(t, 0.0) for t in types), default=0.0)
+
+    best, best_q = None, max(
+        explicit(PRIMARY_CODEC),
+        qualities.get("audio/*", 0.0),
+        qualities.get("*/*", 0.0),
+    )
+    for codec in CODECS:
+        if codec == PRIMARY_CODEC:
+            continue
+        q = explicit(codec)
+        if q > best_q:
+            best, best_q = codec, q
+    return best
+
+
+def choose(
+    available: Sequence[Tuple[Rendition, str]],
+    codec: Optional[str] = None,
+    kbps: Optional[int] = None,
+) -> Optional[Tuple[Rendition, str]]:
+    """
+    Pick from ``available`` ``(rendition, path)`` pairs: the highest bitrate
+    not above ``kbps`` (the lowest when all are above), of ``codec`` when
+    given. Returns None when ``codec`` has no rendition.
+    """
+    candidates = [a for a in available if codec is None or a[0].codec == codec]
+    if not candidates:
+        return None
+    candidates.sort(key=lambda a: a[0].bitrate_kbps)
+    if kbps is None:
+        return candidates[-1]
+    fitting = [a for a in candidates if a[0].bitrate_kbps <= kbps]
+    return fitting[-1] if fitting else candidates[0]
@@ -0,0 +1,263 @@
+"""
+HTTP delivery of processed audio files.
+
+``file_response`` answers a GET for a file on disk with single-range support
+(``206 Partial Content``, ``If-Range``, ``416`` for unsatisfiable ranges).
+Multi-range requests are answered with the whole file, which RFC 9110 allows.
+
+Two delivery modes (``TRACK_SERVE_MODE``):
+
+- ``file``: the response wraps the open file. Under gunicorn the body goes
+  through ``wsgi.file_wrapper``, i.e. ``os.sendfile`` from the range offset,
+  so the bytes are never copied through Python; other servers read it in
+  blocks, bounded to the requested range.
+- ``accel``: the response is empty and carries ``X-Accel-Redirect`` so nginx
+  streams the file (and handles ranges) itself. Requires an ``internal``
+  location mapping ``TRACK_ACCEL_REDIRECT_PREFIX`` to ``RADIO_STUDIOS_ROOT``.
+
+Track validators: the ETag is derived from the source ``content_hash``, the
+rendition (codec and bitrate) and the loudness target, i.e. it changes when the track is
+re-encoded; Last-Modified from ``Track.updated_at``. Re-encoding replaces
+the file behind the same path, so only versioned URLs are cached for good:
+a READY track requested with ``?v=<track_version>`` (``streamVersion`` in the
+API) is sent ``immutable`` for ``TRACK_CACHE_MAX_AGE``, and a new encode
+changes the version, hence the URL. Without (or with a stale) ``v`` it is
+cached for ``TRACK_CACHE_UNVERSIONED_MAX_AGE`` and then revalidated.
+"""
+
+import hashlib
+import os
+import re
+from pathlib import Path
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+
+from apps.medias.models import Track, TrackAsset
+from apps.medias.services import renditions
+from apps.medias.services.renditions import Rendition
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# Columns serve_track needs; the rest of the Track row is not loaded
+TRACK_SERVE_FIELDS = (
+    "id",
+    "is_duplicate_of_id",
+    "title",
+    "state",
+    "bitrate_kbps",
+    "content_hash",
+    "normalized_lufs",
+    "processed_rel_path",
+    "updated_at",
+)
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class FileRange:
+    """
+    Read-only view of ``length`` bytes of ``fileobj`` starting at ``start``.
+
+    Exposes ``fileno()`` so a WSGI ``file_wrapper`` can ``sendfile`` it: the
+    OS file offset is left at ``start`` and the server sends
+    ``Content-Length`` bytes from there.
+    """
+
+    def __init__(self, fileobj, start: int, length: int):
+        self.fileobj = fileobj
+        self.remaining = length
+        fileobj.seek(start)
+
+    def read(self, size: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.fileobj.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self) -> int:
+        return self.fileobj.fileno()
+
+    def close(self) -> None:
+        self.fileobj.close()
+
+
+def track_renditions(track: Track) -> List[Tuple[Rendition, Optional[Path]]]:
+    """
+    The primary MP3 (path None: ``processed_rel_path``) and the ALT_ENCODING
+    renditions of a track. A duplicate shares the renditions of the track it
+    duplicates, which owns the assets.
+    """
+    root = Path(settings.RADIO_STUDIOS_ROOT)
+    available = [(Rendition(renditions.PRIMARY_CODEC, track.bitrate_kbps or 0), None)]
+    assets = TrackAsset.objects.filter(
+        track_id=track.is_duplicate_of_id or track.pk,
+        asset_type=TrackAsset.AssetType.ALT_ENCODING,
+    )
+    for mime_type, bitrate_kbps, storage_key in assets.values_list(
+        "mime_type", "bitrate_kbps", "storage_key"
+    ):
+        rendition = renditions.asset_rendition(mime_type, bitrate_kbps)
+        if rendition is not None:
+            available.append((rendition, root / storage_key))
+    return available
+
+
+def track_validators(
+    track: Track, rendition: Optional[Rendition] = None
+) -> Tuple[str, Optional[int]]:
+    """
+    ``(etag, last_modified epoch seconds)`` for a track's processed file, or
+    for an alternative ``rendition`` of it.
+    """
+    target = "raw" if track.normalized_lufs is None else track.normalized_lufs
+    if rendition is None:
+        etag = f'"{track.content_hash}-{track.bitrate_kbps or 0}-{target}"'
+    else:
+        etag = (
+            f'"{track.content_hash}-{rendition.codec}'
+            f'-{rendition.bitrate_kbps}-{target}"'
+        )
+    last_modified = int(track.updated_at.timestamp()) if track.updated_at else None
+    return etag, last_modified
+
+
+def track_version(track: Track) -> str:
+    """
+    Token for the ``v`` query parameter of a track URL: changes with every
+    encode (bitrate, loudness target, ``updated_at``).
+    """
+    target = "raw" if track.normalized_lufs is None else track.normalized_lufs
+    updated = track.updated_at.timestamp() if track.updated_at else 0
+    raw = f"{track.content_hash}-{track.bitrate_kbps or 0}-{target}-{updated}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:12]
+
+
+def track_cache_control(track: Track, version: Optional[str] = None) -> str:
+    if track.state != Track.State.READY:
+        return "no-cache"
+    if version and version == track_version(track):
+        return f"public, max-age={settings.TRACK_CACHE_MAX_AGE}, immutable"
+    return f"public, max-age={settings.TRACK_CACHE_UNVERSIONED_MAX_AGE}"
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single ``bytes=`` range into inclusive ``(start, end)``.
+
+    Returns None when the header should be ignored (absent, malformed or
+    multi-range) and raises RangeNotSatisfiable when no byte of the file is
+    selected.
+    """
+    m = RANGE_RE.match(header.strip())
+    if not m:
+        return None
+    first, last = m.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        suffix = int(last)
+        if suffix == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    end = int(last) if last else size - 1
+    return start, min(end, size - 1)
+
+
+def if_range_matches(
+    if_range: str, etag: Optional[str], last_modified: Optional[int]
+) -> bool:
+    """True when the representation still matches the client's If-Range."""
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # Weak validators never match for ranges
+        return bool(etag) and if_range == etag and not etag.startswith("W/")
+    date = parse_http_date_safe(if_range)
+    return date is not None and last_modified is not None and date == last_modified
+
+
+def _accel_response(path: Path, content_type: str) -> HttpResponse:
+    rel = os.path.relpath(path, settings.RADIO_STUDIOS_ROOT)
+    response = HttpResponse(content_type=content_type)
+    response["X-Accel-Redirect"] = (
+        settings.TRACK_ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + quote(rel)
+    )
+    return response
+
+
+def file_response(
+    request,
+    path: Path,
+    content_type: str,
+    etag: Optional[str] = None,
+    last_modified: Optional[int] = None,
+) -> HttpResponse:
+    """
+    Serve ``path`` honouring Range/If-Range.
+
+    ``etag`` and ``last_modified`` (epoch seconds) are the validators sent to
+    the client; If-Range is checked against them.
+    """
+    if getattr(settings, "TRACK_SERVE_MODE", "file") == "accel":
+        response = _accel_response(path, content_type)
+    else:
+        response = _range_response(request, path, content_type, etag, last_modified)
+
+    if etag:
+        response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+def _range_response(
+    request,
+    path: Path,
+    content_type: str,
+    etag: Optional[str],
+    last_modified: Optional[int],
+) -> HttpResponse:
+    fileobj = open(path, "rb")
+    size = os.fstat(fileobj.fileno()).st_size
+
+    byte_range = None
+    range_header = request.headers.get("Range", "")
+    if_range = request.headers.get("If-Range", "")
+    if range_header and (
+        not if_range or if_range_matches(if_range, etag, last_modified)
+    ):
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            fileobj.close()
+            response = HttpResponse(status=416, content_type=content_type)
+            response["Content-Range"] = f"bytes */{size}"
+            response["Accept-Ranges"] = "bytes"
+            return response
+
+    start, end = byte_range or (0, size - 1)
+    length = max(end - start + 1, 0)
+    response = FileResponse(
+        FileRange(fileobj, start, length),
+        content_type=content_type,
+        status=206 if byte_range else 200,
+    )
+    response["Content-Length"] = str(length)
+    if byte_range:
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Accept-Ranges"] = "bytes"
+    return response
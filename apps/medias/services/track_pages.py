@@ -0,0 +1,116 @@
+"""
+Keyset pagination of a studio's track library (``tracks`` GraphQL query).
+
+Tracks are listed newest first on ``(created_at, id)``. A cursor encodes the
+pair of its row, and the next page starts right after it with a row-value
+comparison ``(created_at, id) < (cursor)`` that the ``(studio, created_at,
+id)`` index answers directly: every page costs the same, whatever its depth
+(OFFSET reads and drops all the rows before the page).
+
+``totalCount`` is only computed when asked for, and cached per studio and
+filters for ``TRACK_COUNT_CACHE_TTL`` seconds in the default Django cache,
+so scrolling runs one COUNT per TTL instead of one per page.
+"""
+
+import base64
+import datetime
+import hashlib
+import uuid
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import BooleanField, QuerySet
+from django.db.models.expressions import RawSQL
+
+# Page size when neither first nor last is given, and the largest allowed
+PAGE_MAX = 500
+
+COUNT_KEY_PREFIX = "track-count"
+
+
+class InvalidCursor(ValueError): ...
+
+
+def encode_cursor(created_at: datetime.datetime, pk) -> str:
+    raw = f"{created_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, uuid.UUID]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, _sep, pk = base64.urlsafe_b64decode(padded).decode().partition("|")
+        return datetime.datetime.fromisoformat(created_at), uuid.UUID(pk)
+    except ValueError:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+
+
+def _seek(qs: QuerySet, cursor: str, operator: str) -> QuerySet:
+    created_at, pk = decode_cursor(cursor)
+    table = connection.ops.quote_name(qs.model._meta.db_table)
+    # Row-value comparison: an index range condition, unlike the equivalent
+    # "created_at < x OR (created_at = x AND id < y)"
+    condition = RawSQL(
+        f"({table}.{connection.ops.quote_name('created_at')}, "
+        f"{table}.{connection.ops.quote_name('id')}) {operator} (%s, %s)",
+        (created_at, pk),
+        output_field=BooleanField(),
+    )
+    return qs.filter(condition)
+
+
+def _size(requested: Optional[int]) -> int:
+    if requested is None:
+        return PAGE_MAX
+    if requested < 0:
+        raise ValueError("first and last must be positive")
+    return min(requested, PAGE_MAX)
+
+
+def keyset_page(
+    qs: QuerySet,
+    first: Optional[int] = None,
+    after: Optional[str] = None,
+    last: Optional[int] = None,
+    before: Optional[str] = None,
+) -> Tuple[List, bool, bool]:
+    """
+    One page of ``qs``, newest first: ``(rows, has_previous, has_next)``.
+
+    ``first``/``after`` pages forward (older tracks), ``last``/``before``
+    backward. One row more than the page is fetched to tell whether another
+    page follows; the other flag only says whether a cursor was given.
+
+    Raises InvalidCursor on a cursor not made by ``encode_cursor``.
+    """
+    if after:
+        qs = _seek(qs, after, "<")
+    if before:
+        qs = _seek(qs, before, ">")
+    if last is not None and first is None:
+        size = _size(last)
+        rows = list(qs.order_by("created_at", "id")[: size + 1])
+        has_previous = len(rows) > size
+        return rows[:size][::-1], has_previous, bool(before)
+    size = _size(first)
+    rows = list(qs.order_by("-created_at", "-id")[: size + 1])
+    return rows[:size], bool(after), len(rows) > size
+
+
+def count_key(studio_id, *filters) -> str:
+    digest = hashlib.sha1(repr(filters).encode()).hexdigest()[:16]
+    return f"{COUNT_KEY_PREFIX}:{studio_id}:{digest}"
+
+
+def cached_count(qs: QuerySet, key: str) -> int:
+    """``qs.count()``, cached under ``key`` for TRACK_COUNT_CACHE_TTL seconds."""
+    ttl = getattr(settings, "TRACK_COUNT_CACHE_TTL", 60)
+    if ttl <= 0:
+        return qs.count()
+    count = cache.get(key)
+    if count is None:
+        count = qs.count()
+        cache.set(key, count, timeout=ttl)
+    return count
@@ -0,0 +1,260 @@
+"""
+Transcode job ledger and per-studio fair scheduling.
+
+Every transcode is a TranscodeJob row. Celery messages on the transcode
+queue carry no job: a worker task claims whichever job should run next, so
+the order is decided when a worker is free, not when the upload finished.
+
+Fairness: the studio with the fewest RUNNING jobs goes first, ties go to the
+studio served least recently, then to the oldest waiting job. A studio that
+queued 500 tracks therefore holds one worker at a time while other studios
+have work waiting, and all of them when it is alone. Within a studio jobs run
+in the order they were queued.
+
+Queue wait is ``started_at - created_at`` and run time
+``finished_at - started_at``.
+"""
+
+import datetime
+import os
+import socket
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence
+
+from django.db import transaction
+from django.db.models import Avg, Count, F, Max, Min
+from django.utils import timezone
+
+from apps.medias.models import Track, TrackAsset, TranscodeJob
+
+# Studios served within this window count for the "least recently served" rule
+SERVED_WINDOW = datetime.timedelta(days=1)
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"[:64]
+
+
+def enqueue_job(track: Track, attempt: int = 1) -> TranscodeJob:
+    """
+    Record a QUEUED job for ``track`` and mark the track PENDING.
+
+    A READY track (re-encode of a published file) stays READY and is read
+    from its RAW_ORIGINAL asset.
+    """
+    if track.state == Track.State.READY:
+        original = track.assets.filter(
+            asset_type=TrackAsset.AssetType.RAW_ORIGINAL
+        ).first()
+        input_key = original.storage_key if original else ""
+    else:
+        input_key = (
+            track.upload_session.temp_rel_path if track.upload_session_id else ""
+        )
+    job = TranscodeJob.objects.create(
+        studio_id=track.studio_id,
+        track=track,
+        upload_session_id=track.upload_session_id,
+        attempt=attempt,
+        input_storage_key=input_key,
+    )
+    if track.state != Track.State.READY:
+        track.state = Track.State.PENDING
+        track.updated_at = timezone.now()
+        track.save(update_fields=["state", "updated_at"])
+    return job
+
+
+def enqueue_jobs(tracks: Sequence[Track]) -> List[TranscodeJob]:
+    """
+    Bulk ``enqueue_job`` for new tracks already saved as PENDING with their
+    upload session (batch import).
+    """
+    return TranscodeJob.objects.bulk_create(
+        TranscodeJob(
+            studio_id=track.studio_id,
+            track=track,
+            upload_session_id=track.upload_session_id,
+            attempt=1,
+            input_storage_key=track.upload_session.temp_rel_path,
+        )
+        for track in tracks
+    )
+
+
+def claim_next_job(worker: str, now=None) -> Optional[TranscodeJob]:
+    """
+    Mark the next job (see module docstring) RUNNING and return it.
+
+    Returns None when nothing is queued. Rows are locked with SKIP LOCKED, so
+    concurrent workers never claim the same job.
+    """
+    now = now or timezone.now()
+    queued = TranscodeJob.objects.filter(status=TranscodeJob.Status.QUEUED)
+    waiting: Dict = dict(
+        queued.values("studio_id")
+        .annotate(oldest=Min("created_at"))
+        .values_list("studio_id", "oldest")
+    )
+    if not waiting:
+        return None
+    running = dict(
+        TranscodeJob.objects.filter(
+            status=TranscodeJob.Status.RUNNING, studio_id__in=waiting
+        )
+        .values("studio_id")
+        .annotate(count=Count("id"))
+        .values_list("studio_id", "count")
+    )
+    served = dict(
+        TranscodeJob.objects.filter(
+            studio_id__in=waiting, started_at__gte=now - SERVED_WINDOW
+        )
+        .values("studio_id")
+        .annotate(last=Max("started_at"))
+        .values_list("studio_id", "last")
+    )
+    never = now - SERVED_WINDOW
+    order = sorted(
+        waiting,
+        key=lambda s: (running.get(s, 0), served.get(s) or never, waiting[s]),
+    )
+
+    for studio_id in order:
+        with transaction.atomic():
+            job = (
+                queued.filter(studio_id=studio_id)
+                .order_by("created_at")
+                .select_for_update(skip_locked=True)
+                .first()
+            )
+            if job is None:
+                # Taken by another worker since the counts were read
+                continue
+            job.status = TranscodeJob.Status.RUNNING
+            job.started_at = now
+            job.worker_id = worker
+            job.updated_at = now
+            job.save(update_fields=["status", "started_at", "worker_id", "updated_at"])
+            return job
+    return None
+
+
+def finish_job(
+    job: TranscodeJob, status: str, error_message: str = "", extra_fields=()
+) -> bool:
+    """
+    Close ``job`` if it is still RUNNING; ``extra_fields`` already set on it
+    are saved as well. Returns False when it was not: a job canceled (or
+    requeued) meanwhile keeps its status and only gets its finish time.
+    """
+    now = timezone.now()
+    finished = TranscodeJob.objects.filter(
+        pk=job.pk, status=TranscodeJob.Status.RUNNING
+    ).update(
+        status=status,
+        finished_at=now,
+        error_message=error_message[:4000],
+        updated_at=now,
+        **{field: getattr(job, field) for field in extra_fields},
+    )
+    if not finished:
+        TranscodeJob.objects.filter(
+            pk=job.pk, status=TranscodeJob.Status.CANCELED, finished_at__isnull=True
+        ).update(
+            finished_at=now,
+            updated_at=now,
+            **(
+                {"error_message": error_message[:4000]}
+                if status == TranscodeJob.Status.CANCELED
+                else {}
+            ),
+        )
+        job.refresh_from_db(
+            fields=["status", "finished_at", "error_message", "updated_at"]
+        )
+        return False
+    job.status = status
+    job.finished_at = now
+    job.error_message = error_message[:4000]
+    job.updated_at = now
+    return True
+
+
+def report_progress(job: TranscodeJob, percent, speed) -> bool:
+    """
+    Store the progress of a RUNNING job. Returns False when the job is no
+    longer RUNNING (canceled meanwhile): the worker then stops it.
+    """
+    return bool(
+        TranscodeJob.objects.filter(
+            pk=job.pk, status=TranscodeJob.Status.RUNNING
+        ).update(
+            progress_percent=None if percent is None else round(Decimal(percent), 2),
+            speed=None if speed is None else round(Decimal(speed), 2),
+            updated_at=timezone.now(),
+        )
+    )
+
+
+def cancel_jobs(track: Track) -> int:
+    """
+    Cancel the QUEUED and RUNNING jobs of ``track``; returns how many.
+
+    A RUNNING job is stopped by its worker at its next progress report. A
+    track that was only waiting (PENDING) is marked FAILED, it has no
+    published file.
+    """
+    now = timezone.now()
+    canceled = TranscodeJob.objects.filter(
+        track=track,
+        status__in=[TranscodeJob.Status.QUEUED, TranscodeJob.Status.RUNNING],
+    ).update(status=TranscodeJob.Status.CANCELED, updated_at=now)
+    if canceled and track.state == Track.State.PENDING:
+        track.state = Track.State.FAILED
+        track.error_message = "Transcode canceled"
+        track.updated_at = now
+        track.save(update_fields=["state", "error_message", "updated_at"])
+    return canceled
+
+
+def requeue_stale_jobs(older_than: datetime.timedelta, now=None) -> int:
+    """
+    Put RUNNING jobs started before ``now - older_than`` back in the queue
+    (their worker died without finishing them). Returns the number requeued.
+    """
+    now = now or timezone.now()
+    return TranscodeJob.objects.filter(
+        status=TranscodeJob.Status.RUNNING, started_at__lt=now - older_than
+    ).update(status=TranscodeJob.Status.QUEUED, started_at=None, updated_at=now)
+
+
+def queue_stats(since: datetime.datetime) -> Dict:
+    """Per-studio queue depth plus average wait and run seconds since ``since``."""
+    stats: Dict[str, Dict] = {}
+    depth = (
+        TranscodeJob.objects.filter(
+            status__in=[TranscodeJob.Status.QUEUED, TranscodeJob.Status.RUNNING]
+        )
+        .values("studio__slug", "status")
+        .annotate(count=Count("id"))
+    )
+    for row in depth:
+        entry = stats.setdefault(row["studio__slug"], {})
+        entry[row["status"].lower()] = row["count"]
+
+    timings = (
+        TranscodeJob.objects.filter(finished_at__gte=since, started_at__isnull=False)
+        .values("studio__slug")
+        .annotate(
+            finished=Count("id"),
+            wait=Avg(F("started_at") - F("created_at")),
+            run=Avg(F("finished_at") - F("started_at")),
+        )
+    )
+    for row in timings:
+        entry = stats.setdefault(row["studio__slug"], {})
+        entry["finished"] = row["finished"]
+        entry["avg_wait_seconds"] = round(row["wait"].total_seconds(), 1)
+        entry["avg_run_seconds"] = round(row["run"].total_seconds(), 1)
+    return stats
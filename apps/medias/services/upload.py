@@ -1,14 +1,25 @@
+import errno
 import io
+import os
 import secrets
+import threading
 from pathlib import Path
+from typing import Callable, List, Optional
 
-from apps.medias.models import UploadSession
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from apps.medias.models import Track, UploadSession
+from apps.medias.services import hashing, upload_progress
 from apps.medias.services.paths import relpath_from_root, studio_paths
+from apps.medias.services.upload_progress import UploadTicket
 from apps.studio.models import Studio
 from config import settings
 
 CHUNK_SIZE = 1024 * 1024
 
+_buffers = threading.local()
+
 
 class UploadConflictError(Exception): ...
 
@@ -16,6 +27,16 @@ class UploadConflictError(Exception): ...
 class UploadRangeError(Exception): ...
 
 
+class UploadTooLargeError(Exception): ...
+
+
+def check_upload_size(size: int) -> None:
+    """Raise UploadTooLargeError past UPLOAD_MAX_BYTES (0: no limit)."""
+    limit = settings.UPLOAD_MAX_BYTES
+    if limit and size > limit:
+        raise UploadTooLargeError(f"Upload of {size} bytes exceeds {limit} bytes")
+
+
 def ensure_upload_token(upload: UploadSession) -> str:
     if not upload.upload_token:
         upload.upload_token = secrets.token_urlsafe(32)
@@ -24,54 +45,235 @@ def ensure_upload_token(upload: UploadSession) -> str:
 
 
 def init_upload(studio: Studio, upload: UploadSession) -> Path:
+    if upload.size_bytes:
+        check_upload_size(upload.size_bytes)
     paths = studio_paths(studio)
     temp_path = paths.incoming / f"{upload.id}.part"
     if not temp_path.exists():
         temp_path.touch()
+    if upload.size_bytes:
+        preallocate(temp_path, upload.size_bytes)
     upload.temp_rel_path = relpath_from_root(temp_path)
-    upload.bytes_received = temp_path.stat().st_size
+    upload.bytes_received = received_bytes(upload.received_ranges)
     ensure_upload_token(upload)
     upload.save(update_fields=["temp_rel_path", "bytes_received", "updated_at"])
 
     return temp_path
 
 
-def append_chunk(
-    upload: UploadSession, start: int, end: int, total: int, body: io.BufferedReader
+def preallocate(path: Path, size: int) -> None:
+    """
+    Grow ``path`` to ``size`` bytes so chunks can be written at any offset.
+
+    Uses posix_fallocate where available, so a full disk fails the upload
+    up front instead of on a late chunk.
+    """
+    if path.stat().st_size >= size:
+        return
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        if hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(fd, 0, size)
+                return
+            except OSError as e:
+                if e.errno not in (errno.EOPNOTSUPP, errno.EINVAL):
+                    raise
+        os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+
+
+def merge_range(ranges: List[List[int]], start: int, end: int) -> List[List[int]]:
+    """Add the half-open byte range [start, end) to sorted, disjoint ``ranges``."""
+    return upload_progress.merge_ranges([*ranges, [start, end]])
+
+
+def received_bytes(ranges: List[List[int]]) -> int:
+    return sum(end - start for start, end in ranges)
+
+
+def contiguous_prefix(ranges: List[List[int]]) -> int:
+    """Length of the gap-free prefix starting at byte 0."""
+    if ranges and ranges[0][0] == 0:
+        return ranges[0][1]
+    return 0
+
+
+def _write_buffer() -> memoryview:
+    """This thread's reusable ``CHUNK_SIZE`` read buffer."""
+    view = getattr(_buffers, "view", None)
+    if view is None:
+        view = _buffers.view = memoryview(bytearray(CHUNK_SIZE))
+    return view
+
+
+def write_body(
+    fd: int,
+    body,
+    offset: int,
+    length: int,
+    on_block: Optional[Callable[[int, memoryview], None]] = None,
 ) -> int:
-    if upload.finalized:
-        raise UploadConflictError("Upload already finalized")
+    """
+    Copy up to ``length`` bytes of ``body`` into ``fd`` at ``offset``.
+
+    Streams offering ``readinto`` are read into this thread's reusable
+    buffer, so no bytes object is allocated per block; others (Django's
+    request, gunicorn's body reader) are read with ``read``. Short writes are
+    retried. ``on_block(offset, block)`` is called after each block is
+    written. Returns the number of bytes written (less than ``length`` when
+    the body ends early).
+    """
+    readinto = getattr(body, "readinto", None)
+    buffer = _write_buffer() if readinto is not None else None
+    position = offset
+    end = offset + length
+    while position < end:
+        size = min(CHUNK_SIZE, end - position)
+        if buffer is not None:
+            count = readinto(buffer[:size]) or 0
+            block = buffer[:count]
+        else:
+            block = memoryview(body.read(size))
+            count = len(block)
+        if not count:
+            break
+        done = 0
+        while done < count:
+            done += os.pwrite(fd, block[done:], position + done)
+        if on_block is not None:
+            on_block(position, block)
+        position += count
+    return position - offset
+
+
+def checkpoint_ranges(
+    upload_id, ranges: List[List[int]], seen: Optional[List[List[int]]] = None
+) -> List[List[int]]:
+    """
+    Merge ``ranges`` into ``UploadSession.received_ranges``.
+
+    ``seen`` is the value of the row's ranges the caller already read: the
+    merge is then written with one UPDATE conditional on the row still
+    holding it. Otherwise, or when another chunk changed the row meanwhile,
+    the row is read and updated under a row lock.
+
+    Returns every range recorded on the row afterwards.
+    """
+    if seen is not None:
+        merged = upload_progress.merge_ranges([*seen, *ranges])
+        if merged == seen:
+            return merged
+        updated = UploadSession.objects.filter(
+            pk=upload_id, received_ranges=seen
+        ).update(
+            received_ranges=merged,
+            bytes_received=received_bytes(merged),
+            updated_at=timezone.now(),
+        )
+        if updated:
+            return merged
+    with transaction.atomic():
+        locked = UploadSession.objects.select_for_update().get(pk=upload_id)
+        merged = upload_progress.merge_ranges([*locked.received_ranges, *ranges])
+        if merged != locked.received_ranges:
+            locked.received_ranges = merged
+            locked.bytes_received = received_bytes(merged)
+            locked.updated_at = timezone.now()
+            locked.save(
+                update_fields=["received_ranges", "bytes_received", "updated_at"]
+            )
+    return merged
+
+
+def _adopt_upload(ticket: UploadTicket, total: int) -> UploadTicket:
+    """
+    Give an upload created without a size or ``.part`` file (older clients)
+    both, from its first chunk.
+    """
+    upload = UploadSession.objects.select_related("studio").get(pk=ticket.upload_id)
+    if upload.size_bytes is None:
+        upload.size_bytes = total
+        upload.save(update_fields=["size_bytes", "updated_at"])
     if not upload.temp_rel_path:
         init_upload(upload.studio, upload)
+    upload_progress.discard(upload.pk)
+    return UploadTicket.from_upload(upload)
 
-    temp_abs = Path(settings.RADIO_STUDIOS_ROOT) / upload.temp_rel_path
-    temp_abs.parent.mkdir(parents=True, exist_ok=True)
 
-    if start != upload.bytes_received and end != 0:
-        raise UploadRangeError(
-            f"Expected start={upload.bytes_received}, got start={start}"
+def append_chunk(
+    ticket: UploadTicket, start: int, end: int, total: int, body: io.BufferedReader
+) -> List[List[int]]:
+    """
+    Write bytes ``start..end`` (inclusive) of the upload, in any order.
+
+    Chunks are written with ``pwrite`` at their offset in the preallocated
+    ``.part`` file, so several chunks of one upload can be sent in parallel.
+    The byte range actually written is recorded in the progress backend (see
+    ``upload_progress``) and checkpointed to ``UploadSession.received_ranges``
+    every ``UPLOAD_CHECKPOINT_BYTES``; without a backend it goes to the row
+    directly. Returns every range received so far.
+    """
+    if ticket.size_bytes is not None and total != ticket.size_bytes:
+        raise UploadRangeError(f"Expected total={ticket.size_bytes}, got total={total}")
+    if start > end or end >= total:
+        raise UploadRangeError(f"Invalid range {start}-{end}/{total}")
+    if ticket.size_bytes is None or not ticket.temp_rel_path:
+        check_upload_size(total)
+        ticket = _adopt_upload(ticket, total)
+
+    temp_abs = Path(settings.RADIO_STUDIOS_ROOT) / ticket.temp_rel_path
+    running = hashing.running_hash(ticket.upload_id)
+    try:
+        fd = os.open(temp_abs, os.O_WRONLY)
+    except FileNotFoundError:
+        # Finalized (and moved away) while a cached ticket was still alive
+        raise UploadConflictError("Upload already finalized")
+    try:
+        if os.fstat(fd).st_size < total:
+            preallocate(temp_abs, total)
+        written = write_body(fd, body, start, end - start + 1, running.feed)
+    finally:
+        os.close(fd)
+
+    position = start + written
+    ranges = None
+    if written:
+        ranges = upload_progress.record_range(ticket.upload_id, start, position)
+    if ranges is None:
+        # No progress backend (or it failed): the row is the record
+        ranges = checkpoint_ranges(
+            ticket.upload_id,
+            [[start, position]] if written else [],
+            seen=ticket.received_ranges,
         )
+    elif upload_progress.should_checkpoint(
+        received_bytes(ranges), written, ticket.size_bytes
+    ):
+        ranges = checkpoint_ranges(ticket.upload_id, ranges)
+
+    # Hash whatever is now contiguous from byte 0 and was not fed or held in
+    # this process (chunks written by other workers are read back once)
+    running.catch_up(temp_abs, contiguous_prefix(ranges))
 
-    to_write = end - start + 1
-    remaining = to_write
-    with open(temp_abs, "ab") as f:
-        while remaining > 0:
-            chunk = body.read(min(CHUNK_SIZE, remaining))
-            if not chunk:
-                break
-            f.write(chunk)
-            remaining -= len(chunk)
+    return ranges
 
-    new_size = temp_abs.stat().st_size
-    upload.bytes_received = new_size
-    upload.size_bytes = total
-    upload.save(update_fields=["bytes_received", "size_bytes", "updated_at"])
-    return new_size
 
+def finalize_upload(upload: UploadSession, checksum_sha256: str = "") -> Path:
+    """
+    Close the upload and record the SHA-256 of the received file.
 
-def finalize_upload(upload: UploadSession) -> Path:
+    Raises UploadConflictError when the file is incomplete or its digest
+    differs from the checksum announced by the client.
+    """
     if upload.finalized:
         return Path(settings.RADIO_STUDIOS_ROOT) / upload.temp_rel_path
+    # Chunks recorded in the progress backend since the last checkpoint
+    upload.received_ranges = upload_progress.merge_ranges(
+        [*upload.received_ranges, *upload_progress.received_ranges(upload.pk)]
+    )
+    upload.bytes_received = received_bytes(upload.received_ranges)
     temp_abs = Path(settings.RADIO_STUDIOS_ROOT) / upload.temp_rel_path
     if not temp_abs.exists() or upload.size_bytes is None:
         raise UploadConflictError("Upload not complete")
@@ -79,8 +281,114 @@ def finalize_upload(upload: UploadSession) -> Path:
         raise UploadConflictError("Upload not initialized")
     if temp_abs.stat().st_size != upload.size_bytes:
         raise UploadConflictError("size mismatch")
-    temp_abs = Path(settings.RADIO_STUDIOS_ROOT) / upload.temp_rel_path
+    if upload.received_ranges != [[0, upload.size_bytes]]:
+        missing = missing_ranges(upload.received_ranges, upload.size_bytes)
+        raise UploadConflictError(
+            "Upload not complete, missing bytes "
+            + ", ".join(f"{start}-{end - 1}" for start, end in missing[:10])
+        )
+
+    digest = hashing.upload_digest(upload.id, temp_abs, upload.size_bytes)
+    if digest is None:
+        raise UploadConflictError("Upload not complete")
+    expected = (checksum_sha256 or upload.expected_sha256).strip().lower()
+    if expected and expected != digest:
+        raise UploadConflictError("checksum mismatch")
 
+    upload.sha256 = digest
     upload.finalized = True
-    upload.save(update_fields=["finalized", "updated_at"])
+    upload.save(
+        update_fields=[
+            "received_ranges",
+            "bytes_received",
+            "sha256",
+            "finalized",
+            "updated_at",
+        ]
+    )
+    transaction.on_commit(lambda: upload_progress.discard(upload.pk))
     return temp_abs
+
+
+def missing_ranges(ranges: List[List[int]], size: int) -> List[List[int]]:
+    """Half-open byte ranges of [0, size) not covered by ``ranges``."""
+    missing = []
+    cursor = 0
+    for start, end in ranges:
+        if start > cursor:
+            missing.append([cursor, start])
+        cursor = max(cursor, end)
+    if cursor < size:
+        missing.append([cursor, size])
+    return missing
+
+
+DUPLICATE_COPY_FIELDS = (
+    "processed_rel_path",
+    "file_name",
+    "bitrate_kbps",
+    "duration_seconds",
+    "loudness_lufs",
+    "peak_dbfs",
+    "loudness_range_lu",
+    "normalized_lufs",
+)
+
+
+def _claim_hash(track: Track, digest: str) -> bool:
+    """Save ``digest`` as the content hash of ``track``; False if taken meanwhile."""
+    track.content_hash = digest
+    track.updated_at = timezone.now()
+    try:
+        # Savepoint: a concurrent finalize of the same bytes may commit first
+        with transaction.atomic():
+            track.save(update_fields=["content_hash", "updated_at"])
+    except IntegrityError:
+        return False
+    return True
+
+
+def resolve_duplicate(track: Track, digest: str) -> Optional[Track]:
+    """
+    Give ``track`` its real content hash, or link it to the studio track that
+    already has it.
+
+    When that track is READY, ``track`` shares its processed file, becomes
+    READY itself and the existing track is returned: the caller skips the
+    transcode. Otherwise None is returned and the upload is processed as
+    usual. ``(studio, content_hash)`` is unique, so a duplicate keeps its
+    provisional hash and is found through ``is_duplicate_of``.
+
+    The constraint also covers soft-deleted tracks: one holding the hash
+    (its files are already gone) is hard-deleted to release it.
+    """
+    provisional = track.content_hash
+    for _attempt in range(2):
+        existing = (
+            Track.all_objects.filter(studio_id=track.studio_id, content_hash=digest)
+            .exclude(pk=track.pk)
+            .first()
+        )
+        if existing is not None and existing.deleted_at is not None:
+            existing.hard_delete()
+            existing = None
+        if existing is not None:
+            break
+        if _claim_hash(track, digest):
+            return None
+        # Another upload of the same bytes committed first: link to it
+        track.content_hash = provisional
+    else:
+        raise IntegrityError(f"Content hash {digest} still taken in the studio")
+
+    track.is_duplicate_of = existing
+    update_fields = ["is_duplicate_of", "updated_at"]
+    ready = existing.state == Track.State.READY and existing.processed_rel_path
+    if ready:
+        for field in DUPLICATE_COPY_FIELDS:
+            setattr(track, field, getattr(existing, field))
+        track.state = Track.State.READY
+        update_fields += [*DUPLICATE_COPY_FIELDS, "state"]
+    track.updated_at = timezone.now()
+    track.save(update_fields=update_fields)
+    return existing if ready else None
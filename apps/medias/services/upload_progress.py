@@ -0,0 +1,272 @@
+"""
+Progress of chunked uploads kept outside the database.
+
+Without a backend every chunk PUT reads the UploadSession row and writes its
+byte range merged into the ``received_ranges`` it read, i.e. one SELECT and
+one UPDATE per chunk (the UPDATE only applies if the ranges did not change
+meanwhile; a parallel chunk that raced it merges again under a row lock). With ``UPLOAD_PROGRESS_BACKEND`` set:
+
+- the upload ticket (token, size, ``.part`` path) is cached for
+  ``UPLOAD_TICKET_TTL`` seconds, so chunk PUTs do not read the row;
+- received ranges are recorded in the backend, which is authoritative while
+  the upload is in progress;
+- the row is checkpointed each time another ``UPLOAD_CHECKPOINT_BYTES`` have
+  been received and when the file is complete; ``finalize_upload`` merges
+  the backend ranges before checking coverage.
+
+Backends:
+
+- ``redis``: one sorted set of ``start-end`` members per upload (written
+  with ZADD, so parallel chunks never overwrite each other) plus the cached
+  ticket. Shared by every worker.
+- ``memory``: the same in process memory, for single-process deployments only.
+
+If the backend loses its state (restart, eviction, errors) the upload carries
+on from the last checkpoint: the chunk endpoint reports the gaps and the
+client re-sends them.
+"""
+
+import json
+import logging
+import threading
+import time
+from dataclasses import asdict, dataclass, replace
+from typing import Dict, List, Optional
+
+import redis
+from django.conf import settings
+
+from apps.medias.models import UploadSession
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "upload"
+# Merge the stored members back into disjoint ranges once there are this
+# many more members than ranges
+COMPACT_SLACK = 32
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class UploadTicket:
+    """What a chunk PUT needs to know about its (unfinalized) upload."""
+
+    upload_id: str
+    upload_token: str
+    size_bytes: Optional[int]
+    temp_rel_path: str
+    # Row ranges when the ticket was read from the row (no backend): the
+    # chunk checkpoint updates the row from them without reading it again.
+    # Never cached
+    received_ranges: Optional[List[List[int]]] = None
+
+    @classmethod
+    def from_upload(cls, upload: UploadSession) -> "UploadTicket":
+        return cls(
+            upload_id=str(upload.pk),
+            upload_token=upload.upload_token,
+            size_bytes=upload.size_bytes,
+            temp_rel_path=upload.temp_rel_path,
+            received_ranges=upload.received_ranges,
+        )
+
+
+def merge_ranges(ranges) -> List[List[int]]:
+    """Sorted, disjoint [start, end) ranges covering every range given."""
+    merged: List[List[int]] = []
+    for start, end in sorted([int(s), int(e)] for s, e in ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class RedisProgress:
+    def __init__(self, url: str):
+        self.client = redis.Redis.from_url(url)
+
+    @staticmethod
+    def _keys(upload_id):
+        return f"{KEY_PREFIX}:{upload_id}:ticket", f"{KEY_PREFIX}:{upload_id}:ranges"
+
+    def get_ticket(self, upload_id) -> Optional[Dict]:
+        ticket_key, _ranges_key = self._keys(upload_id)
+        raw = self.client.get(ticket_key)
+        return json.loads(raw) if raw else None
+
+    def set_ticket(self, upload_id, ticket: Dict, ttl: int) -> None:
+        ticket_key, _ranges_key = self._keys(upload_id)
+        self.client.set(ticket_key, json.dumps(ticket), ex=ttl)
+
+    def add_ranges(self, upload_id, ranges, ttl: int) -> List[List[int]]:
+        _ticket_key, ranges_key = self._keys(upload_id)
+        pipe = self.client.pipeline()
+        pipe.zadd(ranges_key, {f"{start}-{end}": start for start, end in ranges})
+        pipe.expire(ranges_key, ttl)
+        pipe.zrange(ranges_key, 0, -1)
+        members = pipe.execute()[-1]
+        merged = merge_ranges(m.decode().split("-") for m in members)
+        if len(members) > len(merged) + COMPACT_SLACK:
+            # Only the members read above are replaced: ranges added by a
+            # concurrent chunk in the meantime are kept
+            pipe = self.client.pipeline()
+            pipe.zrem(ranges_key, *members)
+            pipe.zadd(ranges_key, {f"{start}-{end}": start for start, end in merged})
+            pipe.expire(ranges_key, ttl)
+            pipe.execute()
+        return merged
+
+    def get_ranges(self, upload_id) -> List[List[int]]:
+        _ticket_key, ranges_key = self._keys(upload_id)
+        members = self.client.zrange(ranges_key, 0, -1)
+        return merge_ranges(m.decode().split("-") for m in members)
+
+    def discard(self, upload_id) -> None:
+        self.client.delete(*self._keys(upload_id))
+
+
+class MemoryProgress:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # upload id -> (expires_at, ticket)
+        self.tickets: Dict[str, tuple] = {}
+        # upload id -> merged ranges
+        self.ranges: Dict[str, List[List[int]]] = {}
+
+    def get_ticket(self, upload_id) -> Optional[Dict]:
+        with self.lock:
+            entry = self.tickets.get(str(upload_id))
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            return entry[1]
+
+    def set_ticket(self, upload_id, ticket: Dict, ttl: int) -> None:
+        with self.lock:
+            self.tickets[str(upload_id)] = (time.monotonic() + ttl, ticket)
+
+    def add_ranges(self, upload_id, ranges, ttl: int) -> List[List[int]]:
+        with self.lock:
+            key = str(upload_id)
+            merged = merge_ranges([*self.ranges.get(key, []), *ranges])
+            self.ranges[key] = merged
+            return [list(r) for r in merged]
+
+    def get_ranges(self, upload_id) -> List[List[int]]:
+        with self.lock:
+            return [list(r) for r in self.ranges.get(str(upload_id), [])]
+
+    def discard(self, upload_id) -> None:
+        with self.lock:
+            self.tickets.pop(str(upload_id), None)
+            self.ranges.pop(str(upload_id), None)
+
+
+def get_backend():
+    """The configured progress backend, or None when progress lives in the DB."""
+    global _backend
+    name = getattr(settings, "UPLOAD_PROGRESS_BACKEND", "")
+    if not name:
+        return None
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if name == "redis":
+                    _backend = RedisProgress(settings.UPLOAD_PROGRESS_URL)
+                elif name == "memory":
+                    _backend = MemoryProgress()
+                else:
+                    raise ValueError(f"Unknown UPLOAD_PROGRESS_BACKEND: {name}")
+    return _backend
+
+
+def _progress_ttl() -> int:
+    return getattr(settings, "UPLOAD_PROGRESS_TTL", 86400)
+
+
+def get_ticket(upload_id) -> Optional[UploadTicket]:
+    """
+    The ticket of an unfinalized upload, from the cache when possible.
+
+    A cache miss reads the row, caches the ticket and seeds the backend with
+    the checkpointed ranges (covers a backend that lost its state).
+    """
+    backend = get_backend()
+    if backend is not None:
+        try:
+            cached = backend.get_ticket(upload_id)
+        except redis.RedisError:
+            logger.warning("upload progress: ticket read failed", exc_info=True)
+            cached = None
+        if cached is not None:
+            return UploadTicket(**cached)
+
+    upload = UploadSession.objects.filter(pk=upload_id, finalized=False).first()
+    if upload is None:
+        return None
+    ticket = UploadTicket.from_upload(upload)
+    if backend is not None:
+        try:
+            if upload.received_ranges:
+                backend.add_ranges(upload.pk, upload.received_ranges, _progress_ttl())
+            backend.set_ticket(
+                upload.pk,
+                asdict(replace(ticket, received_ranges=None)),
+                getattr(settings, "UPLOAD_TICKET_TTL", 300),
+            )
+        except redis.RedisError:
+            logger.warning("upload progress: ticket write failed", exc_info=True)
+    return ticket
+
+
+def record_range(upload_id, start: int, end: int) -> Optional[List[List[int]]]:
+    """
+    Add [start, end) to the upload's received ranges and return them all.
+
+    Returns None when there is no backend (or it failed): the caller then
+    records the range on the row.
+    """
+    backend = get_backend()
+    if backend is None:
+        return None
+    try:
+        return backend.add_ranges(upload_id, [[start, end]], _progress_ttl())
+    except redis.RedisError:
+        logger.warning("upload progress: range write failed", exc_info=True)
+        return None
+
+
+def received_ranges(upload_id) -> List[List[int]]:
+    """Ranges recorded in the backend (empty without one)."""
+    backend = get_backend()
+    if backend is None:
+        return []
+    try:
+        return backend.get_ranges(upload_id)
+    except redis.RedisError:
+        logger.warning("upload progress: range read failed", exc_info=True)
+        return []
+
+
+def should_checkpoint(received: int, written: int, size: Optional[int]) -> bool:
+    """
+    True when this chunk made the upload cross a ``UPLOAD_CHECKPOINT_BYTES``
+    boundary or completed it.
+    """
+    if size is not None and received >= size:
+        return True
+    step = max(getattr(settings, "UPLOAD_CHECKPOINT_BYTES", 16 * 1024 * 1024), 1)
+    return received // step != (received - written) // step
+
+
+def discard(upload_id) -> None:
+    """Forget the ticket and ranges of a finalized (or abandoned) upload."""
+    backend = get_backend()
+    if backend is None:
+        return
+    try:
+        backend.discard(upload_id)
+    except redis.RedisError:
+        logger.warning("upload progress: discard failed", exc_info=True)
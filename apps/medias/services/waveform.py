@@ -0,0 +1,129 @@
+"""
+Multi-resolution waveform peaks files (``waveform/<track id>.peaks``).
+
+Built from the min/max envelope of the analysis decode
+(apps.medias.services.audio_analysis), so drawing a scrubber never needs the
+audio itself. Level 0 is the envelope (``WAVEFORM_SAMPLES_PER_PIXEL``
+samples per pixel); each next level merges pairs of pixels of the previous
+one, down to ``ZOOM_LEVELS`` levels.
+
+Layout (little-endian):
+
+- header: magic ``RWPK``, version (u16), bits per value (u8: 8 or 16), level
+  count (u8), envelope sample rate (u32);
+- one index entry per level: samples per pixel (u32), pixel count (u32),
+  byte offset of its data (u64);
+- level data: ``min, max`` pairs, one per pixel, as int8 (the top byte of
+  the s16 samples) or int16.
+
+``serve_waveform`` reads the index and sends one level as a byte range of
+the file, without parsing or re-encoding its data.
+"""
+
+import struct
+import sys
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, List, Tuple
+
+MAGIC = b"RWPK"
+VERSION = 1
+ZOOM_LEVELS = 7
+# One byte per value is plenty for drawing; 16 keeps the full sample range
+PEAK_BITS = 8
+
+HEADER = struct.Struct("<4sHBBI")
+LEVEL = struct.Struct("<IIQ")
+
+
+class WaveformFormatError(Exception): ...
+
+
+@dataclass(frozen=True)
+class Level:
+    samples_per_pixel: int
+    pixels: int
+    offset: int
+    length: int
+
+
+def zoom_levels(mins: array, maxs: array, count: int) -> List[Tuple[array, array]]:
+    """``count`` levels of ``(mins, maxs)``, each half the previous width."""
+    levels = [(mins, maxs)]
+    while len(levels) < count and len(levels[-1][0]) > 1:
+        prev_mins, prev_maxs = levels[-1]
+        width = len(prev_mins)
+        next_mins = array("h", map(min, prev_mins[0::2], prev_mins[1::2]))
+        next_maxs = array("h", map(max, prev_maxs[0::2], prev_maxs[1::2]))
+        if width % 2:
+            next_mins.append(prev_mins[-1])
+            next_maxs.append(prev_maxs[-1])
+        levels.append((next_mins, next_maxs))
+    return levels
+
+
+def _interleave(mins: array, maxs: array, bits: int) -> bytes:
+    pairs = array("h", bytes(4 * len(mins)))
+    pairs[0::2] = mins
+    pairs[1::2] = maxs
+    if sys.byteorder == "big":
+        pairs.byteswap()
+    if bits == 16:
+        return pairs.tobytes()
+    # Top byte of each little-endian s16 value
+    return pairs.tobytes()[1::2]
+
+
+def encode_peaks(
+    mins: array,
+    maxs: array,
+    sample_rate: int,
+    samples_per_pixel: int,
+    bits: int = PEAK_BITS,
+    levels: int = ZOOM_LEVELS,
+) -> bytes:
+    data = zoom_levels(mins, maxs, levels)
+    index_end = HEADER.size + LEVEL.size * len(data)
+    header = [HEADER.pack(MAGIC, VERSION, bits, len(data), sample_rate)]
+    bodies = []
+    offset = index_end
+    for depth, (level_mins, level_maxs) in enumerate(data):
+        body = _interleave(level_mins, level_maxs, bits)
+        header.append(LEVEL.pack(samples_per_pixel << depth, len(level_mins), offset))
+        bodies.append(body)
+        offset += len(body)
+    return b"".join(header + bodies)
+
+
+def write_peaks(path: Path, analysis, bits: int = PEAK_BITS) -> int:
+    """Write the peaks file of ``analysis`` atomically; returns its size."""
+    payload = encode_peaks(
+        analysis.mins,
+        analysis.maxs,
+        analysis.sample_rate,
+        analysis.samples_per_pixel,
+        bits,
+    )
+    tmp = path.with_suffix(".peaks.tmp")
+    tmp.write_bytes(payload)
+    tmp.replace(path)
+    return len(payload)
+
+
+def read_index(fileobj: BinaryIO) -> Tuple[int, int, List[Level]]:
+    """``(bits, sample rate, levels)`` from the start of a peaks file."""
+    head = fileobj.read(HEADER.size)
+    if len(head) != HEADER.size:
+        raise WaveformFormatError("Truncated waveform header")
+    magic, version, bits, count, sample_rate = HEADER.unpack(head)
+    if magic != MAGIC or version != VERSION or bits not in (8, 16):
+        raise WaveformFormatError("Not a waveform peaks file")
+    raw = fileobj.read(LEVEL.size * count)
+    if len(raw) != LEVEL.size * count:
+        raise WaveformFormatError("Truncated waveform index")
+    levels = []
+    for i in range(count):
+        samples_per_pixel, pixels, offset = LEVEL.unpack_from(raw, i * LEVEL.size)
+        levels.append(Level(samples_per_pixel, pixels, offset, pixels * bits // 4))
+    return bits, sample_rate, levels
@@ -1,34 +1,57 @@
 """
 Celery tasks for media processing.
 
-This file registers start_pipeline_for_upload as a Celery task using
-the shared_task decorator so it can be called with .delay() from the
-GraphQL finalize mutation.
+Transcodes go through the TranscodeJob ledger: the finalize mutation calls
+schedule_transcode, and run_transcode_jobs (on the dedicated TRANSCODE_QUEUE
+queue) claims jobs with per-studio fairness and runs process_track. See
+apps.medias.services.transcode_queue.
 
 - Extract rich metadata (title, artist, album, year, genre) from input via ffprobe.
+- Measure loudness/true peak and the waveform in one decode (cached per source
+  content_hash), then encode at the studio loudness target with a linear
+  two-pass normalization (see apps.medias.services.audio_analysis).
+- Keep the upload as the track's RAW_ORIGINAL so READY tracks can be re-encoded
+  (renormalize_studio command).
 - Save extracted tags to Track fields if not already set or if they are empty.
 - Preserve metadata during transcoding with ffmpeg -map_metadata 0.
+- Follow the encode through ffmpeg -progress: percent/speed on the TranscodeJob,
+  cancellation, bounded stderr (see apps.medias.services.ffmpeg_progress).
 """
 
 from __future__ import annotations
 
+import datetime
 import json
 import logging
 import os
 import shutil
 import subprocess
+import time
+from decimal import Decimal
 from pathlib import Path
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 
 from celery import shared_task
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 
-from apps.medias.models import Track
+from apps.medias.models import Track, TrackAsset, TranscodeJob
+from apps.medias.services import (
+    audio_analysis,
+    ffmpeg_progress,
+    renditions,
+    transcode_queue,
+    waveform,
+)
 from apps.medias.services.paths import relpath_from_root, studio_paths
+from apps.medias.services.upload import DUPLICATE_COPY_FIELDS
 
 logger = logging.getLogger(__name__)
 
+# Most transcode workers woken by one schedule_transcodes call
+WAKE_MESSAGES_MAX = 16
+
 
 def resolve_bin(name: str, configured: str | None) -> str:
     """
@@ -48,8 +71,12 @@ def resolve_bin(name: str, configured: str | None) -> str:
     )
 
 
-def ffprobe_json(ffprobe: str, in_path: Path) -> Dict:
-    """Run ffprobe and return parsed JSON with format and streams info."""
+def ffprobe_json(ffprobe: str, in_path: Path, timeout: Optional[float] = None) -> Dict:
+    """
+    Run ffprobe and return parsed JSON with format and streams info.
+
+    Raises subprocess.TimeoutExpired after ``timeout`` seconds.
+    """
     proc = subprocess.run(
         [
             ffprobe,
@@ -64,6 +91,7 @@ def ffprobe_json(ffprobe: str, in_path: Path) -> Dict:
         capture_output=True,
         text=True,
         check=True,
+        timeout=timeout,
     )
     return json.loads(proc.stdout or "{}")
 
@@ -122,33 +150,155 @@ def extract_tags_from_probe(data: Dict) -> Tuple[float, Dict[str, str]]:
     return duration, tags
 
 
-@shared_task(bind=True, max_retries=2, soft_time_limit=60 * 60)
-def start_pipeline_for_upload(self, track_id: str):
-    """
-    Worker entry point: normalize/transcode incoming upload and atomically publish
-    to the studio library directory.
+def save_waveform(track: Track, waveform_dir: Path, analysis) -> TrackAsset:
+    """Write the analysis envelope as the track's WAVEFORM_PEAKS asset."""
+    out = waveform_dir / f"{track.id}.peaks"
+    size = waveform.write_peaks(out, analysis)
+    asset, _created = TrackAsset.objects.update_or_create(
+        track=track,
+        asset_type=TrackAsset.AssetType.WAVEFORM_PEAKS,
+        storage_key=relpath_from_root(out),
+        defaults={
+            "size_bytes": size,
+            "mime_type": "application/octet-stream",
+            "updated_at": timezone.now(),
+        },
+    )
+    return asset
+
 
-    Usage:
-        start_pipeline_for_upload.delay(str(track.id))
+def publish_renditions(track: Track, studio_root: Path, outputs) -> None:
     """
-    try:
-        track = Track.objects.select_related("studio", "upload_session").get(
-            id=track_id
+    Move encoded ``(rendition, path)`` outputs into the library as the
+    track's ALT_ENCODING assets; renditions no longer in the ladder are
+    removed.
+    """
+    keep = []
+    for rendition, work_path in outputs:
+        out_dir = renditions.rendition_dir(studio_root, rendition)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        out = out_dir / rendition.file_name(track.id)
+        work_path.replace(out)
+        storage_key = relpath_from_root(out)
+        keep.append(storage_key)
+        TrackAsset.objects.update_or_create(
+            track=track,
+            asset_type=TrackAsset.AssetType.ALT_ENCODING,
+            storage_key=storage_key,
+            defaults={
+                "size_bytes": out.stat().st_size,
+                "mime_type": rendition.mime_type,
+                "bitrate_kbps": rendition.bitrate_kbps,
+                "updated_at": timezone.now(),
+            },
         )
-    except Track.DoesNotExist:
-        logger.error("start_pipeline_for_upload: track not found: %s", track_id)
-        return
+    stale = track.assets.filter(asset_type=TrackAsset.AssetType.ALT_ENCODING).exclude(
+        storage_key__in=keep
+    )
+    for asset in stale:
+        (Path(settings.RADIO_STUDIOS_ROOT) / asset.storage_key).unlink(missing_ok=True)
+    stale.hard_delete()
 
-    studio = track.studio
+
+def _lower_priority() -> None:
+    # Runs in the ffmpeg child before exec: web and ingest keep the CPU first
+    os.nice(getattr(settings, "TRANSCODE_NICE", 10))
+
+
+def source_path(track: Track) -> Optional[Path]:
+    """
+    The file a transcode of ``track`` reads: its pending upload, else the
+    original kept when it was first published (RAW_ORIGINAL).
+    """
+    root = Path(settings.RADIO_STUDIOS_ROOT)
     up = track.upload_session
-    if not up or not up.temp_rel_path:
-        logger.error(
-            "start_pipeline_for_upload: missing upload session or temp path for track=%s",
-            track_id,
-        )
+    if up and up.temp_rel_path and (root / up.temp_rel_path).is_file():
+        return root / up.temp_rel_path
+    original = (
+        track.assets.filter(asset_type=TrackAsset.AssetType.RAW_ORIGINAL)
+        .order_by("-created_at")
+        .first()
+    )
+    if original and (root / original.storage_key).is_file():
+        return root / original.storage_key
+    return None
+
+
+def keep_original(track: Track, upload_path: Path, originals_dir: Path) -> None:
+    """
+    Move the consumed upload to ``originals/`` as the track's RAW_ORIGINAL.
+
+    An upload hard-linked to its source (``import_directory``) is copied
+    instead, so editing the imported file later cannot change the original.
+    """
+    out = originals_dir / f"{track.id}.src"
+    if upload_path.stat().st_nlink > 1:
+        shutil.copyfile(upload_path, out)
+        upload_path.unlink()
+    else:
+        upload_path.replace(out)
+    TrackAsset.objects.update_or_create(
+        track=track,
+        asset_type=TrackAsset.AssetType.RAW_ORIGINAL,
+        storage_key=relpath_from_root(out),
+        defaults={
+            "size_bytes": out.stat().st_size,
+            "checksum": track.content_hash,
+            "updated_at": timezone.now(),
+        },
+    )
+
+
+def _discard(outputs) -> None:
+    for _rendition, work_path in outputs:
+        work_path.unlink(missing_ok=True)
+
+
+def _remaining(deadline: float) -> float:
+    """Seconds left before ``deadline``; a spent budget kills the next run."""
+    return max(deadline - time.monotonic(), 0.001)
+
+
+def _fail(track: Track, message: str, republish: bool) -> None:
+    track.error_message = message[:4000]
+    update_fields = ["error_message", "updated_at"]
+    if not republish:
         track.state = Track.State.FAILED
-        track.save(update_fields=["state", "updated_at"])
-        return
+        update_fields.append("state")
+    track.save(update_fields=update_fields)
+
+
+def process_track(track: Track, job: Optional[TranscodeJob] = None) -> bool:
+    """
+    Normalize/transcode the source of ``track`` and atomically publish it to
+    the studio library directory.
+
+    A READY track is re-encoded in place (new loudness target or bitrate of
+    its studio) from its kept original and stays READY (and served) whatever
+    the outcome; its loudness comes from the LoudnessAnalysis cache.
+
+    ffprobe, the analysis decode and the encode share one TRANSCODE_TIMEOUT
+    budget, so a run never outlives the stale-job threshold of
+    ``run_transcode_jobs``.
+
+    Encode progress is written to ``job`` every TRANSCODE_PROGRESS_INTERVAL
+    seconds; when the job was canceled meanwhile ffmpeg is stopped and
+    TranscodeCanceled is raised.
+
+    Returns False when the job failed for a reason retrying will not fix
+    (missing source, missing binaries, ffmpeg rejected the input); a new
+    track is then marked FAILED. Unexpected errors and cancellation do the
+    same and are re-raised.
+    """
+    deadline = time.monotonic() + getattr(settings, "TRANSCODE_TIMEOUT", 3600)
+    track_id = track.id
+    studio = track.studio
+    republish = track.state == Track.State.READY and bool(track.processed_rel_path)
+    work_in = source_path(track)
+    if work_in is None:
+        logger.error("process_track: no upload or original for track=%s", track_id)
+        _fail(track, "Source file not found", republish)
+        return False
 
     # Resolve ffmpeg/ffprobe robustly
     try:
@@ -156,19 +306,17 @@ def start_pipeline_for_upload(self, track_id: str):
         ffprobe = resolve_bin("ffprobe", getattr(settings, "FFPROBE_PATH", None))
     except RuntimeError as e:
         logger.error("Binary resolution error: %s", e)
-        track.state = Track.State.FAILED
-        track.error_message = str(e)[:4000]
-        track.save(update_fields=["state", "error_message", "updated_at"])
-        return
+        _fail(track, str(e), republish)
+        return False
 
     target_kbps = getattr(studio, "default_bitrate_kbps", None) or getattr(
         settings, "DEFAULT_TARGET_BITRATE_KBPS", 128
     )
 
     paths = studio_paths(studio, target_kbps)
-    work_in = Path(settings.RADIO_STUDIOS_ROOT) / up.temp_rel_path
     work_out = paths.processing / f"{track.id}.mp3"
     final_out = paths.library_mp3 / f"{track.id}.mp3"
+    previous_rel_path = track.processed_rel_path
 
     try:
         # Ensure dirs
@@ -177,9 +325,10 @@ def start_pipeline_for_upload(self, track_id: str):
 
         # Probe input (best effort)
         duration = 0.0
+        probe_json: Dict = {}
         probed_tags: Dict[str, str] = {}
         try:
-            probe_json = ffprobe_json(ffprobe, work_in)
+            probe_json = ffprobe_json(ffprobe, work_in, timeout=_remaining(deadline))
             duration, probed_tags = extract_tags_from_probe(probe_json)
         except Exception as e:
             logger.warning("ffprobe failed for %s: %s", work_in, e)
@@ -220,42 +369,101 @@ def start_pipeline_for_upload(self, track_id: str):
             track.save(update_fields=dirty_fields)
 
         # Move to processing state
-        track.state = Track.State.PROCESSING
-        track.save(update_fields=["state", "updated_at"])
-
-        # ffmpeg normalize + re-encode; preserve metadata with -map_metadata 0
+        if not republish:
+            track.state = Track.State.PROCESSING
+            track.save(update_fields=["state", "updated_at"])
+
+        # One decode measures loudness/true peak and builds the waveform; the
+        # encode then applies the measured gain (two-pass, linear). The
+        # analysis is skipped when the source was measured before and the
+        # track already has its waveform
+        analysis = None
+        measured = None
+        if (
+            track.content_hash
+            and track.assets.filter(
+                asset_type=TrackAsset.AssetType.WAVEFORM_PEAKS
+            ).exists()
+        ):
+            measured = audio_analysis.cached_loudness(track.content_hash)
+        if measured is None:
+            try:
+                analysis = audio_analysis.analyze(
+                    ffmpeg,
+                    work_in,
+                    preexec_fn=_lower_priority,
+                    timeout=_remaining(deadline),
+                )
+            except (RuntimeError, OSError) as e:
+                logger.warning(
+                    "Analysis failed for %s, single-pass loudnorm: %s", work_in, e
+                )
+            measured = analysis.loudness if analysis else None
+            if measured is not None and track.content_hash:
+                audio_analysis.cache_loudness(track.content_hash, measured)
+
+        # ffmpeg normalize + re-encode every rendition from one decode;
+        # preserve metadata with -map_metadata 0
+        audio_filter = None
+        normalized_lufs = None
+        if studio.auto_normalize:
+            normalized_lufs = studio.loudness_target_lufs
+            audio_filter = audio_analysis.normalize_filter(
+                measured, target_i=float(normalized_lufs)
+            )
+        primary = renditions.Rendition(renditions.PRIMARY_CODEC, target_kbps)
+        outputs = [(primary, work_out)]
+        for rendition in renditions.extra_renditions(studio, target_kbps):
+            outputs.append(
+                (
+                    rendition,
+                    paths.processing / f"{rendition.codec}-{rendition.bitrate_kbps}-"
+                    f"{rendition.file_name(track.id)}",
+                )
+            )
         ff_cmd = [
             ffmpeg,
             "-y",
             "-i",
             str(work_in),
-            "-af",
-            "loudnorm=I=-14:TP=-1.5:LRA=11",
-            "-map_metadata",
-            "0",
-            "-c:a",
-            "libmp3lame",
-            "-b:a",
-            f"{target_kbps}k",
-            str(work_out),
+            "-threads",
+            str(getattr(settings, "TRANSCODE_FFMPEG_THREADS", 1)),
+            *renditions.encode_args(outputs, audio_filter, probe_json),
         ]
-        logger.info("Running ffmpeg: %s", " ".join(ff_cmd))
-        ff = subprocess.run(ff_cmd, capture_output=True, text=True)
 
+        def on_progress(progress: ffmpeg_progress.Progress) -> bool:
+            if job is None:
+                return True
+            return transcode_queue.report_progress(
+                job, progress.percent(duration), progress.speed
+            )
+
+        logger.info("Running ffmpeg: %s", " ".join(ff_cmd))
+        try:
+            ff = ffmpeg_progress.run(
+                ff_cmd,
+                on_progress,
+                interval=getattr(settings, "TRANSCODE_PROGRESS_INTERVAL", 5),
+                preexec_fn=_lower_priority,
+                timeout=_remaining(deadline),
+            )
+        except BaseException:
+            _discard(outputs)
+            raise
         if ff.returncode != 0:
+            _discard(outputs)
             logger.error(
                 "ffmpeg failed for %s: code=%s stderr=%s",
                 work_in,
                 ff.returncode,
-                ff.stderr[-4000:],
+                ff.stderr_tail,
             )
-            track.state = Track.State.FAILED
-            track.error_message = (ff.stderr or "")[:4000]
-            track.save(update_fields=["state", "error_message", "updated_at"])
-            return
+            _fail(track, ff.stderr_tail, republish)
+            return False
 
         # Atomic publish: replace is atomic on same filesystem
         work_out.replace(final_out)
+        publish_renditions(track, paths.root, outputs[1:])
 
         # Update Track
         processed_path = relpath_from_root(final_out).replace(studio.slug + "/", "")
@@ -263,6 +471,13 @@ def start_pipeline_for_upload(self, track_id: str):
         track.bitrate_kbps = target_kbps
         track.state = Track.State.READY
         track.processed_rel_path = processed_path
+        track.file_name = final_out.name
+        track.normalized_lufs = normalized_lufs
+        if measured is not None:
+            track.loudness_lufs = round(Decimal(measured.input_i), 2)
+            track.peak_dbfs = round(Decimal(measured.input_tp), 2)
+            track.loudness_range_lu = round(Decimal(measured.input_lra), 2)
+        track.error_message = ""
         track.updated_at = timezone.now()
         track.save(
             update_fields=[
@@ -270,31 +485,191 @@ def start_pipeline_for_upload(self, track_id: str):
                 "bitrate_kbps",
                 "state",
                 "processed_rel_path",
+                "file_name",
+                "normalized_lufs",
+                "loudness_lufs",
+                "peak_dbfs",
+                "loudness_range_lu",
+                "error_message",
                 "updated_at",
             ]
         )
+        if analysis is not None and analysis.mins:
+            save_waveform(track, paths.waveform, analysis)
+        if republish:
+            # Duplicates share the published file
+            Track.objects.filter(is_duplicate_of=track, state=Track.State.READY).update(
+                **{field: getattr(track, field) for field in DUPLICATE_COPY_FIELDS},
+                updated_at=track.updated_at,
+            )
+            if previous_rel_path and previous_rel_path != processed_path:
+                # Published at another bitrate before
+                (paths.root / previous_rel_path).unlink(missing_ok=True)
 
-        # Cleanup incoming temp file
-        try:
-            work_in.unlink(missing_ok=True)
-        except Exception as e:
-            logger.debug("cleanup incoming failed: %s", e)
+        if not republish:
+            # Keep (or drop) the consumed upload
+            try:
+                if getattr(settings, "KEEP_ORIGINALS", True):
+                    keep_original(track, work_in, paths.originals)
+                else:
+                    work_in.unlink(missing_ok=True)
+            except Exception as e:
+                logger.warning("Keeping upload of %s failed: %s", track_id, e)
 
         logger.info(
             "Processing finished for track %s (studio=%s)", track_id, studio.slug
         )
+        return True
+
+    except ffmpeg_progress.TranscodeCanceled:
+        logger.info("Transcode of track %s canceled", track_id)
+        _fail(track, "Transcode canceled", republish)
+        raise
 
     except Exception as exc:
-        # Retry with exponential backoff for transient errors
-        logger.exception(
-            "Unhandled error in start_pipeline_for_upload for %s", track_id
+        logger.exception("Unhandled error while processing track %s", track_id)
+        _fail(track, str(exc), republish)
+        raise
+
+
+def schedule_transcode(track: Track, attempt: int = 1):
+    """
+    Queue a transcode job for ``track`` and wake a transcode worker once the
+    current transaction commits.
+    """
+    job = transcode_queue.enqueue_job(track, attempt=attempt)
+    transaction.on_commit(run_transcode_jobs.delay)
+    return job
+
+
+def schedule_transcodes(tracks: Sequence[Track]) -> List[TranscodeJob]:
+    """
+    ``schedule_transcode`` for many new PENDING tracks: the jobs are inserted
+    in one query and at most WAKE_MESSAGES_MAX workers are woken (each one
+    keeps claiming jobs until the queue is empty).
+    """
+    jobs = transcode_queue.enqueue_jobs(tracks)
+
+    def wake():
+        for _ in range(min(len(jobs), WAKE_MESSAGES_MAX)):
+            run_transcode_jobs.delay()
+
+    transaction.on_commit(wake)
+    return jobs
+
+
+def _run_job(job: TranscodeJob) -> None:
+    try:
+        track = Track.objects.select_related("studio", "upload_session").get(
+            id=job.track_id
         )
-        track.state = Track.State.FAILED
-        track.error_message = str(exc)[:4096]
-        track.save(update_fields=["state", "error_message", "updated_at"])
-        try:
-            # attempt retry (Celery will handle max_retries)
-            raise self.retry(exc=exc, countdown=30)
-        except self.MaxRetriesExceededError:
-            logger.error("Max retries exceeded for track %s", track_id)
+    except Track.DoesNotExist:
+        transcode_queue.finish_job(
+            job, TranscodeJob.Status.CANCELED, "Track deleted before transcoding"
+        )
+        return
+
+    try:
+        ok = process_track(track, job)
+    except ffmpeg_progress.TranscodeCanceled:
+        transcode_queue.finish_job(
+            job, TranscodeJob.Status.CANCELED, "Canceled while running"
+        )
+        return
+    except Exception as exc:
+        if not transcode_queue.finish_job(job, TranscodeJob.Status.FAILED, str(exc)):
+            # Canceled or requeued meanwhile: no retry from here
+            return
+        if job.attempt < settings.TRANSCODE_MAX_ATTEMPTS:
+            # A new ledger row per attempt, queued after the retry delay
+            retry_transcode.apply_async(
+                (str(track.id), job.attempt + 1),
+                countdown=settings.TRANSCODE_RETRY_DELAY,
+            )
+        else:
+            logger.error("Max attempts reached for track %s", track.id)
+        return
+
+    job.target_bitrate_kbps = track.bitrate_kbps
+    job.output_storage_key = track.processed_rel_path
+    job.loudness_lufs = track.loudness_lufs
+    job.peak_dbfs = track.peak_dbfs
+    outputs = (
+        "target_bitrate_kbps",
+        "output_storage_key",
+        "loudness_lufs",
+        "peak_dbfs",
+    )
+    if ok:
+        # Only a job still RUNNING is marked SUCCESS (like report_progress)
+        if not transcode_queue.finish_job(
+            job, TranscodeJob.Status.SUCCESS, extra_fields=outputs
+        ):
+            logger.info(
+                "Job %s of track %s was %s before it finished",
+                job.pk,
+                track.id,
+                job.status,
+            )
+    else:
+        transcode_queue.finish_job(
+            job,
+            TranscodeJob.Status.FAILED,
+            track.error_message or "Processing failed",
+            extra_fields=outputs,
+        )
+
+
+@shared_task(ignore_result=True)
+def run_transcode_jobs():
+    """
+    Transcode worker loop (routed to the TRANSCODE_QUEUE queue).
+
+    Claims and runs jobs one at a time, fairest first, until none is queued.
+    Messages only wake workers: one sent per queued job, and beat sends one
+    every TRANSCODE_KICK_INTERVAL in case some were lost; a message finding
+    nothing to do returns immediately. Each job is bounded by
+    TRANSCODE_TIMEOUT (probe, analysis and encode together).
+    """
+    worker = transcode_queue.worker_id()
+    stale = transcode_queue.requeue_stale_jobs(
+        datetime.timedelta(seconds=settings.TRANSCODE_TIMEOUT * 2)
+    )
+    if stale:
+        logger.warning("Requeued %d transcode jobs of dead workers", stale)
+    while True:
+        job = transcode_queue.claim_next_job(worker)
+        if job is None:
+            return
+        logger.info(
+            "Transcode job %s claimed (track=%s studio=%s attempt=%s wait=%.1fs)",
+            job.id,
+            job.track_id,
+            job.studio_id,
+            job.attempt,
+            (job.started_at - job.created_at).total_seconds(),
+        )
+        _run_job(job)
+
+
+@shared_task(ignore_result=True)
+def retry_transcode(track_id: str, attempt: int):
+    track = Track.objects.filter(id=track_id).first()
+    if track is None:
+        return
+    schedule_transcode(track, attempt=attempt)
+
+
+@shared_task(ignore_result=True)
+def start_pipeline_for_upload(track_id: str):
+    """
+    Queue a transcode job for a track.
+
+    Kept for messages sent before transcodes went through the TranscodeJob
+    ledger; new code calls ``schedule_transcode``.
+    """
+    track = Track.objects.filter(id=track_id).first()
+    if track is None:
+        logger.error("start_pipeline_for_upload: track not found: %s", track_id)
         return
+    schedule_transcode(track)
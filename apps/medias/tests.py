@@ -1,3 +1,203 @@
-from django.test import TestCase
+import datetime
+import io
+import struct
+import uuid
+from array import array
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from apps.medias.models import Track
+from apps.medias.services.renditions import Rendition, choose, preferred_codec
+from apps.medias.services.streaming import RangeNotSatisfiable, parse_range
+from apps.medias.services.track_pages import (
+    InvalidCursor,
+    decode_cursor,
+    encode_cursor,
+    keyset_page,
+)
+from apps.medias.services.waveform import WaveformFormatError, encode_peaks, read_index
+from apps.studio.models import Studio
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_closed_range(self):
+        self.assertEqual(parse_range("bytes=0-99", 1000), (0, 99))
+
+    def test_end_clamped_to_size(self):
+        self.assertEqual(parse_range("bytes=900-5000", 1000), (900, 999))
+
+    def test_open_ended(self):
+        self.assertEqual(parse_range("bytes=500-", 1000), (500, 999))
+
+    def test_suffix(self):
+        self.assertEqual(parse_range("bytes=-100", 1000), (900, 999))
+
+    def test_suffix_longer_than_file(self):
+        self.assertEqual(parse_range("bytes=-5000", 1000), (0, 999))
+
+    def test_start_past_end_unsatisfiable(self):
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range("bytes=1000-", 1000)
+
+    def test_empty_suffix_unsatisfiable(self):
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range("bytes=-0", 1000)
+
+    def test_suffix_of_empty_file_unsatisfiable(self):
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range("bytes=-10", 0)
+
+    def test_ignored_headers(self):
+        for header in ("", "bytes=-", "bytes=5-1", "items=0-1", "bytes=0-1,5-6"):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range(header, 1000))
+
+
+class PreferredCodecTests(SimpleTestCase):
+    def test_explicit_type_above_mp3(self):
+        self.assertEqual(preferred_codec("audio/ogg, audio/mpeg;q=0.8"), "opus")
+
+    def test_alias(self):
+        self.assertEqual(preferred_codec("audio/aac"), "aac")
+
+    def test_mp3_ranked_higher(self):
+        self.assertIsNone(preferred_codec("audio/mpeg, audio/mp4;q=0.5"))
+
+    def test_wildcards_keep_primary(self):
+        for accept in ("", "*/*", "audio/*", "audio/*, audio/ogg;q=0.5"):
+            with self.subTest(accept=accept):
+                self.assertIsNone(preferred_codec(accept))
+
+
+class ChooseTests(SimpleTestCase):
+    available = [
+        (Rendition("mp3", 128), "mp3-128"),
+        (Rendition("mp3", 64), "mp3-64"),
+        (Rendition("aac", 96), "aac-96"),
+    ]
+
+    def test_highest_bitrate_by_default(self):
+        self.assertEqual(choose(self.available)[1], "mp3-128")
+
+    def test_codec(self):
+        self.assertEqual(choose(self.available, codec="aac")[1], "aac-96")
+
+    def test_highest_not_above_kbps(self):
+        self.assertEqual(choose(self.available, kbps=100)[1], "aac-96")
+        self.assertEqual(choose(self.available, codec="mp3", kbps=100)[1], "mp3-64")
+
+    def test_lowest_when_all_above_kbps(self):
+        self.assertEqual(choose(self.available, kbps=32)[1], "mp3-64")
+
+    def test_missing_codec(self):
+        self.assertIsNone(choose(self.available, codec="opus"))
+
+
+class WaveformPeaksTests(SimpleTestCase):
+    mins = array("h", [-1000, -32768, -256, -5, -20000])
+    maxs = array("h", [1000, 32767, 256, 5, 20000])
+
+    def test_round_trip_16_bits(self):
+        payload = encode_peaks(self.mins, self.maxs, 22050, 256, bits=16, levels=3)
+        bits, sample_rate, levels = read_index(io.BytesIO(payload))
+        self.assertEqual((bits, sample_rate), (16, 22050))
+        self.assertEqual([lvl.samples_per_pixel for lvl in levels], [256, 512, 1024])
+        self.assertEqual([lvl.pixels for lvl in levels], [5, 3, 2])
+        self.assertEqual(levels[-1].offset + levels[-1].length, len(payload))
+
+        first = levels[0]
+        pairs = struct.unpack_from(f"<{2 * first.pixels}h", payload, first.offset)
+        self.assertEqual(list(pairs[0::2]), list(self.mins))
+        self.assertEqual(list(pairs[1::2]), list(self.maxs))
+        # Pairs of pixels merged, the odd last one carried over
+        second = levels[1]
+        pairs = struct.unpack_from(f"<{2 * second.pixels}h", payload, second.offset)
+        self.assertEqual(pairs, (-32768, 32767, -256, 256, -20000, 20000))
+
+    def test_8_bits_keeps_top_byte(self):
+        payload = encode_peaks(self.mins, self.maxs, 22050, 256, bits=8, levels=1)
+        bits, _sample_rate, (level,) = read_index(io.BytesIO(payload))
+        self.assertEqual((bits, level.length), (8, 10))
+        values = struct.unpack_from("<10b", payload, level.offset)
+        self.assertEqual(values[:4], (-4, 3, -128, 127))
+
+    def test_not_a_peaks_file(self):
+        with self.assertRaises(WaveformFormatError):
+            read_index(io.BytesIO(b"RIFF" + bytes(16)))
+        with self.assertRaises(WaveformFormatError):
+            read_index(io.BytesIO(encode_peaks(self.mins, self.maxs, 1, 1)[:20]))
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        created_at = datetime.datetime(2026, 3, 1, 12, 30, 5, 123456, datetime.UTC)
+        pk = uuid.uuid4()
+        self.assertEqual(decode_cursor(encode_cursor(created_at, pk)), (created_at, pk))
+
+    def test_invalid(self):
+        for cursor in ("", "not-a-cursor", encode_cursor(timezone.now(), "x")):
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                decode_cursor(cursor)
+
+
+class KeysetPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        studio = Studio.objects.create(slug="pages", display_name="Pages")
+        start = timezone.now()
+        # Two tracks share each created_at: id breaks the tie
+        cls.tracks = [
+            Track.objects.create(
+                studio=studio,
+                title=f"t{i}",
+                content_hash=f"{i:064x}",
+                created_at=start - datetime.timedelta(seconds=i // 2),
+            )
+            for i in range(7)
+        ]
+        cls.newest_first = sorted(
+            cls.tracks, key=lambda t: (t.created_at, t.id), reverse=True
+        )
+        cls.qs = Track.objects.filter(studio=studio)
+
+    def cursor(self, track):
+        return encode_cursor(track.created_at, track.pk)
+
+    def test_forward(self):
+        rows, has_previous, has_next = keyset_page(self.qs, first=3)
+        self.assertEqual(rows, self.newest_first[:3])
+        self.assertEqual((has_previous, has_next), (False, True))
+
+        rows, has_previous, has_next = keyset_page(
+            self.qs, first=3, after=self.cursor(rows[-1])
+        )
+        self.assertEqual(rows, self.newest_first[3:6])
+        self.assertEqual((has_previous, has_next), (True, True))
+
+        rows, has_previous, has_next = keyset_page(
+            self.qs, first=3, after=self.cursor(rows[-1])
+        )
+        self.assertEqual(rows, self.newest_first[6:])
+        self.assertEqual((has_previous, has_next), (True, False))
+
+    def test_backward(self):
+        rows, has_previous, has_next = keyset_page(self.qs, last=3)
+        self.assertEqual(rows, self.newest_first[-3:])
+        self.assertEqual((has_previous, has_next), (True, False))
+
+        rows, has_previous, has_next = keyset_page(
+            self.qs, last=3, before=self.cursor(rows[0])
+        )
+        self.assertEqual(rows, self.newest_first[1:4])
+        self.assertEqual((has_previous, has_next), (True, True))
+
+        rows, has_previous, has_next = keyset_page(
+            self.qs, last=3, before=self.cursor(rows[0])
+        )
+        self.assertEqual(rows, self.newest_first[:1])
+        self.assertEqual((has_previous, has_next), (False, True))
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            keyset_page(self.qs, first=3, after="bogus")
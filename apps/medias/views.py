@@ -1,7 +1,11 @@
 import re
+import secrets
 from pathlib import Path
 
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
 from django.http import (
     FileResponse,
     Http404,
@@ -9,28 +13,79 @@ from django.http import (
     HttpResponseBadRequest,
     HttpResponseForbidden,
     HttpResponseNotAllowed,
+    JsonResponse,
 )
-from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_GET
 
-from apps.medias.models import UploadSession
-from apps.medias.models.track import Track
-from apps.medias.services.upload import append_chunk
-from apps.studio.models import Studio
+from apps.medias.models.track import Track, TrackAsset
+from apps.medias.services import renditions, upload_progress, waveform
+from apps.medias.services.streaming import (
+    TRACK_SERVE_FIELDS,
+    FileRange,
+    file_response,
+    track_cache_control,
+    track_renditions,
+    track_validators,
+)
+from apps.medias.services.upload import (
+    UploadConflictError,
+    UploadRangeError,
+    UploadTooLargeError,
+    append_chunk,
+    received_bytes,
+)
 
 CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
 
 
+def _chunk_body(request, length: int):
+    """
+    Stream to read a chunk of ``length`` bytes from.
+
+    Django's request only offers ``read``. When the body has not been touched
+    yet, the WSGI input supports ``readinto`` (wsgiref's buffered socket
+    reader does, gunicorn's body reader does not) and Content-Length covers
+    the chunk, the input is read directly so ``write_body`` can fill its
+    reusable buffer.
+    """
+    wsgi_input = request.META.get("wsgi.input")
+    try:
+        content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        content_length = 0
+    if (
+        hasattr(wsgi_input, "readinto")
+        and not getattr(request, "_read_started", True)
+        and content_length >= length
+    ):
+        return wsgi_input
+    return request
+
+
 @csrf_exempt
+@transaction.non_atomic_requests
 def upload_chunk_view(request, upload_id):
+    """
+    Write one chunk of a resumable upload.
+
+    Runs outside ATOMIC_REQUESTS: with a progress backend most chunks do not
+    touch the database at all, and range checkpoints take their own row lock.
+    """
     if request.method != "PUT":
         return HttpResponseNotAllowed(["PUT"])
 
-    upload = get_object_or_404(UploadSession, id=upload_id, finalized=False)
+    try:
+        ticket = upload_progress.get_ticket(upload_id)
+    except ValidationError:
+        ticket = None
+    if ticket is None:
+        raise Http404("Upload not found")
 
     token = request.headers.get("X-Upload-Token", "")
-    if not token or token != upload.upload_token:
+    if not token or not secrets.compare_digest(token, ticket.upload_token):
         return HttpResponseForbidden("Invalid upload token")
 
     cr = request.headers.get("Content-Range", "")
@@ -41,28 +96,193 @@ def upload_chunk_view(request, upload_id):
         return HttpResponseBadRequest("Invalid Content-Range header format")
     start, end, total = map(int, m.groups())
 
-    size = append_chunk(upload, start, end, total, request)
-    return HttpResponse({"received": size})
+    try:
+        ranges = append_chunk(
+            ticket, start, end, total, _chunk_body(request, end - start + 1)
+        )
+    except UploadRangeError as e:
+        return HttpResponse(str(e), status=416)
+    except UploadConflictError as e:
+        return HttpResponse(str(e), status=409)
+    except UploadTooLargeError as e:
+        return HttpResponse(str(e), status=413)
+    return JsonResponse(
+        {
+            "received": received_bytes(ranges),
+            "complete": ranges == [[0, total]],
+            "ranges": ranges,
+        }
+    )
+
+
+def _pick_rendition(request, track: Track):
+    """
+    ``(rendition, path, negotiated)`` asked for by ``?codec=``/``?kbps=`` or
+    the Accept header; rendition and path are None for the primary MP3.
+    ``negotiated`` is True when Accept decided (the response varies on it).
+    Raises Http404 for an unknown or missing explicit codec.
+    """
+    codec = request.GET.get("codec", "").lower() or None
+    kbps = request.GET.get("kbps", "")
+    kbps = int(kbps) if kbps.isdigit() else None
+    negotiated = codec is None
+    if codec is None:
+        codec = renditions.preferred_codec(request.headers.get("Accept", ""))
+    elif codec not in renditions.CODECS:
+        raise Http404("Rendition not found")
+    if codec is None and kbps is None:
+        return None, None, negotiated
+
+    available = track_renditions(track)
+    picked = renditions.choose(available, codec or renditions.PRIMARY_CODEC, kbps)
+    if picked is None:
+        if not negotiated:
+            raise Http404("Rendition not found")
+        # Preferred codec not produced for this track
+        picked = renditions.choose(available, renditions.PRIMARY_CODEC, kbps)
+    rendition, path = picked
+    if path is None:
+        return None, None, negotiated
+    return rendition, path, negotiated
 
 
 @require_GET
 def serve_track(request, studio_slug, track_id):
-    """Serve MP3 files for streaming"""
+    """
+    Serve a processed track for streaming.
+
+    The primary MP3 by default; another rendition of the studio's ladder
+    with ``?codec=mp3|aac|opus`` and/or ``?kbps=`` (highest bitrate not above
+    it), or when the Accept header prefers AAC/Opus over MP3. ``?v=`` is the
+    track's ``streamVersion``: only versioned URLs are cached as immutable.
+
+    Supports single byte ranges so players can seek without re-downloading
+    the file; see ``apps.medias.services.streaming`` for the delivery modes.
+    Conditional requests are answered with 304 from the database alone,
+    before the file is touched.
+    """
     try:
-        track = Track.objects.get(id=track_id, studio__slug=studio_slug)
+        track = Track.objects.only(*TRACK_SERVE_FIELDS).get(
+            id=track_id, studio__slug=studio_slug
+        )
+    except (Track.DoesNotExist, ValidationError):
+        raise Http404("Track not found")
+    if not track.processed_rel_path:
+        raise Http404("Track not found")
+
+    rendition, file_path, negotiated = _pick_rendition(request, track)
+    etag, last_modified = track_validators(track, rendition)
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if not_modified is not None:
+        not_modified["ETag"] = etag
+        if last_modified is not None:
+            not_modified["Last-Modified"] = http_date(last_modified)
+        not_modified["Cache-Control"] = track_cache_control(track, request.GET.get("v"))
+        if negotiated:
+            patch_vary_headers(not_modified, ["Accept"])
+        return not_modified
+
+    if file_path is None:
         file_path = (
             Path(settings.RADIO_STUDIOS_ROOT) / studio_slug / track.processed_rel_path
         )
-        print("Serving track from:", file_path)
-        print(file_path)
-        if not file_path.exists() or not file_path.is_file():
-            raise Http404("Track not found")
-
-        # Serve with proper headers for audio streaming
-        response = FileResponse(open(file_path, 'rb'), content_type='audio/mpeg')
-        response['Accept-Ranges'] = 'bytes'
-        response['Content-Disposition'] = f'inline; filename="{track.title}"'
-
-        return response
-    except Studio.DoesNotExist:
-        raise Http404("Studio not found")
+    if not file_path.is_file():
+        raise Http404("Track not found")
+
+    response = file_response(
+        request,
+        file_path,
+        content_type=rendition.mime_type if rendition else "audio/mpeg",
+        etag=etag,
+        last_modified=last_modified,
+    )
+    response['Content-Disposition'] = f'inline; filename="{track.title}"'
+    response["Cache-Control"] = track_cache_control(track, request.GET.get("v"))
+    if negotiated:
+        patch_vary_headers(response, ["Accept"])
+    return response
+
+
+@require_GET
+def serve_waveform(request, studio_slug, track_id):
+    """
+    Serve a track's waveform peaks (``apps.medias.services.waveform``).
+
+    ``?zoom=N`` answers with the min/max pairs of level N only (0 is the
+    finest), described by ``X-Waveform-*`` headers; without it the whole
+    file is sent (ranges supported), index included. A duplicate is served
+    the waveform of the track it duplicates.
+    """
+    zoom = request.GET.get("zoom")
+    if zoom is not None and not zoom.isdigit():
+        return HttpResponseBadRequest("zoom must be a level number")
+    try:
+        asset = (
+            TrackAsset.objects.filter(
+                # The requested track must be alive, not the one it duplicates
+                Q(track_id=track_id, track__deleted_at__isnull=True)
+                | Q(
+                    track__duplicates__id=track_id,
+                    track__duplicates__deleted_at__isnull=True,
+                ),
+                track__studio__slug=studio_slug,
+                asset_type=TrackAsset.AssetType.WAVEFORM_PEAKS,
+            )
+            .values("storage_key", "updated_at", "track__content_hash")
+            .first()
+        )
+    except ValidationError:
+        asset = None
+    if asset is None:
+        raise Http404("Waveform not found")
+
+    # Peaks only depend on the source bytes
+    etag = f'"{asset["track__content_hash"]}-peaks-{zoom if zoom else "all"}"'
+    last_modified = int(asset["updated_at"].timestamp())
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if not_modified is not None:
+        not_modified["ETag"] = etag
+        return not_modified
+
+    file_path = Path(settings.RADIO_STUDIOS_ROOT) / asset["storage_key"]
+    if not file_path.is_file():
+        raise Http404("Waveform not found")
+    if zoom is None:
+        response = file_response(
+            request,
+            file_path,
+            content_type="application/octet-stream",
+            etag=etag,
+            last_modified=last_modified,
+        )
+    else:
+        fileobj = open(file_path, "rb")
+        try:
+            bits, sample_rate, levels = waveform.read_index(fileobj)
+        except waveform.WaveformFormatError:
+            fileobj.close()
+            raise Http404("Waveform not found")
+        if int(zoom) >= len(levels):
+            fileobj.close()
+            raise Http404("Zoom level not found")
+        level = levels[int(zoom)]
+        response = FileResponse(
+            FileRange(fileobj, level.offset, level.length),
+            content_type="application/octet-stream",
+        )
+        response["Content-Length"] = str(level.length)
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        response["X-Waveform-Bits"] = str(bits)
+        response["X-Waveform-Sample-Rate"] = str(sample_rate)
+        response["X-Waveform-Samples-Per-Pixel"] = str(level.samples_per_pixel)
+        response["X-Waveform-Pixels"] = str(level.pixels)
+        response["X-Waveform-Levels"] = str(len(levels))
+    response["Cache-Control"] = (
+        f"public, max-age={settings.TRACK_CACHE_MAX_AGE}, immutable"
+    )
+    return response
@@ -1,17 +1,33 @@
-import datetime
+import gzip
 import json
-import uuid
+import zlib
 
 from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
 from django.db import transaction
 from django.http import HttpRequest, JsonResponse
 from django.utils import timezone
-from django.utils.dateparse import parse_datetime
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 
-from apps.studio.models import ListenerSession, ListenerStatBucket, Studio
+from apps.studio.models import Studio
+from apps.studio.services import ingest_queue, presence
 from apps.studio.services.helpers import get_studio
+from apps.studio.services.ingest import (
+    BodyTooLarge,
+    BoundedReader,
+    apply_listener_payload,
+    clean_listener_records,
+    iter_listener_batches,
+    iter_ndjson,
+    parse_session,
+)
+
+NDJSON_CONTENT_TYPES = {
+    "application/x-ndjson",
+    "application/ndjson",
+    "application/jsonl",
+}
 
 
 def server_response(message: str, status_code: int = 200) -> JsonResponse:
@@ -28,12 +44,6 @@ def server_response(message: str, status_code: int = 200) -> JsonResponse:
     return JsonResponse({"message": message}, status=status_code)
 
 
-def _parse_iso(dt_str: str):
-    if dt_str is None:
-        return None
-    return parse_datetime(dt_str)
-
-
 def _bearer_token(req: HttpRequest) -> str:
     auth_header = req.META.get("HTTP_AUTHORIZATION", "")
     if auth_header.startswith("Bearer "):
@@ -43,10 +53,14 @@ def _bearer_token(req: HttpRequest) -> str:
 
 @csrf_exempt
 @require_POST
+@transaction.non_atomic_requests
 def ingest_listener_events(request: HttpRequest, studio_slug: str) -> JsonResponse:
     """
     Endpoint to ingest listener events for a specific studio.
 
+    Runs outside ATOMIC_REQUESTS: writes take their own short transactions,
+    none of them open while the request body is still being read.
+
     Args:
         request (HttpRequest): The incoming HTTP request.
         studio_slug (str): The slug or ID of the studio.
@@ -63,136 +77,154 @@ def ingest_listener_events(request: HttpRequest, studio_slug: str) -> JsonRespon
     # if not token or token != expected:
     #     return server_response("Not authorized", status_code=401)
 
+    content_encoding = request.headers.get("Content-Encoding", "").strip().lower()
+    if content_encoding not in ("", "identity", "gzip"):
+        return server_response("Unsupported Content-Encoding", status_code=415)
+    gzipped = content_encoding == "gzip"
+
+    if request.content_type in NDJSON_CONTENT_TYPES:
+        studio = get_studio(studio_slug)
+        if not studio:
+            return server_response("Studio not found", status_code=404)
+        try:
+            return _ingest_ndjson(studio, _body_stream(request, gzipped))
+        except BodyTooLarge as e:
+            return server_response(str(e), status_code=413)
+        except (OSError, EOFError, zlib.error):
+            return server_response("Invalid gzip body", status_code=400)
+
     try:
-        payload = json.loads(request.body.decode("utf-8"))
+        if gzipped:
+            payload = json.loads(_body_stream(request, gzipped).read())
+        else:
+            payload = json.loads(request.body.decode("utf-8"))
+    except (BodyTooLarge, RequestDataTooBig) as e:
+        return server_response(str(e), status_code=413)
     except Exception:
         return server_response("Invalid JSON payload", status_code=400)
     studio = get_studio(studio_slug)
     if not studio:
         return server_response("Studio not found", status_code=404)
 
+    if not isinstance(payload, dict):
+        return server_response("Invalid JSON payload", status_code=400)
     sessions = payload.get("sessions") or []
     buckets = payload.get("buckets") or []
-
-    inserted_sessions = 0
-    updated_sessions = 0
-    upserted_buckets = 0
+    if not isinstance(sessions, list) or not isinstance(buckets, list):
+        return server_response("sessions and buckets must be lists", status_code=400)
 
     now = timezone.now()
-    GRACE_PERIOD = datetime.timedelta(seconds=20)
+    _record_presence(studio, sessions, now)
+
+    if getattr(settings, "INGEST_ASYNC", False):
+        # Only queue what the drain can write
+        sessions, buckets, _dropped = clean_listener_records(sessions, buckets)
+        ingest_queue.enqueue(
+            ingest_queue.KIND_LISTENER,
+            studio.pk,
+            {"sessions": sessions, "buckets": buckets},
+        )
+        return JsonResponse(
+            {
+                "ok": True,
+                "queued": True,
+                "studio": str(studio.pk),
+                "sessions": len(sessions),
+                "buckets": len(buckets),
+            },
+            status=202,
+        )
 
     with transaction.atomic():
-        # Upsert ListenerSession by explicit UUID (client-provided)
-        for s in sessions:
-            s_id = s.get("id")
-            if not s_id:
-                continue
-            try:
-                s_id_uuid = uuid.UUID(s_id)
-            except Exception:
-                s_id_uuid = uuid.uuid4
-
-            started_at = _parse_iso(s.get("started_at")) or None
-            ended_at = _parse_iso(s.get("ended_at")) or None
-
-            defaults = {
-                "studio": studio,
-                "ip_hash": s.get("ip_hash", ""),
-                "user_agent": s.get("user_agent", ""),
-                "client_type": s.get("client_type", ""),
-                "country": s.get("country", ""),
-                "region": s.get("region", ""),
-                "city": s.get("city", ""),
-                "lat": s.get("lat", None),
-                "lon": s.get("lon", None),
-                "total_bytes": int(s.get("total_bytes", 0)),
-            }
-
-            if started_at:
-                defaults["started_at"] = started_at
-            if ended_at:
-                defaults["ended_at"] = ended_at
-            session, created = ListenerSession.objects.update_or_create(
-                pk=s_id_uuid, defaults=defaults
-            )
-            if created:
-                inserted_sessions += 1
-            else:
-                changed = False
-                for k, v in defaults.items():
-                    if k == "total_bytes":
-                        new_val = max(getattr(session, k) or 0, int(v or 0))
-                    else:
-                        new_val = v
-                    if getattr(session, k) != new_val:
-                        setattr(session, k, new_val)
-                        changed = True
-                if changed:
-                    session.save(update_fields=list(defaults.keys()))
-                updated_sessions += 1
-
-            # Always reflesh last_seen to now on any heartbeat
-            ListenerSession.objects.filter(pk=session.pk).update(last_seen=now)
-
-        # Upsert ListenerStatBucket by unique (studio, interval, bucket_start)
-        for b in buckets:
-            interval = (b.get("interval", "")).upper()
-            if interval not in {"MINUTE", "FIVE_MIN", "HOUR"}:
-                continue
-            bucket_start = _parse_iso(b.get("bucket_start"))
-            if not interval or not bucket_start:
-                continue
-
-            active_peak = int(b.get("active_peak", 0))
-            listener_minutes = int(b.get("listener_minutes", 0))
-            countries = b.get("countries_json", {})
-
-            obj, created = ListenerStatBucket.objects.update_or_create(
-                studio=studio,
-                interval=interval,
-                bucket_start=bucket_start,
-                defaults={
-                    "active_peak": active_peak,
-                    "listener_minutes": listener_minutes,
-                    "countries_json": countries,
-                },
-            )
-            if not created:
-                updated = False
-                if active_peak > obj.active_peak:
-                    obj.active_peak = active_peak
-                    updated = True
-                if listener_minutes:
-                    obj.listener_minutes = listener_minutes
-                    updated = True
-                if isinstance(countries, dict) and countries:
-                    merged = dict(obj.countries_json or {})
-                    for country, count in countries.items():
-                        try:
-                            merged[country] = int(merged.get(country, 0)) + int(
-                                count or 0
-                            )
-                        except Exception:
-                            continue
-                    obj.countries_json = merged
-                    updated = True
-                if updated:
-                    obj.save(
-                        update_fields=[
-                            "active_peak",
-                            "listener_minutes",
-                            "countries_json",
-                        ]
-                    )
-            upserted_buckets += 1
+        counts = apply_listener_payload(studio, sessions, buckets, now)
+
+    return JsonResponse({"ok": True, "studio": str(studio.pk), **counts}, status=200)
+
+
+def _body_stream(request: HttpRequest, gzipped: bool) -> BoundedReader:
+    """The request body, gunzipped when needed, capped after decoding."""
+    stream = gzip.GzipFile(fileobj=request, mode="rb") if gzipped else request
+    return BoundedReader(
+        stream,
+        settings.LISTENER_INGEST_MAX_BYTES,
+        settings.LISTENER_INGEST_MAX_LINE_BYTES,
+    )
+
+
+def _record_presence(studio: Studio, sessions, now) -> None:
+    """Stamp the heartbeat sessions in the live presence store (if enabled)."""
+    presence.record_sessions(
+        studio, [row for row in map(parse_session, sessions) if row is not None], now
+    )
+
+
+def _ingest_ndjson(studio: Studio, stream) -> JsonResponse:
+    """
+    Consume a newline-delimited body one record at a time.
+
+    Records are handed to the upsert stage in batches of
+    LISTENER_INGEST_BATCH_SIZE, so only one batch is in memory at a time.
+    Each batch is applied in its own transaction, opened once the batch has
+    been read, so no row lock waits on a slow client; a body that turns out
+    corrupt or too large keeps the batches applied before. In async mode
+    each batch is staged as it is read and the staged batches are queued
+    only once the whole body was read (see ``ingest_queue.promote``): queued
+    batches cannot be taken back and a relay retry would count them twice.
+    Lines that are not JSON objects are skipped and reported.
+    """
+    batches = iter_listener_batches(iter_ndjson(stream))
+    invalid_lines = 0
+    now = timezone.now()
+
+    if getattr(settings, "INGEST_ASYNC", False):
+        session_count = bucket_count = 0
+        key = ingest_queue.staging_key()
+        try:
+            for sessions, buckets, invalid in batches:
+                invalid_lines += invalid
+                sessions, buckets, _dropped = clean_listener_records(sessions, buckets)
+                if not sessions and not buckets:
+                    continue
+                _record_presence(studio, sessions, now)
+                ingest_queue.stage(
+                    key,
+                    ingest_queue.KIND_LISTENER,
+                    studio.pk,
+                    {"sessions": sessions, "buckets": buckets},
+                )
+                session_count += len(sessions)
+                bucket_count += len(buckets)
+        except BaseException:
+            ingest_queue.discard(key)
+            raise
+        ingest_queue.promote(key)
+        return JsonResponse(
+            {
+                "ok": True,
+                "queued": True,
+                "studio": str(studio.pk),
+                "sessions": session_count,
+                "buckets": bucket_count,
+                "invalid_lines": invalid_lines,
+            },
+            status=202,
+        )
+
+    totals = {"inserted_sessions": 0, "updated_sessions": 0, "upserted_buckets": 0}
+    for sessions, buckets, invalid in batches:
+        invalid_lines += invalid
+        _record_presence(studio, sessions, now)
+        with transaction.atomic():
+            counts = apply_listener_payload(studio, sessions, buckets, now)
+        for key, value in counts.items():
+            totals[key] += value
 
     return JsonResponse(
         {
             "ok": True,
             "studio": str(studio.pk),
-            "inserted_sessions": inserted_sessions,
-            "updated_sessions": updated_sessions,
-            "upserted_buckets": upserted_buckets,
+            **totals,
+            "invalid_lines": invalid_lines,
         },
         status=200,
     )
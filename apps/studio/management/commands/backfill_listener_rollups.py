@@ -0,0 +1,60 @@
+"""
+Build ListenerDailyRollup rows from existing sessions and minute buckets.
+
+Usage:
+    python manage.py backfill_listener_rollups --days 90
+    python manage.py backfill_listener_rollups --since 2025-01-01 --studio my-studio
+"""
+
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from apps.studio.services.helpers import get_studio
+from apps.studio.services.rollups import rollup_listener_days
+
+
+class Command(BaseCommand):
+    help = "Backfill daily listener rollups for closed days, in chunks of days."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=90, help="Closed days to backfill."
+        )
+        parser.add_argument(
+            "--since", default="", help="First day (YYYY-MM-DD); overrides --days."
+        )
+        parser.add_argument(
+            "--chunk-days", type=int, default=7, help="Days recomputed per pass."
+        )
+        parser.add_argument("--studio", default="", help="Studio slug or id.")
+
+    def handle(self, *args, **options):
+        today = timezone.now().date()
+        last_day = today - datetime.timedelta(days=1)
+        if options["since"]:
+            first_day = parse_date(options["since"])
+            if first_day is None:
+                raise CommandError("--since must be a YYYY-MM-DD date")
+        else:
+            first_day = today - datetime.timedelta(days=max(options["days"], 1))
+
+        studio = None
+        if options["studio"]:
+            studio = get_studio(options["studio"])
+            if studio is None:
+                raise CommandError(f"Studio not found: {options['studio']}")
+
+        chunk = datetime.timedelta(days=max(options["chunk_days"], 1))
+        total = 0
+        start = first_day
+        while start <= last_day:
+            end = min(start + chunk - datetime.timedelta(days=1), last_day)
+            written = rollup_listener_days(start, end, studio=studio)
+            total += written
+            self.stdout.write(f"{start}..{end}: {written} rows")
+            start = end + datetime.timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {total} rollup rows"))
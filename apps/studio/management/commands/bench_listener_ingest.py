@@ -0,0 +1,99 @@
+"""
+Benchmark the listener-events ingest endpoint: bulk upsert vs per-session loop.
+
+Posts a synthetic payload of N sessions twice per mode (first pass inserts,
+second pass updates) against a throwaway studio. Everything runs inside a
+transaction that is rolled back, so the database is left untouched.
+
+Usage:
+    python manage.py bench_listener_ingest --sessions 10000
+"""
+
+import json
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+
+from apps.studio.api.ingest import ingest_listener_events
+from apps.studio.models import Studio
+
+
+def _payload(session_ids, total_bytes: int) -> bytes:
+    now = timezone.now().isoformat()
+    sessions = [
+        {
+            "id": str(s_id),
+            "started_at": now,
+            "ip_hash": uuid.uuid4().hex,
+            "user_agent": "Mozilla/5.0 (bench) AppleWebKit/537.36 Chrome/120",
+            "client_type": "web",
+            "country": "RW",
+            "region": "Kigali",
+            "city": "Kigali",
+            "total_bytes": total_bytes,
+        }
+        for s_id in session_ids
+    ]
+    return json.dumps({"sessions": sessions, "buckets": []}).encode("utf-8")
+
+
+class QueryCounter:
+    """Connection execute wrapper counting statements (works with DEBUG=False)."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = "Compare bulk and loop ingest modes for listener sessions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sessions", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        count = options["sessions"]
+        factory = RequestFactory()
+
+        for bulk in (True, False):
+            mode = "bulk" if bulk else "loop"
+            with transaction.atomic():
+                studio = Studio.objects.create(
+                    slug=f"bench-{uuid.uuid4().hex[:12]}", display_name="Bench"
+                )
+                session_ids = [uuid.uuid4() for _ in range(count)]
+                for label, total_bytes in (("insert", 1024), ("update", 4096)):
+                    request = factory.post(
+                        f"/api/studios/{studio.slug}/listener-events",
+                        data=_payload(session_ids, total_bytes),
+                        content_type="application/json",
+                        HTTP_AUTHORIZATION="Bearer bench",
+                    )
+                    # A 10k-session payload is larger than DATA_UPLOAD_MAX_MEMORY_SIZE
+                    with override_settings(
+                        LISTENER_INGEST_BULK=bulk, DATA_UPLOAD_MAX_MEMORY_SIZE=None
+                    ):
+                        counter = QueryCounter()
+                        with connection.execute_wrapper(counter):
+                            started = time.perf_counter()
+                            response = ingest_listener_events(request, studio.slug)
+                            elapsed = time.perf_counter() - started
+                    body = json.loads(response.content)
+                    if response.status_code != 200:
+                        self.stderr.write(f"{mode} {label}: {body}")
+                        return
+                    self.stdout.write(
+                        f"{mode:>4} {label:<6} sessions={count} "
+                        f"time={elapsed:.3f}s rate={count / elapsed:,.0f}/s "
+                        f"queries={counter.count} "
+                        f"inserted={body.get('inserted_sessions')} "
+                        f"updated={body.get('updated_sessions')}"
+                    )
+                transaction.set_rollback(True)
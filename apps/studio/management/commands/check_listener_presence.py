@@ -0,0 +1,58 @@
+"""
+Compare live presence counts with the database for each studio.
+
+Prints one JSON line per studio and exits with status 1 when a drift exceeds
+--tolerance.
+
+Usage:
+    python manage.py check_listener_presence
+    python manage.py check_listener_presence --studio my-studio --tolerance 2
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.studio.models import Studio
+from apps.studio.services import presence
+from apps.studio.services.helpers import get_studio
+
+
+class Command(BaseCommand):
+    help = "Check live presence active-now counts against ListenerSession rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--studio", default="", help="Studio slug or id.")
+        parser.add_argument(
+            "--tolerance",
+            type=int,
+            default=0,
+            help="Accepted absolute drift per studio and per country.",
+        )
+
+    def handle(self, *args, **options):
+        if presence.get_backend() is None:
+            raise CommandError("LISTENER_PRESENCE_BACKEND is not set")
+
+        if options["studio"]:
+            studio = get_studio(options["studio"])
+            if studio is None:
+                raise CommandError(f"Studio not found: {options['studio']}")
+            studios = [studio]
+        else:
+            studios = Studio.objects.order_by("slug")
+
+        tolerance = options["tolerance"]
+        now = timezone.now()
+        failed = 0
+        for studio in studios:
+            report = presence.compare_with_database(studio, now)
+            report["ok"] = abs(report["drift"]) <= tolerance and all(
+                abs(d) <= tolerance for d in report["country_drift"].values()
+            )
+            failed += not report["ok"]
+            self.stdout.write(json.dumps(report, sort_keys=True))
+
+        if failed:
+            raise CommandError(f"{failed} studio(s) drift beyond tolerance")
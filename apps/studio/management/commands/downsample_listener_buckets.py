@@ -0,0 +1,70 @@
+"""
+Build FIVE_MIN and HOUR stat buckets from the MINUTE buckets already stored.
+
+Without --days every stored MINUTE bucket is compacted: MINUTE rows past
+their retention are only purged once an HOUR bucket covers them.
+
+Usage:
+    python manage.py downsample_listener_buckets
+    python manage.py downsample_listener_buckets --days 7
+    python manage.py downsample_listener_buckets --days 30 --studio my-studio
+"""
+
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from apps.studio.services.downsampling import (
+    downsample_window,
+    oldest_minute_bucket,
+    slot_start,
+)
+from apps.studio.services.helpers import get_studio
+
+
+class Command(BaseCommand):
+    help = "Backfill FIVE_MIN/HOUR listener stat buckets from MINUTE buckets."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=None,
+            help="How far back to compact (default: all MINUTE history).",
+        )
+        parser.add_argument(
+            "--chunk-hours", type=int, default=24, help="Hours compacted per pass."
+        )
+        parser.add_argument("--studio", default="", help="Studio slug or id.")
+
+    def handle(self, *args, **options):
+        studio = None
+        if options["studio"]:
+            studio = get_studio(options["studio"])
+            if studio is None:
+                raise CommandError(f"Studio not found: {options['studio']}")
+
+        now = timezone.now()
+        chunk = datetime.timedelta(hours=max(options["chunk_hours"], 1))
+        if options["days"] is None:
+            start = oldest_minute_bucket(studio) or now
+        else:
+            start = now - datetime.timedelta(days=max(options["days"], 1))
+        # Whole hours, so the first HOUR bucket is built from all its minutes
+        start = slot_start(start, "HOUR")
+        totals = {"FIVE_MIN": 0, "HOUR": 0}
+        while start < now:
+            end = min(start + chunk, now)
+            with transaction.atomic():
+                written = downsample_window(start, end, now, studio=studio)
+            for interval, count in written.items():
+                totals[interval] += count
+            start = end
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {totals['FIVE_MIN']} FIVE_MIN and {totals['HOUR']} HOUR buckets"
+            )
+        )
@@ -0,0 +1,19 @@
+"""
+Print depth and lag of the buffered ingest stream as one JSON line.
+
+Usage:
+    python manage.py ingest_queue_stats
+"""
+
+import json
+
+from django.core.management.base import BaseCommand
+
+from apps.studio.services import ingest_queue
+
+
+class Command(BaseCommand):
+    help = "Show depth, pending count and lag of the ingest Redis stream."
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(ingest_queue.queue_stats()))
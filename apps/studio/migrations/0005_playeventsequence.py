@@ -0,0 +1,52 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:11
+
+import uuid
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studio', '0004_listenersession_last_seen'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayEventSequence',
+            fields=[
+                (
+                    'id',
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    'created_at',
+                    models.DateTimeField(default=django.utils.timezone.now, null=True),
+                ),
+                (
+                    'updated_at',
+                    models.DateTimeField(default=django.utils.timezone.now, null=True),
+                ),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('last_value', models.BigIntegerField(default=0)),
+                (
+                    'studio',
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='play_event_sequence',
+                        to='studio.studio',
+                    ),
+                ),
+            ],
+            options={
+                'db_table': 'play_event_sequences',
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:13
+
+import uuid
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studio', '0005_playeventsequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListenerDailyRollup',
+            fields=[
+                (
+                    'id',
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    'created_at',
+                    models.DateTimeField(default=django.utils.timezone.now, null=True),
+                ),
+                (
+                    'updated_at',
+                    models.DateTimeField(default=django.utils.timezone.now, null=True),
+                ),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('day', models.DateField()),
+                ('session_starts', models.PositiveIntegerField(default=0)),
+                ('listener_minutes', models.PositiveBigIntegerField(default=0)),
+                ('unique_listeners', models.PositiveIntegerField(default=0)),
+                (
+                    'studio',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='listener_daily_rollups',
+                        to='studio.studio',
+                    ),
+                ),
+            ],
+            options={
+                'db_table': 'listener_daily_rollups',
+                'unique_together': {('studio', 'day')},
+            },
+        ),
+    ]
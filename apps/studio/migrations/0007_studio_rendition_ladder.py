@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:44
+
+from django.db import migrations, models
+
+import apps.medias.services.renditions
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studio', '0006_listenerdailyrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studio',
+            name='rendition_ladder',
+            field=models.CharField(
+                blank=True,
+                max_length=255,
+                validators=[apps.medias.services.renditions.validate_ladder],
+            ),
+        ),
+    ]
@@ -1,4 +1,10 @@
-from .analytics import ListenerSession, ListenerStatBucket, PlayEvent
+from .analytics import (
+    ListenerDailyRollup,
+    ListenerSession,
+    ListenerStatBucket,
+    PlayEvent,
+    PlayEventSequence,
+)
 from .base import Studio, StudioMembership
 from .live import LiveSession
 from .playlist import Playlist, PlaylistItem, RotationRule
@@ -14,6 +20,8 @@ __all__ = [
     "ShowSlot",
     "LiveSession",
     "PlayEvent",
+    "PlayEventSequence",
     "ListenerSession",
     "ListenerStatBucket",
+    "ListenerDailyRollup",
 ]
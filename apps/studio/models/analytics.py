@@ -27,6 +27,23 @@ class PlayEvent(BaseModel):
         ]
 
 
+class PlayEventSequence(BaseModel):
+    """
+    Last PlayEvent.sequence handed out per studio.
+
+    Blocks are reserved with a single upsert (see
+    apps.studio.services.sequences.allocate_play_sequences).
+    """
+
+    studio = models.OneToOneField(
+        Studio, on_delete=models.CASCADE, related_name="play_event_sequence"
+    )
+    last_value = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = "play_event_sequences"
+
+
 class ListenerSession(BaseModel):
     studio = models.ForeignKey(
         Studio, on_delete=models.CASCADE, related_name="listener_sessions"
@@ -80,3 +97,25 @@ class ListenerStatBucket(BaseModel):
         db_table = "listener_stat_buckets"
         unique_together = ("studio", "interval", "bucket_start")
         indexes = [models.Index(fields=["studio", "interval", "bucket_start"])]
+
+
+class ListenerDailyRollup(BaseModel):
+    """
+    Per-studio, per-UTC-day listener totals.
+
+    Maintained by apps.studio.tasks.refresh_listener_rollups and backfilled
+    with the backfill_listener_rollups management command.
+    """
+
+    studio = models.ForeignKey(
+        Studio, on_delete=models.CASCADE, related_name="listener_daily_rollups"
+    )
+    day = models.DateField()
+
+    session_starts = models.PositiveIntegerField(default=0)
+    listener_minutes = models.PositiveBigIntegerField(default=0)
+    unique_listeners = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "listener_daily_rollups"
+        unique_together = ("studio", "day")
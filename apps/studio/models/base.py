@@ -1,6 +1,7 @@
 from django.conf import settings
 from django.db import models
 
+from apps.medias.services.renditions import validate_ladder
 from config.model import BaseModel
 
 
@@ -15,6 +16,11 @@ class Studio(BaseModel):
     loudness_target_lufs = models.DecimalField(
         max_digits=5, decimal_places=2, default=-14.0
     )
+    # Renditions published besides the default_bitrate_kbps MP3, e.g.
+    # "mp3:64,aac:96,opus:48" (see apps.medias.services.renditions)
+    rendition_ladder = models.CharField(
+        max_length=255, blank=True, validators=[validate_ladder]
+    )
 
     class Meta:
         db_table = "studios"
@@ -7,7 +7,7 @@ from django.db.models import Q, Sum
 from django.utils import timezone
 
 from apps.medias.models import Track, UploadSession
-from apps.studio.models.analytics import ListenerSession, ListenerStatBucket, PlayEvent
+from apps.studio.models.analytics import ListenerStatBucket, PlayEvent
 from apps.studio.models.base import Studio
 from apps.studio.schema.types import (
     CurrentQueue,
@@ -18,7 +18,9 @@ from apps.studio.schema.types import (
     StudioCapacity,
     TimeRange,
 )
+from apps.studio.services.downsampling import trend_peaks
 from apps.studio.services.helpers import get_studio
+from apps.studio.services.rollups import daily_session_starts
 
 
 class DashboardQuery(graphene.ObjectType):
@@ -58,36 +60,25 @@ class DashboardQuery(graphene.ObjectType):
             since = now - datetime.timedelta(minutes=90)
             target_span = datetime.timedelta(minutes=90)
 
-        # Pick interval:
+        # Pick interval (FIVE_MIN / HOUR rows are maintained by the
+        # downsample_listener_buckets task):
         # - If span <= 2h -> MINUTE
-        # - If 2h < span <= 30h -> use MINUTE (optionally downsample)
-        # - If 30h < span <= 7 days -> prefer FIVE_MIN; fallback to HOUR
+        # - If 2h < span <= 30h -> FIVE_MIN (~288 points)
+        # - If 30h < span <= 7 days -> HOUR (~168 points)
         if target_span <= datetime.timedelta(hours=2):
             interval = "MINUTE"
         elif target_span <= datetime.timedelta(hours=30):
-            interval = "MINUTE"
+            interval = "FIVE_MIN"
         else:
-            # Attempt FIVE_MIN buckets; if none exist fall back to HOUR
-            has_five = ListenerStatBucket.objects.filter(
-                studio=studio, interval="FIVE_MIN", bucket_start__gte=since
-            ).exists()
-            interval = "FIVE_MIN" if has_five else "HOUR"
-
-        buckets = ListenerStatBucket.objects.filter(
-            studio=studio, interval=interval, bucket_start__gte=since
-        ).order_by("bucket_start")
+            interval = "HOUR"
 
         points = []
         peak_point = None
         peak_val = -1
 
-        # Optional downsampling for 24h range (keep every 3rd MINUTE bucket)
-        for idx, b in enumerate(buckets):
-            if interval == "MINUTE" and range == TimeRange.LAST_24_HOURS.value:
-                if idx % 3 != 0:  # skip for density
-                    continue
-            active = b.active_peak or 0
-            p = ListeningTrendPoint(ts=b.bucket_start, active=active)
+        for bucket_start, active in trend_peaks(studio, interval, since):
+            active = active or 0
+            p = ListeningTrendPoint(ts=bucket_start, active=active)
             points.append(p)
             if active > peak_val:
                 peak_val = active
@@ -109,32 +100,32 @@ class DashboardQuery(graphene.ObjectType):
                 lastMonth=0,
             )
 
-        now = timezone.now()
         # Day boundaries in UTC
-        today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        yesterday_start = today_start - datetime.timedelta(days=1)
-        seven_days_start = today_start - datetime.timedelta(days=7)
-        thirty_days_start = today_start - datetime.timedelta(days=30)
-        prev_thirty_days_start = today_start - datetime.timedelta(days=60)
-        month_start = today_start.replace(day=1)
-        last_month_end = month_start - datetime.timedelta(days=1)
-        last_month_start = last_month_end.replace(day=1)
-
-        # Count "listens" as session starts (ListenerSession.started_at inside window)
-        qs = ListenerSession.objects.filter(studio=studio)
-
-        today_cnt = qs.filter(started_at__gte=today_start).count()
-        yesterday_cnt = qs.filter(
-            started_at__gte=yesterday_start, started_at__lt=today_start
-        ).count()
-        last7_cnt = qs.filter(started_at__gte=seven_days_start).count()
-        last30_cnt = qs.filter(started_at__gte=thirty_days_start).count()
-        prev30_cnt = qs.filter(
-            started_at__gte=prev_thirty_days_start, started_at__lt=thirty_days_start
-        ).count()
-        last_month_cnt = qs.filter(
-            started_at__gte=last_month_start, started_at__lte=last_month_end
-        ).count()
+        today = timezone.now().date()
+        month_start = today.replace(day=1)
+        last_month_start = (month_start - datetime.timedelta(days=1)).replace(day=1)
+        prev_thirty_days_start = today - datetime.timedelta(days=60)
+
+        # Count "listens" as session starts (ListenerSession.started_at inside window).
+        # Closed days are read from ListenerDailyRollup; only today (and days
+        # without a rollup row) are counted from raw sessions.
+        per_day = daily_session_starts(
+            studio, min(prev_thirty_days_start, last_month_start), today
+        )
+
+        def window(first, last=None):
+            return sum(
+                n
+                for day, n in per_day.items()
+                if day >= first and (last is None or day < last)
+            )
+
+        today_cnt = window(today)
+        yesterday_cnt = window(today - datetime.timedelta(days=1), today)
+        last7_cnt = window(today - datetime.timedelta(days=7))
+        last30_cnt = window(today - datetime.timedelta(days=30))
+        prev30_cnt = window(prev_thirty_days_start, today - datetime.timedelta(days=30))
+        last_month_cnt = window(last_month_start, month_start)
 
         if prev30_cnt > 0:
             change_pct = ((last30_cnt - prev30_cnt) / prev30_cnt) * 100.0
@@ -1,12 +1,15 @@
 import datetime
 
 import graphene
+from django.db.models import Count, Max, Q, Sum
 from django.utils import timezone
 from graphene import Argument
 
 from apps.studio.models.analytics import ListenerSession, ListenerStatBucket
 from apps.studio.models.base import Studio
 from apps.studio.schema.types import CountryCount, ListenerOverview, TimeRange
+from apps.studio.services import presence
+from apps.studio.services.downsampling import slot_start
 from apps.studio.services.helpers import get_studio
 
 
@@ -30,6 +33,7 @@ class ListenerQuery(graphene.ObjectType):
             return ListenerOverview(
                 studio_id="",
                 active_now=0,
+                active_now_countries=[],
                 peak_last_hour=0,
                 peak_last_24h=0,
                 listener_minutes_last_24h=0,
@@ -37,60 +41,80 @@ class ListenerQuery(graphene.ObjectType):
             )
 
         now = timezone.now()
-        GRACE_PERIOD = datetime.timedelta(seconds=20)
         if range == TimeRange.LAST_7_DAYS.value:
             since = now - datetime.timedelta(days=7)
         else:
             since = now - datetime.timedelta(days=1)
 
-        # Active now = open sessions (ended_at is null)
-        active_now = ListenerSession.objects.filter(
-            studio=studio, last_seen__gte=now - GRACE_PERIOD
-        ).count()
-
-        # Peaks and minutes from buckets (prefer MINUTE granularity)
-        minute_buckets = ListenerStatBucket.objects.filter(
-            studio=studio, interval="MINUTE", bucket_start__gte=since
-        )
-        peak_last_24h = 0
-        peak_last_hour = 0
-        listener_minutes_last_24h = 0
+        # Active now = sessions heard from within LISTENER_ACTIVE_WINDOW_SECONDS,
+        # served from the live presence store when one is configured
+        active_now = presence.active_count(studio, now)
+        active_now_countries = [
+            CountryCount(code=k, count=v)
+            for k, v in sorted(presence.active_countries(studio, now).items())
+        ]
 
-        # Compute last hour window
+        # Peaks and minutes from buckets, aggregated in the database so the
+        # cost does not grow with the range. Over 7 days completed hours are
+        # read from their HOUR compaction (MINUTE rows are purged after
+        # LISTENER_MINUTE_RETENTION_DAYS), the rest from MINUTE rows
         one_hour_ago = now - datetime.timedelta(hours=1)
-        for b in minute_buckets:
-            listener_minutes_last_24h += b.listener_minutes or 0
-            if b.active_peak and b.active_peak > peak_last_24h:
-                peak_last_24h = b.active_peak
-            if (
-                b.bucket_start >= one_hour_ago
-                and b.active_peak
-                and b.active_peak > peak_last_hour
-            ):
-                peak_last_hour = b.active_peak
+        minutes_since = since
+        hours = {}
+        if range == TimeRange.LAST_7_DAYS.value:
+            hours = ListenerStatBucket.objects.filter(
+                studio=studio,
+                interval="HOUR",
+                bucket_start__gte=since,
+                bucket_start__lt=slot_start(now, "HOUR"),
+            ).aggregate(
+                minutes=Sum("listener_minutes"),
+                peak=Max("active_peak"),
+                newest=Max("bucket_start"),
+            )
+            if hours["newest"] is not None:
+                # Hours the compaction task has not reached yet come from MINUTE
+                minutes_since = hours["newest"] + datetime.timedelta(hours=1)
+        recent = Q(bucket_start__gte=minutes_since)
+        totals = ListenerStatBucket.objects.filter(
+            studio=studio,
+            interval="MINUTE",
+            bucket_start__gte=min(minutes_since, one_hour_ago),
+        ).aggregate(
+            minutes=Sum("listener_minutes", filter=recent),
+            peak=Max("active_peak", filter=recent),
+            peak_last_hour=Max("active_peak", filter=Q(bucket_start__gte=one_hour_ago)),
+        )
+        peak_last_24h = max(totals["peak"] or 0, hours.get("peak") or 0)
+        peak_last_hour = totals["peak_last_hour"] or 0
+        listener_minutes_last_24h = (totals["minutes"] or 0) + (
+            hours.get("minutes") or 0
+        )
 
         # Countries: use the most recent MINUTE bucket if available; otherwise derive from active sessions
-        latest_bucket = (
+        latest_countries = (
             ListenerStatBucket.objects.filter(studio=studio, interval="MINUTE")
             .order_by("-bucket_start")
+            .values_list("countries_json", flat=True)
             .first()
         )
         countries_map = {}
-        if latest_bucket and latest_bucket.countries_json:
-            for code, cnt in latest_bucket.countries_json.items():
+        if latest_countries:
+            for code, cnt in latest_countries.items():
                 try:
                     countries_map[code] = int(cnt or 0)
                 except Exception:
                     continue
         else:
             # Fallback to active sessions aggregation
-            qs = ListenerSession.objects.filter(
-                studio=studio, ended_at__isnull=True
-            ).values_list("country", flat=True)
-            for c in qs:
-                if not c:
-                    continue
-                countries_map[c] = countries_map.get(c, 0) + 1
+            qs = (
+                ListenerSession.objects.filter(studio=studio, ended_at__isnull=True)
+                .exclude(country="")
+                .values("country")
+                .annotate(count=Count("id"))
+            )
+            for row in qs:
+                countries_map[row["country"]] = row["count"]
 
         countries = [
             CountryCount(code=k, count=v) for k, v in sorted(countries_map.items())
@@ -99,6 +123,7 @@ class ListenerQuery(graphene.ObjectType):
         return ListenerOverview(
             studio_id=str(studio.slug),
             active_now=active_now,
+            active_now_countries=active_now_countries,
             peak_last_hour=peak_last_hour,
             peak_last_24h=peak_last_24h,
             listener_minutes_last_24h=listener_minutes_last_24h,
@@ -15,6 +15,7 @@ class CountryCount(graphene.ObjectType):
 class ListenerOverview(graphene.ObjectType):
     studio_id = graphene.String(required=True)
     active_now = graphene.Int(required=True)
+    active_now_countries = graphene.List(graphene.NonNull(CountryCount), required=True)
     peak_last_hour = graphene.Int(required=True)
     peak_last_24h = graphene.Int(required=True)
     listener_minutes_last_24h = graphene.Int(required=True)
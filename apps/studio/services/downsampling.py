@@ -0,0 +1,266 @@
+"""
+MINUTE -> FIVE_MIN -> HOUR compaction of ListenerStatBucket.
+
+``downsample_buckets`` recomputes coarser buckets from the finer interval with
+one ``INSERT ... SELECT ... ON CONFLICT`` statement: the peak keeps the max,
+listener minutes are summed and countries are summed key by key (the same
+merge rules the ingest upsert applies). Target rows are replaced, not merged,
+so re-running a window is idempotent.
+
+``purge_minute_buckets`` deletes MINUTE rows past their retention once an
+HOUR row covers them, ``oldest_minute_bucket`` bounds a full backfill, and
+``trend_peaks`` reads a compacted series for the dashboard trend, topping up
+the newest slots from MINUTE rows the compaction task has not reached yet.
+"""
+
+import datetime
+from typing import Dict, List, Optional, Tuple
+
+from django.db import connection
+
+from apps.studio.models import ListenerStatBucket, Studio
+
+INTERVAL_SECONDS = {"MINUTE": 60, "FIVE_MIN": 300, "HOUR": 3600}
+
+# Each interval is built from the next finer one
+DOWNSAMPLE_STEPS = (("MINUTE", "FIVE_MIN"), ("FIVE_MIN", "HOUR"))
+
+_DOWNSAMPLE_SQL = """
+    WITH src AS (
+        SELECT
+            studio_id,
+            to_timestamp(
+                floor(extract(epoch FROM bucket_start) / %(width)s) * %(width)s
+            ) AS slot,
+            active_peak,
+            listener_minutes,
+            countries_json
+        FROM {table}
+        WHERE "interval" = %(source)s
+          AND deleted_at IS NULL
+          AND bucket_start >= %(since)s
+          AND bucket_start < %(until)s
+          {studio_filter}
+    ),
+    totals AS (
+        SELECT studio_id, slot,
+               MAX(active_peak) AS peak,
+               SUM(listener_minutes) AS minutes
+        FROM src
+        GROUP BY studio_id, slot
+    ),
+    countries AS (
+        SELECT studio_id, slot, jsonb_object_agg(key, total) AS merged
+        FROM (
+            SELECT src.studio_id, src.slot, e.key, SUM(e.value::bigint) AS total
+            FROM src, jsonb_each_text(src.countries_json) AS e
+            WHERE e.value ~ '^-?[0-9]+$'
+            GROUP BY src.studio_id, src.slot, e.key
+        ) AS c
+        GROUP BY studio_id, slot
+    )
+    INSERT INTO {table} ({columns})
+    SELECT
+        gen_random_uuid(), %(now)s, %(now)s, t.studio_id, %(target)s, t.slot,
+        t.peak, t.minutes, COALESCE(c.merged, '{{}}'::jsonb)
+    FROM totals AS t
+    LEFT JOIN countries AS c USING (studio_id, slot)
+    ON CONFLICT (studio_id, "interval", bucket_start) DO UPDATE SET
+        updated_at = EXCLUDED.updated_at,
+        deleted_at = NULL,
+        active_peak = EXCLUDED.active_peak,
+        listener_minutes = EXCLUDED.listener_minutes,
+        countries_json = EXCLUDED.countries_json
+"""
+
+_COLUMNS = (
+    "id",
+    "created_at",
+    "updated_at",
+    "studio_id",
+    "interval",
+    "bucket_start",
+    "active_peak",
+    "listener_minutes",
+    "countries_json",
+)
+
+# Only MINUTE rows already folded into an HOUR row (built after the minute
+# was last written) or soft-deleted are deleted: the rest is kept until it is
+# compacted
+_PURGE_SQL = """
+    DELETE FROM {table}
+    WHERE id IN (
+        SELECT m.id FROM {table} AS m
+        WHERE m."interval" = 'MINUTE' AND m.bucket_start < %s
+          AND (m.deleted_at IS NOT NULL OR EXISTS (
+            SELECT 1 FROM {table} AS h
+            WHERE h.studio_id = m.studio_id
+              AND h."interval" = 'HOUR'
+              AND h.deleted_at IS NULL
+              AND h.bucket_start = to_timestamp(
+                  floor(extract(epoch FROM m.bucket_start) / 3600) * 3600
+              )
+              AND h.updated_at >= m.updated_at
+          ))
+        LIMIT %s
+    )
+"""
+
+
+# Hours holding MINUTE rows an HOUR row does not cover yet (same test as the
+# purge), oldest first
+_UNCOMPACTED_SQL = """
+    SELECT DISTINCT to_timestamp(
+        floor(extract(epoch FROM m.bucket_start) / 3600) * 3600
+    ) AS slot
+    FROM {table} AS m
+    WHERE m."interval" = 'MINUTE' AND m.deleted_at IS NULL
+      AND m.bucket_start < %s
+      AND NOT EXISTS (
+        SELECT 1 FROM {table} AS h
+        WHERE h.studio_id = m.studio_id
+          AND h."interval" = 'HOUR'
+          AND h.deleted_at IS NULL
+          AND h.bucket_start = to_timestamp(
+              floor(extract(epoch FROM m.bucket_start) / 3600) * 3600
+          )
+          AND h.updated_at >= m.updated_at
+      )
+    ORDER BY slot
+    LIMIT %s
+"""
+
+
+def slot_start(ts: datetime.datetime, interval: str) -> datetime.datetime:
+    """Start of the ``interval`` bucket containing ``ts`` (epoch aligned)."""
+    width = INTERVAL_SECONDS[interval]
+    epoch = int(ts.timestamp()) // width * width
+    return datetime.datetime.fromtimestamp(epoch, tz=datetime.timezone.utc)
+
+
+def downsample_buckets(
+    source: str,
+    target: str,
+    since: datetime.datetime,
+    until: datetime.datetime,
+    now: datetime.datetime,
+    studio: Optional[Studio] = None,
+) -> int:
+    """
+    Rebuild ``target`` buckets from ``source`` buckets in [since, until).
+
+    ``since`` should be aligned on a ``target`` boundary, otherwise the first
+    target bucket is rebuilt from part of its source rows. Returns the number
+    of target rows written.
+    """
+    table = ListenerStatBucket._meta.db_table
+    params = {
+        "width": INTERVAL_SECONDS[target],
+        "source": source,
+        "target": target,
+        "since": since,
+        "until": until,
+        "now": now,
+    }
+    studio_filter = ""
+    if studio is not None:
+        studio_filter = "AND studio_id = %(studio)s"
+        params["studio"] = studio.pk
+    sql = _DOWNSAMPLE_SQL.format(
+        table=table,
+        columns=", ".join(connection.ops.quote_name(c) for c in _COLUMNS),
+        studio_filter=studio_filter,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def downsample_window(
+    since: datetime.datetime,
+    until: datetime.datetime,
+    now: datetime.datetime,
+    studio: Optional[Studio] = None,
+) -> Dict[str, int]:
+    """Run every step of the cascade over [since, until); ``since`` is hour-aligned."""
+    since = slot_start(since, "HOUR")
+    return {
+        target: downsample_buckets(source, target, since, until, now, studio=studio)
+        for source, target in DOWNSAMPLE_STEPS
+    }
+
+
+def purge_minute_buckets(older_than: datetime.datetime, batch_size: int) -> int:
+    """
+    Hard-delete MINUTE buckets starting before ``older_than`` whose hour is
+    covered by an HOUR bucket rebuilt since they were written. Uncompacted
+    rows (beat outage, history older than the compaction lookback) are kept
+    until ``downsample_listener_buckets`` (command) compacts them.
+
+    Rows are removed in batches of ``batch_size`` to keep each statement short.
+    Returns the number of rows deleted.
+    """
+    sql = _PURGE_SQL.format(table=ListenerStatBucket._meta.db_table)
+    deleted = 0
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute(sql, [older_than, batch_size])
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                return deleted
+
+
+def uncompacted_hours(
+    older_than: datetime.datetime, limit: int
+) -> List[datetime.datetime]:
+    """
+    Up to ``limit`` hours before ``older_than`` with MINUTE rows no HOUR row
+    covers, i.e. that ``purge_minute_buckets`` would keep.
+    """
+    sql = _UNCOMPACTED_SQL.format(table=ListenerStatBucket._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [older_than, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def oldest_minute_bucket(
+    studio: Optional[Studio] = None,
+) -> Optional[datetime.datetime]:
+    """Start of the oldest MINUTE bucket (of ``studio``), None without any."""
+    qs = ListenerStatBucket.objects.filter(interval="MINUTE")
+    if studio is not None:
+        qs = qs.filter(studio=studio)
+    return qs.order_by("bucket_start").values_list("bucket_start", flat=True).first()
+
+
+def trend_peaks(
+    studio: Studio, interval: str, since: datetime.datetime
+) -> List[Tuple[datetime.datetime, int]]:
+    """
+    ``(bucket_start, active_peak)`` per ``interval`` bucket since ``since``.
+
+    Compacted rows are read as stored. The newest compacted slot and anything
+    after it are rebuilt from MINUTE rows, which covers buckets the
+    compaction task has not processed yet (or at all, before a backfill).
+    """
+    peaks: Dict[datetime.datetime, int] = dict(
+        ListenerStatBucket.objects.filter(
+            studio=studio, interval=interval, bucket_start__gte=since
+        ).values_list("bucket_start", "active_peak")
+    )
+    if interval == "MINUTE":
+        return sorted(peaks.items())
+
+    fresh_from = max(peaks) if peaks else since
+    fresh: Dict[datetime.datetime, int] = {}
+    minutes = ListenerStatBucket.objects.filter(
+        studio=studio, interval="MINUTE", bucket_start__gte=fresh_from
+    ).values_list("bucket_start", "active_peak")
+    for bucket_start, peak in minutes:
+        slot = slot_start(bucket_start, interval)
+        if slot < since:
+            continue
+        fresh[slot] = max(fresh.get(slot, 0), peak or 0)
+    peaks.update(fresh)
+    return sorted(peaks.items())
@@ -1,27 +1,39 @@
+import uuid
+
 from apps.studio.models.base import Studio
+from apps.studio.services import studio_cache
 
 
 def get_studio(studio_id: str) -> Studio | None:
-    """Return a Studio matched by slug, pk, or code; None if not found.
+    """Return a Studio matched by slug or pk; None if not found.
 
     Lookup order:
     1. slug field
-    2. primary key (pk)
-    3. code field
-    All exceptions are swallowed; only Studio.DoesNotExist/ValueError expected.
+    2. primary key (pk), only when studio_id is a valid UUID
+    Results are served from ``studio_cache`` when possible; misses are not
+    cached, so a studio created later is found on the next call.
     """
-    # Try slug first (never raises)
-    studio = Studio.objects.filter(slug=studio_id).first()
-    if studio:
-        return studio
+    if not studio_id:
+        return None
+    studio_id = str(studio_id)
 
-    # Try primary key (may raise DoesNotExist or ValueError if invalid type)
     try:
-        studio = Studio.objects.get(pk=studio_id)
+        studio_pk = uuid.UUID(studio_id)
+    except ValueError:
+        studio_pk = None
+
+    keys = [f"slug:{studio_id}"]
+    if studio_pk is not None:
+        keys.append(f"pk:{studio_pk}")
+    studio = studio_cache.get(*keys)
+    if studio is not None:
         return studio
-    except (Studio.DoesNotExist, ValueError):
-        pass
 
-    # Finally try code
-    studio = Studio.objects.filter(code=studio_id).first()
+    # Try slug first (never raises)
+    studio = Studio.objects.filter(slug=studio_id).first()
+    if studio is None and studio_pk is not None:
+        studio = Studio.objects.filter(pk=studio_pk).first()
+
+    if studio is not None:
+        studio_cache.put(studio)
     return studio
@@ -0,0 +1,560 @@
+"""
+Write paths for the listener-events ingest endpoint.
+
+Two strategies are available for ListenerSession heartbeats:
+
+- ``upsert_sessions_loop``: the original per-session ``update_or_create`` loop.
+- ``upsert_sessions_bulk``: one ``INSERT ... ON CONFLICT`` statement per batch.
+
+Both apply the same merge rules (``total_bytes`` keeps the max, ``last_seen``
+is refreshed) and return the same ``(inserted, updated)`` counts.
+
+ListenerStatBucket rows are merged inside the database by ``upsert_buckets``
+so concurrent relay nodes posting the same minute never lose updates.
+
+Newline-delimited payloads are consumed record by record through
+``iter_ndjson`` and ``iter_listener_batches`` so a large relay flush is never
+held in memory as a whole.
+"""
+
+import json
+import uuid
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection
+from django.utils.dateparse import parse_datetime
+
+from apps.studio.models import ListenerSession, ListenerStatBucket, Studio
+
+BUCKET_INTERVALS = {"MINUTE", "FIVE_MIN", "HOUR"}
+
+SESSION_TEXT_FIELDS = (
+    ("ip_hash", 64),
+    ("user_agent", 255),
+    ("client_type", 32),
+    ("country", 2),
+    ("region", 64),
+    ("city", 128),
+)
+
+
+# Column bounds: a value outside them would fail the whole upsert statement
+BIGINT_MAX = 2**63 - 1
+INTEGER_MAX = 2**31 - 1
+# lat/lon are DecimalField(max_digits=7, decimal_places=4)
+COORDINATE_MAX = Decimal("999.9999")
+
+
+def _parse_iso(dt_str: str):
+    if not isinstance(dt_str, str):
+        return None
+    try:
+        return parse_datetime(dt_str)
+    except ValueError:
+        # Well-formed but out of range, e.g. month 13
+        return None
+
+
+def _int_or_zero(value, upper: int = BIGINT_MAX) -> int:
+    try:
+        return min(max(int(value or 0), 0), upper)
+    except (TypeError, ValueError, OverflowError):
+        return 0
+
+
+def _coordinate(value) -> Optional[Decimal]:
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        coordinate = Decimal(str(value)).quantize(Decimal("0.0001"))
+    except (InvalidOperation, ValueError):
+        return None
+    if not coordinate.is_finite() or abs(coordinate) > COORDINATE_MAX:
+        return None
+    return coordinate
+
+
+def batched(items: Iterable, size: int) -> Iterable[List]:
+    """Yield lists of at most ``size`` items from ``items``."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def parse_session(s: Dict) -> Optional[Dict]:
+    """
+    Normalize one raw session record from the relay payload.
+
+    Returns None when the record has no usable UUID.
+    """
+    if not isinstance(s, dict):
+        return None
+    try:
+        s_id = uuid.UUID(str(s.get("id")))
+    except (TypeError, ValueError):
+        return None
+
+    row = {
+        "id": s_id,
+        "started_at": _parse_iso(s.get("started_at")),
+        "ended_at": _parse_iso(s.get("ended_at")),
+        "lat": _coordinate(s.get("lat")),
+        "lon": _coordinate(s.get("lon")),
+        "total_bytes": _int_or_zero(s.get("total_bytes", 0)),
+    }
+    for field, max_length in SESSION_TEXT_FIELDS:
+        row[field] = str(s.get(field) or "")[:max_length]
+    return row
+
+
+def upsert_sessions_loop(studio: Studio, sessions: List[Dict], now) -> Tuple[int, int]:
+    """Upsert sessions one at a time with ``update_or_create``."""
+    inserted_sessions = 0
+    updated_sessions = 0
+
+    for s in sessions:
+        row = parse_session(s)
+        if row is None:
+            continue
+        s_id_uuid = row["id"]
+        started_at = row["started_at"]
+        ended_at = row["ended_at"]
+
+        defaults = {
+            "studio": studio,
+            **{field: row[field] for field, _max_length in SESSION_TEXT_FIELDS},
+            "lat": row["lat"],
+            "lon": row["lon"],
+            "total_bytes": row["total_bytes"],
+        }
+
+        if started_at:
+            defaults["started_at"] = started_at
+        if ended_at:
+            defaults["ended_at"] = ended_at
+        session, created = ListenerSession.objects.update_or_create(
+            pk=s_id_uuid, defaults=defaults
+        )
+        if created:
+            inserted_sessions += 1
+        else:
+            changed = False
+            for k, v in defaults.items():
+                if k == "total_bytes":
+                    new_val = max(getattr(session, k) or 0, int(v or 0))
+                else:
+                    new_val = v
+                if getattr(session, k) != new_val:
+                    setattr(session, k, new_val)
+                    changed = True
+            if changed:
+                session.save(update_fields=list(defaults.keys()))
+            updated_sessions += 1
+
+        # Always reflesh last_seen to now on any heartbeat
+        ListenerSession.objects.filter(pk=session.pk).update(last_seen=now)
+
+    return inserted_sessions, updated_sessions
+
+
+_SESSION_COLUMNS = (
+    "id",
+    "created_at",
+    "updated_at",
+    "studio_id",
+    "started_at",
+    "ended_at",
+    "last_seen",
+    "ip_hash",
+    "user_agent",
+    "client_type",
+    "country",
+    "region",
+    "city",
+    "lat",
+    "lon",
+    "total_bytes",
+)
+
+# started_at keeps the earliest value seen: a heartbeat without started_at is
+# inserted with the server time, which never moves an existing start forward.
+_SESSION_UPSERT_SQL = """
+    INSERT INTO {table} ({columns})
+    VALUES {values}
+    ON CONFLICT (id) DO UPDATE SET
+        updated_at = EXCLUDED.updated_at,
+        studio_id = EXCLUDED.studio_id,
+        started_at = LEAST({table}.started_at, EXCLUDED.started_at),
+        ended_at = COALESCE(EXCLUDED.ended_at, {table}.ended_at),
+        last_seen = EXCLUDED.last_seen,
+        ip_hash = EXCLUDED.ip_hash,
+        user_agent = EXCLUDED.user_agent,
+        client_type = EXCLUDED.client_type,
+        country = EXCLUDED.country,
+        region = EXCLUDED.region,
+        city = EXCLUDED.city,
+        lat = EXCLUDED.lat,
+        lon = EXCLUDED.lon,
+        total_bytes = GREATEST({table}.total_bytes, EXCLUDED.total_bytes)
+    RETURNING (xmax = 0) AS inserted
+"""
+
+
+def _merge_duplicate(prev: Dict, row: Dict) -> Dict:
+    merged = dict(row)
+    merged["total_bytes"] = max(prev["total_bytes"], row["total_bytes"])
+    merged["started_at"] = row["started_at"] or prev["started_at"]
+    merged["ended_at"] = row["ended_at"] or prev["ended_at"]
+    return merged
+
+
+def upsert_sessions_bulk(
+    studio: Studio, sessions: Iterable[Dict], now, batch_size: int | None = None
+) -> Tuple[int, int]:
+    """
+    Upsert sessions with one ``INSERT ... ON CONFLICT`` statement per batch.
+
+    Records repeating an id within a batch are merged before the statement
+    runs (Postgres refuses to update the same row twice in one command) and
+    counted as updates, as the loop would.
+    """
+    batch_size = batch_size or settings.LISTENER_INGEST_BATCH_SIZE
+    table = ListenerSession._meta.db_table
+    columns = ", ".join(_SESSION_COLUMNS)
+    placeholder = "(" + ", ".join(["%s"] * len(_SESSION_COLUMNS)) + ")"
+
+    inserted_sessions = 0
+    updated_sessions = 0
+
+    rows = (row for row in map(parse_session, sessions) if row is not None)
+    for batch in batched(rows, batch_size):
+        by_id: Dict[uuid.UUID, Dict] = {}
+        for row in batch:
+            prev = by_id.get(row["id"])
+            if prev is not None:
+                row = _merge_duplicate(prev, row)
+                updated_sessions += 1
+            by_id[row["id"]] = row
+
+        params = []
+        # Conflict-key order, so concurrent batches lock rows in the same order
+        for _, row in sorted(by_id.items()):
+            params.extend(
+                [
+                    row["id"],
+                    now,
+                    now,
+                    studio.pk,
+                    row["started_at"] or now,
+                    row["ended_at"],
+                    now,
+                    row["ip_hash"],
+                    row["user_agent"],
+                    row["client_type"],
+                    row["country"],
+                    row["region"],
+                    row["city"],
+                    row["lat"],
+                    row["lon"],
+                    row["total_bytes"],
+                ]
+            )
+
+        sql = _SESSION_UPSERT_SQL.format(
+            table=table,
+            columns=columns,
+            values=", ".join([placeholder] * len(by_id)),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            for (was_inserted,) in cursor.fetchall():
+                if was_inserted:
+                    inserted_sessions += 1
+                else:
+                    updated_sessions += 1
+
+    return inserted_sessions, updated_sessions
+
+
+def parse_countries(countries) -> Dict[str, int]:
+    """Keep only ``{country: int}`` pairs; anything else is dropped."""
+    if not isinstance(countries, dict):
+        return {}
+    parsed = {}
+    for country, count in countries.items():
+        try:
+            parsed[str(country)] = min(int(count or 0), INTEGER_MAX)
+        except (TypeError, ValueError, OverflowError):
+            continue
+    return parsed
+
+
+def parse_bucket(b: Dict) -> Optional[Dict]:
+    """
+    Normalize one raw stat bucket from the relay payload.
+
+    Returns None when the interval is unknown or bucket_start is missing.
+    """
+    if not isinstance(b, dict):
+        return None
+    interval = str(b.get("interval") or "").upper()
+    if interval not in BUCKET_INTERVALS:
+        return None
+    bucket_start = _parse_iso(b.get("bucket_start"))
+    if not bucket_start:
+        return None
+    return {
+        "interval": interval,
+        "bucket_start": bucket_start,
+        "active_peak": _int_or_zero(b.get("active_peak", 0), INTEGER_MAX),
+        "listener_minutes": _int_or_zero(b.get("listener_minutes", 0), INTEGER_MAX),
+        "countries_json": parse_countries(b.get("countries_json", {})),
+    }
+
+
+def merge_bucket(prev: Dict, row: Dict) -> Dict:
+    """Python twin of the ON CONFLICT clause, used for in-batch duplicates."""
+    countries = dict(prev["countries_json"])
+    for country, count in row["countries_json"].items():
+        countries[country] = countries.get(country, 0) + count
+    return {
+        "interval": row["interval"],
+        "bucket_start": row["bucket_start"],
+        "active_peak": max(prev["active_peak"], row["active_peak"]),
+        "listener_minutes": row["listener_minutes"] or prev["listener_minutes"],
+        "countries_json": countries,
+    }
+
+
+_BUCKET_COLUMNS = (
+    "id",
+    "created_at",
+    "updated_at",
+    "studio_id",
+    "interval",
+    "bucket_start",
+    "active_peak",
+    "listener_minutes",
+    "countries_json",
+)
+
+# Merge rules: the peak keeps the max, a non-zero listener_minutes replaces the
+# stored value, and countries are summed key by key. Non-numeric country
+# counts already stored are dropped, like the old Python merge skipped them.
+_BUCKET_UPSERT_SQL = """
+    INSERT INTO {table} ({columns})
+    VALUES {values}
+    ON CONFLICT (studio_id, "interval", bucket_start) DO UPDATE SET
+        updated_at = EXCLUDED.updated_at,
+        active_peak = GREATEST({table}.active_peak, EXCLUDED.active_peak),
+        listener_minutes = CASE
+            WHEN EXCLUDED.listener_minutes > 0 THEN EXCLUDED.listener_minutes
+            ELSE {table}.listener_minutes
+        END,
+        countries_json = (
+            SELECT COALESCE(jsonb_object_agg(c.key, c.total), '{{}}'::jsonb)
+            FROM (
+                SELECT e.key, SUM(e.value::bigint) AS total
+                FROM (
+                    SELECT key, value FROM jsonb_each_text({table}.countries_json)
+                    UNION ALL
+                    SELECT key, value FROM jsonb_each_text(EXCLUDED.countries_json)
+                ) AS e
+                WHERE e.value ~ '^-?[0-9]+$'
+                GROUP BY e.key
+            ) AS c
+        )
+"""
+
+
+def upsert_buckets(
+    studio: Studio, buckets: Iterable[Dict], now, batch_size: int | None = None
+) -> int:
+    """
+    Upsert stat buckets by (studio, interval, bucket_start).
+
+    Each batch is applied with a single ``INSERT ... ON CONFLICT`` statement
+    that merges with the stored row server-side, so the query count does not
+    grow with the number of buckets. Returns the number of buckets applied.
+    """
+    batch_size = batch_size or settings.LISTENER_INGEST_BATCH_SIZE
+    table = ListenerStatBucket._meta.db_table
+    columns = ", ".join(connection.ops.quote_name(c) for c in _BUCKET_COLUMNS)
+    placeholder = "(%s, %s, %s, %s, %s, %s, %s, %s, %s::jsonb)"
+
+    upserted_buckets = 0
+
+    rows = (row for row in map(parse_bucket, buckets) if row is not None)
+    for batch in batched(rows, batch_size):
+        by_key: Dict[Tuple, Dict] = {}
+        for row in batch:
+            key = (row["interval"], row["bucket_start"])
+            prev = by_key.get(key)
+            by_key[key] = merge_bucket(prev, row) if prev is not None else row
+            upserted_buckets += 1
+
+        params = []
+        # Conflict-key order, so concurrent batches lock rows in the same order
+        for _, row in sorted(by_key.items()):
+            params.extend(
+                [
+                    uuid.uuid4(),
+                    now,
+                    now,
+                    studio.pk,
+                    row["interval"],
+                    row["bucket_start"],
+                    row["active_peak"],
+                    row["listener_minutes"],
+                    json.dumps(row["countries_json"]),
+                ]
+            )
+
+        sql = _BUCKET_UPSERT_SQL.format(
+            table=table,
+            columns=columns,
+            values=", ".join([placeholder] * len(by_key)),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    return upserted_buckets
+
+
+def clean_listener_records(
+    sessions: Iterable[Dict], buckets: Iterable[Dict]
+) -> Tuple[List[Dict], List[Dict], int]:
+    """
+    ``(sessions, buckets, dropped)``: the raw records the upserts would apply.
+
+    Used before a payload is queued, so the stream only holds records the
+    drain can write.
+    """
+    kept_sessions = [s for s in sessions if parse_session(s) is not None]
+    kept_buckets = [b for b in buckets if parse_bucket(b) is not None]
+    dropped = len(sessions) + len(buckets) - len(kept_sessions) - len(kept_buckets)
+    return kept_sessions, kept_buckets, dropped
+
+
+def apply_listener_payload(
+    studio: Studio, sessions: Iterable[Dict], buckets: Iterable[Dict], now
+) -> Dict[str, int]:
+    """
+    Apply one listener-events payload: sessions first, then stat buckets.
+
+    Returns the counters reported by the endpoint. Must run inside a
+    transaction.
+    """
+    # Upsert ListenerSession by explicit UUID (client-provided)
+    if getattr(settings, "LISTENER_INGEST_BULK", True):
+        inserted_sessions, updated_sessions = upsert_sessions_bulk(
+            studio, sessions, now
+        )
+    else:
+        inserted_sessions, updated_sessions = upsert_sessions_loop(
+            studio, list(sessions), now
+        )
+
+    # Upsert ListenerStatBucket by unique (studio, interval, bucket_start)
+    upserted_buckets = upsert_buckets(studio, buckets, now)
+
+    return {
+        "inserted_sessions": inserted_sessions,
+        "updated_sessions": updated_sessions,
+        "upserted_buckets": upserted_buckets,
+    }
+
+
+class BodyTooLarge(Exception): ...
+
+
+class BoundedReader:
+    """
+    Read-only view of a (possibly decompressing) body stream that raises
+    BodyTooLarge past ``max_bytes`` in total or, when iterated line by line,
+    past ``max_line`` bytes in one line. Caps what a gzip body expands to,
+    which Content-Length and DATA_UPLOAD_MAX_MEMORY_SIZE cannot.
+    """
+
+    CHUNK = 64 * 1024
+
+    def __init__(self, stream, max_bytes: int, max_line: int):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.max_line = max_line
+        self.consumed = 0
+
+    def _count(self, data: bytes) -> bytes:
+        self.consumed += len(data)
+        if self.consumed > self.max_bytes:
+            raise BodyTooLarge(f"Body larger than {self.max_bytes} bytes")
+        return data
+
+    def read(self, size: int = -1) -> bytes:
+        if size is not None and size >= 0:
+            return self._count(self.stream.read(size))
+        chunks = []
+        while chunk := self._count(self.stream.read(self.CHUNK)):
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def __iter__(self) -> Iterator[bytes]:
+        while line := self._count(self.stream.readline(self.max_line + 1)):
+            if len(line) > self.max_line:
+                raise BodyTooLarge(f"Line longer than {self.max_line} bytes")
+            yield line
+
+
+def iter_ndjson(stream: Iterable[bytes]) -> Iterator[Optional[Dict]]:
+    """
+    Yield one object per non-empty line of ``stream``.
+
+    Lines that are not a JSON object yield None so callers can count them.
+    """
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield None
+            continue
+        yield record if isinstance(record, dict) else None
+
+
+def iter_listener_batches(
+    records: Iterable[Optional[Dict]], batch_size: int | None = None
+) -> Iterator[Tuple[List[Dict], List[Dict], int]]:
+    """
+    Group streamed records into ``(sessions, buckets, invalid)`` batches.
+
+    A record is a bucket when ``kind`` is "bucket" or, without ``kind``, when
+    it carries ``bucket_start``; anything else is a session. Each batch holds
+    at most ``batch_size`` records.
+    """
+    batch_size = batch_size or settings.LISTENER_INGEST_BATCH_SIZE
+    sessions: List[Dict] = []
+    buckets: List[Dict] = []
+    invalid = 0
+    for record in records:
+        if record is None:
+            invalid += 1
+            continue
+        kind = record.get("kind") or ("bucket" if "bucket_start" in record else "")
+        if kind == "bucket":
+            buckets.append(record)
+        else:
+            sessions.append(record)
+        if len(sessions) + len(buckets) >= batch_size:
+            yield sessions, buckets, invalid
+            sessions, buckets, invalid = [], [], 0
+    if sessions or buckets or invalid:
+        yield sessions, buckets, invalid
@@ -0,0 +1,268 @@
+"""
+Redis-stream buffer for the ingest endpoints (opt-in via ``INGEST_ASYNC``).
+
+The endpoints validate the payload, ``XADD`` it to one stream and answer 202.
+``apps.studio.tasks.drain_ingest_stream`` reads the stream through a consumer
+group in micro-batches and applies entries with the same service functions
+the synchronous path uses. Entries are acknowledged and deleted only after
+their transaction commits; entries left pending by a crashed worker or a
+failed apply are reclaimed after ``INGEST_CLAIM_IDLE_MS``. An entry still
+failing after ``INGEST_MAX_DELIVERIES`` deliveries is moved to the
+``ingest:events:dead`` stream (with its error) instead of being retried
+forever.
+
+A body read in several batches (NDJSON) is staged first: each batch is
+appended to a private ``ingest:staging:<id>`` stream as it is parsed, and the
+staged entries are moved to the ingest stream only once the whole body was
+read (``promote``), so a body rejected half-way queues nothing. Staging
+streams of requests that died expire after ``STAGING_TTL`` seconds.
+
+A drain is scheduled by the first request that finds no drain pending (a
+``SET NX`` flag), so a burst of heartbeats costs one Celery task per
+``INGEST_DRAIN_DELAY`` window instead of one per request.
+"""
+
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+KIND_LISTENER = "listener"
+KIND_PLAY = "play"
+
+STREAM_KEY = "ingest:events"
+GROUP_NAME = "ingest-appliers"
+DRAIN_FLAG_KEY = "ingest:events:drain-scheduled"
+DEAD_STREAM_KEY = "ingest:events:dead"
+DEAD_STREAM_MAXLEN = 10000
+STAGING_KEY_PREFIX = "ingest:staging:"
+STAGING_TTL = 3600
+# Staged entries moved per MULTI/EXEC block by promote
+PROMOTE_CHUNK = 100
+
+_client: Optional[redis.Redis] = None
+
+
+def get_client() -> redis.Redis:
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.INGEST_QUEUE_URL)
+    return _client
+
+
+def consumer_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def ensure_group(client: redis.Redis) -> None:
+    try:
+        client.xgroup_create(STREAM_KEY, GROUP_NAME, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def _entry(kind: str, studio_id, payload) -> Dict[str, str]:
+    return {
+        "kind": kind,
+        "studio_id": str(studio_id),
+        "received_at": timezone.now().isoformat(),
+        "payload": json.dumps(payload, separators=(",", ":")),
+    }
+
+
+def enqueue(kind: str, studio_id, payload) -> str:
+    """Append one validated payload to the stream and make sure a drain runs."""
+    client = get_client()
+    entry_id = client.xadd(
+        STREAM_KEY,
+        _entry(kind, studio_id, payload),
+        maxlen=settings.INGEST_STREAM_MAXLEN,
+        approximate=True,
+    )
+    schedule_drain(client)
+    return entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+
+
+def staging_key() -> str:
+    return f"{STAGING_KEY_PREFIX}{uuid.uuid4().hex}"
+
+
+def stage(key: str, kind: str, studio_id, payload) -> None:
+    """Append one validated payload to the staging stream ``key``."""
+    pipe = get_client().pipeline()
+    pipe.xadd(key, _entry(kind, studio_id, payload))
+    pipe.expire(key, STAGING_TTL)
+    pipe.execute()
+
+
+def promote(key: str) -> int:
+    """
+    Move every entry staged under ``key`` to the ingest stream, in order,
+    and make sure a drain runs. Returns the number of entries moved.
+    """
+    client = get_client()
+    moved = 0
+    while True:
+        entries = client.xrange(key, count=PROMOTE_CHUNK)
+        if not entries:
+            break
+        pipe = client.pipeline(transaction=True)
+        for _entry_id, fields in entries:
+            pipe.xadd(
+                STREAM_KEY,
+                fields,
+                maxlen=settings.INGEST_STREAM_MAXLEN,
+                approximate=True,
+            )
+        pipe.xdel(key, *[entry_id for entry_id, _fields in entries])
+        pipe.execute()
+        moved += len(entries)
+    client.delete(key)
+    if moved:
+        schedule_drain(client)
+    return moved
+
+
+def discard(key: str) -> None:
+    """Drop a staging stream (body rejected)."""
+    get_client().delete(key)
+
+
+def schedule_drain(
+    client: Optional[redis.Redis] = None, delay: Optional[float] = None
+) -> bool:
+    """Queue a drain task unless one is already pending. Returns True if queued."""
+    client = client or get_client()
+    if delay is None:
+        delay = settings.INGEST_DRAIN_DELAY
+    if not client.set(DRAIN_FLAG_KEY, "1", nx=True, ex=max(int(delay) * 10, 30)):
+        return False
+    # Imported here: tasks imports this module
+    from apps.studio.tasks import drain_ingest_stream
+
+    drain_ingest_stream.apply_async(countdown=delay)
+    return True
+
+
+def clear_drain_flag(client: Optional[redis.Redis] = None) -> None:
+    """Called when a drain starts so later requests schedule the next one."""
+    (client or get_client()).delete(DRAIN_FLAG_KEY)
+
+
+def _decode(fields: Dict) -> Dict[str, str]:
+    return {
+        (k.decode() if isinstance(k, bytes) else k): (
+            v.decode() if isinstance(v, bytes) else v
+        )
+        for k, v in fields.items()
+    }
+
+
+def read_batch(
+    client: redis.Redis, consumer: str, count: int
+) -> List[Tuple[str, Dict[str, str]]]:
+    """
+    Return up to ``count`` entries for this consumer.
+
+    Stale entries pending on other (dead) consumers are claimed first, then
+    new entries are read.
+    """
+    ensure_group(client)
+    entries = []
+    claimed = client.xautoclaim(
+        STREAM_KEY,
+        GROUP_NAME,
+        consumer,
+        min_idle_time=settings.INGEST_CLAIM_IDLE_MS,
+        start_id="0-0",
+        count=count,
+    )
+    # xautoclaim returns [next_id, entries] or [next_id, entries, deleted_ids]
+    entries.extend(e for e in claimed[1] if e and e[1])
+    if len(entries) < count:
+        response = client.xreadgroup(
+            GROUP_NAME, consumer, {STREAM_KEY: ">"}, count=count - len(entries)
+        )
+        for _stream, stream_entries in response or []:
+            entries.extend(stream_entries)
+    return [
+        (entry_id.decode() if isinstance(entry_id, bytes) else entry_id, _decode(f))
+        for entry_id, f in entries
+    ]
+
+
+def ack(client: redis.Redis, entry_ids: List[str]) -> None:
+    if not entry_ids:
+        return
+    pipe = client.pipeline()
+    pipe.xack(STREAM_KEY, GROUP_NAME, *entry_ids)
+    pipe.xdel(STREAM_KEY, *entry_ids)
+    pipe.execute()
+
+
+def delivery_count(client: redis.Redis, entry_id: str) -> int:
+    """Times ``entry_id`` was delivered to a consumer (0 when not pending)."""
+    pending = client.xpending_range(
+        STREAM_KEY, GROUP_NAME, min=entry_id, max=entry_id, count=1
+    )
+    return pending[0]["times_delivered"] if pending else 0
+
+
+def dead_letter(
+    client: redis.Redis, entry_id: str, fields: Dict[str, str], error: str
+) -> None:
+    """Move one entry to DEAD_STREAM_KEY and drop it from the ingest stream."""
+    client.xadd(
+        DEAD_STREAM_KEY,
+        {**fields, "entry_id": entry_id, "error": error[:1000]},
+        maxlen=DEAD_STREAM_MAXLEN,
+        approximate=True,
+    )
+    ack(client, [entry_id])
+
+
+def _entry_age_seconds(entry_id: str, now_ms: int) -> float:
+    try:
+        return max(now_ms - int(entry_id.split("-", 1)[0]), 0) / 1000.0
+    except (ValueError, AttributeError):
+        return 0.0
+
+
+def queue_stats(client: Optional[redis.Redis] = None) -> Dict:
+    """
+    Depth and lag of the ingest stream.
+
+    - ``depth``: entries still in the stream (unread + pending)
+    - ``pending``: entries delivered to a consumer but not yet acknowledged
+    - ``lag_seconds``: age of the oldest entry not yet applied
+    - ``dead``: entries given up on (DEAD_STREAM_KEY)
+    """
+    client = client or get_client()
+    ensure_group(client)
+    depth = client.xlen(STREAM_KEY)
+    pending = client.xpending(STREAM_KEY, GROUP_NAME).get("pending", 0)
+    oldest = client.xrange(STREAM_KEY, count=1)
+    now_ms = int(time.time() * 1000)
+    lag_seconds = 0.0
+    if oldest:
+        entry_id = oldest[0][0]
+        if isinstance(entry_id, bytes):
+            entry_id = entry_id.decode()
+        lag_seconds = _entry_age_seconds(entry_id, now_ms)
+    return {
+        "stream": STREAM_KEY,
+        "depth": depth,
+        "pending": pending,
+        "lag_seconds": round(lag_seconds, 3),
+        "dead": client.xlen(DEAD_STREAM_KEY),
+    }
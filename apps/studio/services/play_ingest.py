@@ -0,0 +1,133 @@
+"""
+Write path for the play-events ingest endpoint.
+
+Shared by the synchronous view and the queue consumer
+(``apps.studio.tasks.drain_ingest_stream``).
+"""
+
+import datetime
+from typing import Dict, List, Tuple
+
+from django.utils import timezone
+
+from apps.studio.models.analytics import PlayEvent
+from apps.studio.models.base import Studio
+from apps.studio.services.sequences import allocate_play_sequences
+from apps.studio.services.track_resolver import resolve_tracks
+
+EVENT_START = "track_started"
+EVENT_END = "track_ended"
+
+
+def _parse_iso(ts: str):
+    if not ts or not isinstance(ts, str):
+        return None
+    try:
+        return datetime.datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def apply_play_events(studio: Studio, events: List[Dict]) -> Tuple[int, int, List]:
+    """
+    Record track start/end events for a studio.
+
+    Returns (created, updated, errors). Must run inside a transaction.
+
+    The batch is planned first (end events are matched with the open play
+    they close, stored or started earlier in the batch), then sequence
+    numbers are reserved with one allocation for the rows actually created,
+    in event order, so errors and closing end events leave no gap.
+    """
+    created, updated, errors = 0, 0, []
+
+    tracks = resolve_tracks(
+        studio,
+        (
+            evt.get("track_id") or evt.get("track_uuid") or evt.get("file")
+            for evt in events
+        ),
+    )
+    new_events: List[PlayEvent] = []
+    closed: List[PlayEvent] = []
+    # Plays opened by this batch and not closed yet, per track
+    batch_open: Dict = {}
+
+    for evt in events:
+        etype = evt.get("type")
+        track_token = evt.get("track_id") or evt.get("track_uuid") or evt.get("file")
+        started_at = _parse_iso(evt.get("started_at"))
+        ended_at = _parse_iso(evt.get("ended_at"))
+        source = str(evt.get("source") or "AUTO")[:16]
+
+        if etype not in {EVENT_START, EVENT_END}:
+            errors.append({"event": evt, "error": "unknown type"})
+            continue
+
+        if not track_token:
+            errors.append({"event": evt, "error": "missing track id"})
+            continue
+
+        track = tracks.get(str(track_token))
+        if not track:
+            errors.append({"event": evt, "error": "track not found"})
+            continue
+
+        if etype == EVENT_START:
+            if not started_at:
+                started_at = timezone.now()
+            play = PlayEvent(
+                studio=studio, track=track, started_at=started_at, source=source
+            )
+            new_events.append(play)
+            batch_open.setdefault(track.pk, []).append(play)
+            created += 1
+
+        elif etype == EVENT_END:
+            # Close the latest open play of the track, stored or from this batch
+            open_ev = (
+                PlayEvent.objects.filter(
+                    studio=studio, track=track, ended_at__isnull=True
+                )
+                .exclude(pk__in=[play.pk for play in closed])
+                .order_by("-started_at")
+                .first()
+            )
+            pending = batch_open.get(track.pk)
+            if pending:
+                latest = max(pending, key=lambda play: play.started_at)
+                if open_ev is None or latest.started_at >= open_ev.started_at:
+                    pending.remove(latest)
+                    open_ev = latest
+            if ended_at is None:
+                ended_at = timezone.now()
+            if open_ev:
+                open_ev.ended_at = ended_at
+                # A play of this batch is written with its end below
+                if not open_ev._state.adding:
+                    open_ev.save(update_fields=["ended_at", "updated_at"])
+                    closed.append(open_ev)
+                updated += 1
+            else:
+                # Recovery path: create a finished event with guessed start
+                guess_start = ended_at - datetime.timedelta(
+                    seconds=float(track.duration_seconds or 0)
+                )
+                new_events.append(
+                    PlayEvent(
+                        studio=studio,
+                        track=track,
+                        started_at=guess_start,
+                        ended_at=ended_at,
+                        source=source,
+                    )
+                )
+                created += 1
+
+    for play, sequence in zip(
+        new_events, allocate_play_sequences(studio, len(new_events))
+    ):
+        play.sequence = sequence
+        play.save()
+
+    return created, updated, errors
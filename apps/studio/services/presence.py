@@ -0,0 +1,237 @@
+"""
+Live listener presence ("active now") kept outside the database.
+
+Every heartbeat accepted by the listener ingest endpoint stamps its session
+with the ingest time. A session is active while its stamp is newer than
+``LISTENER_ACTIVE_WINDOW_SECONDS``, the same rule the database path applies
+to ``ListenerSession.last_seen``.
+
+Backends (``LISTENER_PRESENCE_BACKEND``):
+
+- ``redis``: one sorted set per studio (member = session id, score = last
+  seen epoch) plus a hash of session countries. Active-now is a ``ZCOUNT``;
+  expired members are pruned on write. Shared by every worker.
+- ``memory``: the same structure in process memory, for single-process
+  deployments only.
+- empty: disabled; counts are read from ``ListenerSession``.
+
+Presence never blocks ingest: Redis calls time out after
+``LISTENER_PRESENCE_TIMEOUT`` seconds, backend errors and timeouts are
+logged and the database path is used for reads.
+"""
+
+import datetime
+import logging
+import threading
+from typing import Dict, Iterable, Tuple
+
+import redis
+from django.conf import settings
+from django.db.models import Count
+
+from apps.studio.models import ListenerSession, Studio
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "presence"
+# Max expired members removed per write, so one write never stalls on a
+# studio that has been idle for a long time (the rest goes on later writes)
+PRUNE_BATCH = 1000
+# Swallowed by writes and reads; OSError covers socket timeouts raised
+# outside redis-py's own wrapping
+BACKEND_ERRORS = (redis.RedisError, OSError)
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def window_seconds() -> int:
+    return getattr(settings, "LISTENER_ACTIVE_WINDOW_SECONDS", 20)
+
+
+def _window() -> datetime.timedelta:
+    return datetime.timedelta(seconds=window_seconds())
+
+
+class RedisPresence:
+    def __init__(self, url: str):
+        timeout = getattr(settings, "LISTENER_PRESENCE_TIMEOUT", 0.5)
+        self.client = redis.Redis.from_url(
+            url, socket_timeout=timeout, socket_connect_timeout=timeout
+        )
+
+    @staticmethod
+    def _keys(studio_id) -> Tuple[str, str]:
+        return f"{KEY_PREFIX}:{studio_id}", f"{KEY_PREFIX}:{studio_id}:countries"
+
+    def record(self, studio_id, entries: Dict[str, str], now_ts: float) -> None:
+        key, countries_key = self._keys(studio_id)
+        cutoff = now_ts - window_seconds()
+        ttl = max(window_seconds() * 3, 60)
+
+        pipe = self.client.pipeline()
+        pipe.zadd(key, {session_id: now_ts for session_id in entries})
+        countries = {sid: country for sid, country in entries.items() if country}
+        if countries:
+            pipe.hset(countries_key, mapping=countries)
+        pipe.expire(key, ttl)
+        pipe.expire(countries_key, ttl)
+        pipe.zrangebyscore(key, "-inf", f"({cutoff}", start=0, num=PRUNE_BATCH)
+        expired = pipe.execute()[-1]
+        if expired:
+            pipe = self.client.pipeline()
+            pipe.zrem(key, *expired)
+            pipe.hdel(countries_key, *expired)
+            pipe.execute()
+
+    def active_count(self, studio_id, now_ts: float) -> int:
+        key, _countries_key = self._keys(studio_id)
+        return self.client.zcount(key, now_ts - window_seconds(), "+inf")
+
+    def active_countries(self, studio_id, now_ts: float) -> Dict[str, int]:
+        key, countries_key = self._keys(studio_id)
+        members = self.client.zrangebyscore(key, now_ts - window_seconds(), "+inf")
+        counts: Dict[str, int] = {}
+        if not members:
+            return counts
+        for country in self.client.hmget(countries_key, members):
+            if country:
+                code = country.decode() if isinstance(country, bytes) else country
+                counts[code] = counts.get(code, 0) + 1
+        return counts
+
+
+class MemoryPresence:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # studio id -> {session id: (last seen epoch, country)}
+        self.studios: Dict[str, Dict[str, Tuple[float, str]]] = {}
+
+    def record(self, studio_id, entries: Dict[str, str], now_ts: float) -> None:
+        cutoff = now_ts - window_seconds()
+        with self.lock:
+            sessions = self.studios.setdefault(str(studio_id), {})
+            for session_id, country in entries.items():
+                if not country and session_id in sessions:
+                    country = sessions[session_id][1]
+                sessions[session_id] = (now_ts, country)
+            for session_id in [s for s, (ts, _c) in sessions.items() if ts < cutoff]:
+                del sessions[session_id]
+
+    def _active(self, studio_id, now_ts: float):
+        cutoff = now_ts - window_seconds()
+        with self.lock:
+            sessions = self.studios.get(str(studio_id), {})
+            return [country for ts, country in sessions.values() if ts >= cutoff]
+
+    def active_count(self, studio_id, now_ts: float) -> int:
+        return len(self._active(studio_id, now_ts))
+
+    def active_countries(self, studio_id, now_ts: float) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for country in self._active(studio_id, now_ts):
+            if country:
+                counts[country] = counts.get(country, 0) + 1
+        return counts
+
+
+def get_backend():
+    """The configured presence backend, or None when presence is disabled."""
+    global _backend
+    name = getattr(settings, "LISTENER_PRESENCE_BACKEND", "")
+    if not name:
+        return None
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if name == "redis":
+                    _backend = RedisPresence(settings.LISTENER_PRESENCE_URL)
+                elif name == "memory":
+                    _backend = MemoryPresence()
+                else:
+                    raise ValueError(f"Unknown LISTENER_PRESENCE_BACKEND: {name}")
+    return _backend
+
+
+def record_sessions(studio: Studio, sessions: Iterable[Dict], now) -> None:
+    """
+    Mark every session of a parsed heartbeat batch (see ``parse_session``)
+    as seen at ``now``.
+    """
+    backend = get_backend()
+    if backend is None:
+        return
+    entries = {str(s["id"]): s.get("country", "") for s in sessions}
+    if not entries:
+        return
+    try:
+        backend.record(studio.pk, entries, now.timestamp())
+    except BACKEND_ERRORS:
+        logger.warning("presence: failed to record heartbeats", exc_info=True)
+
+
+def db_active_count(studio: Studio, now) -> int:
+    return ListenerSession.objects.filter(
+        studio=studio, last_seen__gte=now - _window()
+    ).count()
+
+
+def db_active_countries(studio: Studio, now) -> Dict[str, int]:
+    rows = (
+        ListenerSession.objects.filter(studio=studio, last_seen__gte=now - _window())
+        .exclude(country="")
+        .values("country")
+        .annotate(count=Count("id"))
+    )
+    return {row["country"]: row["count"] for row in rows}
+
+
+def _from_backend(method: str, studio: Studio, now):
+    backend = get_backend()
+    if backend is None:
+        return None
+    try:
+        return getattr(backend, method)(studio.pk, now.timestamp())
+    except BACKEND_ERRORS:
+        logger.warning("presence: read failed, using the database", exc_info=True)
+        return None
+
+
+def active_count(studio: Studio, now) -> int:
+    """Listeners seen within the active window."""
+    count = _from_backend("active_count", studio, now)
+    return db_active_count(studio, now) if count is None else count
+
+
+def active_countries(studio: Studio, now) -> Dict[str, int]:
+    """Active listeners per country code (sessions without a country skipped)."""
+    counts = _from_backend("active_countries", studio, now)
+    return db_active_countries(studio, now) if counts is None else counts
+
+
+def compare_with_database(studio: Studio, now) -> Dict:
+    """
+    Presence counts next to the database ones for the same instant.
+
+    With ``INGEST_ASYNC`` the database trails presence by the drain lag, so
+    small positive drifts are expected while the ingest stream is busy.
+    """
+    backend = get_backend()
+    if backend is None:
+        raise ValueError("LISTENER_PRESENCE_BACKEND is not set")
+    presence_count = backend.active_count(studio.pk, now.timestamp())
+    database_count = db_active_count(studio, now)
+    presence_countries = backend.active_countries(studio.pk, now.timestamp())
+    database_countries = db_active_countries(studio, now)
+    country_drift = {
+        code: presence_countries.get(code, 0) - database_countries.get(code, 0)
+        for code in set(presence_countries) | set(database_countries)
+        if presence_countries.get(code, 0) != database_countries.get(code, 0)
+    }
+    return {
+        "studio": studio.slug,
+        "presence": presence_count,
+        "database": database_count,
+        "drift": presence_count - database_count,
+        "country_drift": country_drift,
+    }
@@ -0,0 +1,209 @@
+"""
+Daily listener rollups (ListenerDailyRollup).
+
+``rollup_listener_days`` recomputes whole UTC days from raw data and upserts
+one row per (studio, day):
+
+- session_starts: ListenerSession rows whose started_at falls in the day
+- unique_listeners: distinct non-empty ip_hash among those sessions
+- listener_minutes: sum of ListenerStatBucket.listener_minutes, hour by
+  hour from whichever interval holds the most for that hour. MINUTE rows are
+  purged after LISTENER_MINUTE_RETENTION_DAYS, so older days are read from
+  their FIVE_MIN/HOUR compactions, and hours not compacted yet from MINUTE
+  rows (every level sums the same minutes, a lagging one is never larger)
+
+``daily_session_starts`` reads per-day session starts for a studio from the
+rollups and fills every day without a rollup row (always including today)
+from raw sessions with one grouped query.
+"""
+
+import datetime
+from typing import Dict, Optional
+
+from django.db import connection
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from apps.studio.models import (
+    ListenerDailyRollup,
+    ListenerSession,
+    ListenerStatBucket,
+    Studio,
+)
+
+
+def day_start(day: datetime.date) -> datetime.datetime:
+    return datetime.datetime.combine(
+        day, datetime.time.min, tzinfo=datetime.timezone.utc
+    )
+
+
+_LISTENER_MINUTES_SQL = """
+    SELECT studio_id, hour::date AS day, SUM(minutes) AS minutes
+    FROM (
+        SELECT studio_id, hour, MAX(minutes) AS minutes
+        FROM (
+            SELECT studio_id,
+                   "interval",
+                   date_trunc('hour', bucket_start AT TIME ZONE 'UTC') AS hour,
+                   SUM(listener_minutes) AS minutes
+            FROM {table}
+            WHERE deleted_at IS NULL
+              AND bucket_start >= %(since)s
+              AND bucket_start < %(until)s
+              {studio_filter}
+            GROUP BY studio_id, "interval", hour
+        ) AS per_interval
+        GROUP BY studio_id, hour
+    ) AS per_hour
+    GROUP BY studio_id, day
+"""
+
+
+def listener_minutes_per_day(
+    since: datetime.datetime,
+    until: datetime.datetime,
+    studio: Optional[Studio] = None,
+) -> Dict[tuple, int]:
+    """``{(studio_id, day): listener minutes}`` over every bucket interval."""
+    sql = _LISTENER_MINUTES_SQL.format(
+        table=ListenerStatBucket._meta.db_table,
+        studio_filter="AND studio_id = %(studio_id)s" if studio is not None else "",
+    )
+    params = {"since": since, "until": until}
+    if studio is not None:
+        params["studio_id"] = studio.pk
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {
+            (studio_id, day): int(minutes or 0)
+            for studio_id, day, minutes in cursor.fetchall()
+        }
+
+
+def rollup_listener_days(
+    first_day: datetime.date,
+    last_day: datetime.date,
+    studio: Optional[Studio] = None,
+) -> int:
+    """
+    Recompute rollups for every day in [first_day, last_day].
+
+    Issues a fixed number of queries regardless of the number of studios.
+    Returns the number of rollup rows written.
+    """
+    since = day_start(first_day)
+    until = day_start(last_day + datetime.timedelta(days=1))
+
+    sessions = ListenerSession.objects.filter(
+        started_at__gte=since, started_at__lt=until
+    )
+    if studio is not None:
+        sessions = sessions.filter(studio=studio)
+
+    totals: Dict[tuple, Dict[str, int]] = {}
+
+    session_rows = (
+        sessions.annotate(day=TruncDate("started_at"))
+        .values("studio_id", "day")
+        .annotate(
+            starts=Count("id"),
+            uniques=Count("ip_hash", distinct=True, filter=~Q(ip_hash="")),
+        )
+    )
+    for row in session_rows:
+        entry = totals.setdefault((row["studio_id"], row["day"]), {})
+        entry["session_starts"] = row["starts"]
+        entry["unique_listeners"] = row["uniques"]
+
+    for key, minutes in listener_minutes_per_day(since, until, studio).items():
+        totals.setdefault(key, {})["listener_minutes"] = minutes
+
+    now = timezone.now()
+    rollups = [
+        ListenerDailyRollup(
+            studio_id=studio_id,
+            day=day,
+            session_starts=values.get("session_starts", 0),
+            unique_listeners=values.get("unique_listeners", 0),
+            listener_minutes=values.get("listener_minutes", 0),
+            created_at=now,
+            updated_at=now,
+        )
+        for (studio_id, day), values in totals.items()
+    ]
+    ListenerDailyRollup.objects.bulk_create(
+        rollups,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=["studio", "day"],
+        update_fields=[
+            "session_starts",
+            "unique_listeners",
+            "listener_minutes",
+            "updated_at",
+            # A recomputed day revives a soft-deleted rollup row
+            "deleted_at",
+        ],
+    )
+
+    # Days that lost all their data since the last run are reset to zero
+    existing = ListenerDailyRollup.objects.filter(
+        day__gte=first_day, day__lte=last_day
+    ).values_list("pk", "studio_id", "day")
+    if studio is not None:
+        existing = existing.filter(studio=studio)
+    stale = [pk for pk, studio_id, day in existing if (studio_id, day) not in totals]
+    if stale:
+        ListenerDailyRollup.objects.filter(pk__in=stale).update(
+            session_starts=0, unique_listeners=0, listener_minutes=0
+        )
+
+    return len(rollups)
+
+
+def daily_session_starts(
+    studio: Studio, first_day: datetime.date, today: datetime.date
+) -> Dict[datetime.date, int]:
+    """
+    Session starts per day for [first_day, today].
+
+    Days with a rollup row come from it; every other day (today, days the
+    rollup task has not reached yet, gaps left by a failed run) is counted
+    from raw sessions, over runs of consecutive missing days.
+    """
+    per_day: Dict[datetime.date, int] = {}
+    rollups = ListenerDailyRollup.objects.filter(
+        studio=studio, day__gte=first_day, day__lt=today
+    ).values_list("day", "session_starts")
+    for day, starts in rollups:
+        per_day[day] = starts
+
+    # Days without sessions have no rollup row either: they are read again
+    # from raw sessions, an empty index range
+    ranges = []
+    day = first_day
+    while day <= today:
+        if day in per_day:
+            day += datetime.timedelta(days=1)
+            continue
+        start = day
+        while day <= today and day not in per_day:
+            day += datetime.timedelta(days=1)
+        ranges.append(
+            Q(started_at__gte=day_start(start), started_at__lt=day_start(day))
+        )
+
+    missing = Q()
+    for condition in ranges:
+        missing |= condition
+    raw_rows = (
+        ListenerSession.objects.filter(missing, studio=studio)
+        .annotate(day=TruncDate("started_at"))
+        .values("day")
+        .annotate(starts=Count("id"))
+    )
+    for row in raw_rows:
+        per_day[row["day"]] = row["starts"]
+    return per_day
@@ -0,0 +1,60 @@
+"""
+Per-studio allocator for PlayEvent.sequence.
+
+A block of numbers is reserved with one ``UPDATE ... RETURNING`` on the
+studio's counter row. The row lock is held until the surrounding transaction
+ends, so concurrent ingests for the same studio get disjoint blocks instead
+of colliding on the (studio, sequence) unique constraint. The first
+allocation for a studio creates the counter, seeded from the highest
+existing sequence.
+"""
+
+import uuid
+
+from django.db import connection
+from django.utils import timezone
+
+from apps.studio.models import PlayEvent, PlayEventSequence, Studio
+
+_UPDATE_SQL = """
+    UPDATE {counters}
+    SET last_value = last_value + %s, updated_at = %s
+    WHERE studio_id = %s
+    RETURNING last_value
+"""
+
+_INSERT_SQL = """
+    INSERT INTO {counters} (id, created_at, updated_at, studio_id, last_value)
+    VALUES (
+        %s, %s, %s, %s,
+        (SELECT COALESCE(MAX(sequence), 0) FROM {events} WHERE studio_id = %s) + %s
+    )
+    ON CONFLICT (studio_id) DO UPDATE SET
+        last_value = {counters}.last_value + %s,
+        updated_at = EXCLUDED.updated_at
+    RETURNING last_value
+"""
+
+
+def allocate_play_sequences(studio: Studio, count: int) -> range:
+    """Reserve ``count`` consecutive sequence numbers for ``studio``."""
+    if count <= 0:
+        return range(0)
+
+    now = timezone.now()
+    tables = {
+        "counters": PlayEventSequence._meta.db_table,
+        "events": PlayEvent._meta.db_table,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(_UPDATE_SQL.format(**tables), [count, now, studio.pk])
+        row = cursor.fetchone()
+        if row is None:
+            # First allocation for this studio (or a race with another first one)
+            cursor.execute(
+                _INSERT_SQL.format(**tables),
+                [uuid.uuid4(), now, now, studio.pk, studio.pk, count, count],
+            )
+            row = cursor.fetchone()
+    last_value = row[0]
+    return range(last_value - count + 1, last_value + 1)
@@ -0,0 +1,165 @@
+"""
+Process-local cache for Studio lookups by slug or pk.
+
+Entries expire after ``STUDIO_CACHE_TTL`` seconds and the cache holds at most
+``STUDIO_CACHE_MAX_ENTRIES`` lookup keys (least recently used are evicted).
+When ``STUDIO_CACHE_ALIAS`` names a Django cache, misses fall through to it
+before hitting the database, so gunicorn workers share warm entries.
+
+Saving or deleting a Studio invalidates it (see ``apps.studio.signals``) in
+this process and in the shared cache once the transaction commits; local
+copies held by other workers expire with the TTL. Bulk writes send no
+signal: after ``Studio.objects.filter(...).update(...)``, including the
+soft delete of ``QuerySet.delete()``, call ``invalidate`` for each studio
+(or ``clear``), otherwise cached copies live until the TTL.
+
+Hit/miss counters are per process: every ``STUDIO_CACHE_STATS_INTERVAL``
+seconds a lookup logs them (``stats``) at INFO level.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+from apps.studio.models.base import Studio
+
+logger = logging.getLogger(__name__)
+
+SHARED_KEY_PREFIX = "studio-cache"
+
+_lock = threading.Lock()
+# lookup key ("slug:<slug>" / "pk:<pk>") -> (expires_at, studio)
+_entries: "OrderedDict[str, tuple]" = OrderedDict()
+_counters = {"hits": 0, "shared_hits": 0, "misses": 0, "invalidations": 0}
+# monotonic time of the next stats log line (0: not scheduled yet)
+_next_report = [0.0]
+
+
+def _ttl() -> int:
+    return getattr(settings, "STUDIO_CACHE_TTL", 60)
+
+
+def _shared_cache():
+    alias = getattr(settings, "STUDIO_CACHE_ALIAS", "")
+    return caches[alias] if alias else None
+
+
+def _count(name: str) -> None:
+    interval = getattr(settings, "STUDIO_CACHE_STATS_INTERVAL", 300)
+    now = time.monotonic()
+    with _lock:
+        _counters[name] += 1
+        if not _next_report[0]:
+            _next_report[0] = now + interval
+        report = interval > 0 and now >= _next_report[0]
+        if report:
+            _next_report[0] = now + interval
+    if report:
+        logger.info("studio_cache: %s", stats())
+
+
+def _local_get(key: str) -> Optional[Studio]:
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        expires_at, studio = entry
+        if expires_at < time.monotonic():
+            del _entries[key]
+            return None
+        _entries.move_to_end(key)
+        return studio
+
+
+def _local_set(studio: Studio) -> None:
+    expires_at = time.monotonic() + _ttl()
+    max_entries = getattr(settings, "STUDIO_CACHE_MAX_ENTRIES", 256)
+    with _lock:
+        for key in (f"slug:{studio.slug}", f"pk:{studio.pk}"):
+            _entries[key] = (expires_at, studio)
+            _entries.move_to_end(key)
+        while len(_entries) > max_entries:
+            _entries.popitem(last=False)
+
+
+def _shared_key(key: str) -> str:
+    return f"{SHARED_KEY_PREFIX}:{key}"
+
+
+def get(*keys: str) -> Optional[Studio]:
+    """
+    Return the cached Studio for the first matching ``slug:``/``pk:`` key.
+
+    Counts one hit or miss per call, whatever the number of keys tried.
+    """
+    for key in keys:
+        studio = _local_get(key)
+        if studio is not None:
+            _count("hits")
+            return studio
+
+    shared = _shared_cache()
+    if shared is not None:
+        found = shared.get_many([_shared_key(key) for key in keys])
+        for key in keys:
+            studio = found.get(_shared_key(key))
+            if studio is not None:
+                _count("shared_hits")
+                _local_set(studio)
+                return studio
+
+    _count("misses")
+    return None
+
+
+def put(studio: Studio) -> None:
+    _local_set(studio)
+    shared = _shared_cache()
+    if shared is not None:
+        shared.set_many(
+            {
+                _shared_key(f"slug:{studio.slug}"): studio,
+                _shared_key(f"pk:{studio.pk}"): studio,
+            },
+            timeout=_ttl(),
+        )
+
+
+def invalidate(studio: Studio, previous_slug: Optional[str] = None) -> None:
+    """Drop every entry pointing at this studio, including a previous slug."""
+    keys = {f"slug:{studio.slug}", f"pk:{studio.pk}"}
+    if previous_slug:
+        keys.add(f"slug:{previous_slug}")
+    with _lock:
+        for key, (_expires_at, cached) in list(_entries.items()):
+            if cached.pk == studio.pk:
+                keys.add(key)
+                del _entries[key]
+        _counters["invalidations"] += 1
+    shared = _shared_cache()
+    if shared is not None:
+        shared.delete_many([_shared_key(key) for key in keys])
+
+
+def clear() -> None:
+    with _lock:
+        _entries.clear()
+
+
+def stats() -> Dict:
+    """Hit/miss counters of this process since start."""
+    with _lock:
+        counters = dict(_counters)
+        counters["entries"] = len(_entries)
+    lookups = counters["hits"] + counters["shared_hits"] + counters["misses"]
+    counters["hit_rate"] = (
+        round((counters["hits"] + counters["shared_hits"]) / lookups, 4)
+        if lookups
+        else 0.0
+    )
+    return counters
@@ -0,0 +1,120 @@
+"""
+Batched resolution of play-event track tokens to Track rows.
+
+The automation player identifies tracks by UUID, by file name (usually
+``<track uuid>.mp3`` or the full ``processed_rel_path``) or by title. All
+tokens of a payload are resolved together with at most three queries:
+
+1. by id: UUID tokens, UUID file stems, and ids remembered in the token LRU
+2. by ``file_name`` (indexed exact match) for what is left
+3. by ``title`` for what is still left
+
+The LRU only remembers token -> track id; ids are always re-read in query 1,
+so a deleted track is never handed out from memory.
+"""
+
+import posixpath
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+
+from apps.medias.models import Track
+from apps.studio.models.base import Studio
+
+TRACK_FIELDS = ("id", "studio_id", "title", "file_name", "duration_seconds")
+
+_lock = threading.Lock()
+_token_ids: "OrderedDict[tuple, uuid.UUID]" = OrderedDict()
+
+
+def _lru_get(key: tuple) -> Optional[uuid.UUID]:
+    with _lock:
+        track_id = _token_ids.get(key)
+        if track_id is not None:
+            _token_ids.move_to_end(key)
+        return track_id
+
+
+def _lru_set(key: tuple, track_id: uuid.UUID) -> None:
+    max_entries = getattr(settings, "TRACK_TOKEN_CACHE_SIZE", 4096)
+    with _lock:
+        _token_ids[key] = track_id
+        _token_ids.move_to_end(key)
+        while len(_token_ids) > max_entries:
+            _token_ids.popitem(last=False)
+
+
+def _lru_forget(key: tuple) -> None:
+    with _lock:
+        _token_ids.pop(key, None)
+
+
+def clear_cache() -> None:
+    with _lock:
+        _token_ids.clear()
+
+
+def _as_uuid(value: str) -> Optional[uuid.UUID]:
+    try:
+        return uuid.UUID(value)
+    except ValueError:
+        return None
+
+
+def file_name_of(token: str) -> str:
+    """Basename of a file token; accepts Windows or POSIX separators."""
+    return posixpath.basename(token.replace("\\", "/"))
+
+
+def resolve_tracks(studio: Studio, tokens: Iterable[str]) -> Dict[str, Track]:
+    """Map each resolvable token to its Track; unknown tokens are left out."""
+    tokens = {str(t) for t in tokens if t}
+    resolved: Dict[str, Track] = {}
+    if not tokens:
+        return resolved
+
+    qs = Track.objects.filter(studio=studio).only(*TRACK_FIELDS)
+
+    # 1) ids: direct UUIDs, "<uuid>.mp3" file names and remembered tokens
+    wanted_ids: Dict[str, uuid.UUID] = {}
+    for token in tokens:
+        track_id = (
+            _lru_get((studio.pk, token))
+            or _as_uuid(token)
+            or _as_uuid(posixpath.splitext(file_name_of(token))[0])
+        )
+        if track_id is not None:
+            wanted_ids[token] = track_id
+    if wanted_ids:
+        by_id = qs.in_bulk(set(wanted_ids.values()))
+        for token, track_id in wanted_ids.items():
+            track = by_id.get(track_id)
+            if track is not None:
+                resolved[token] = track
+            else:
+                _lru_forget((studio.pk, token))
+
+    # 2) exact file name match (newest upload wins, like the old icontains)
+    pending_by_name: Dict[str, list] = {}
+    for token in tokens - resolved.keys():
+        pending_by_name.setdefault(file_name_of(token), []).append(token)
+    if pending_by_name:
+        for track in qs.filter(file_name__in=list(pending_by_name)).order_by(
+            "created_at"
+        ):
+            for token in pending_by_name.get(track.file_name, []):
+                resolved[token] = track
+
+    # 3) title fallback
+    pending_titles = tokens - resolved.keys()
+    if pending_titles:
+        for track in qs.filter(title__in=pending_titles).order_by("created_at"):
+            if track.title in pending_titles:
+                resolved[track.title] = track
+
+    for token, track in resolved.items():
+        _lru_set((studio.pk, token), track.pk)
+    return resolved
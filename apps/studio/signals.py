@@ -0,0 +1,26 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from apps.studio.models.base import Studio
+from apps.studio.services import studio_cache
+
+
+@receiver(pre_save, sender=Studio)
+def remember_previous_slug(sender, instance: Studio, **kwargs):
+    # Needed to evict the old "slug:" entry from the shared cache on rename
+    if instance._state.adding:
+        return
+    instance._previous_slug = (
+        Studio.all_objects.filter(pk=instance.pk).values_list("slug", flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Studio)
+@receiver(post_delete, sender=Studio)
+def invalidate_studio_cache(sender, instance: Studio, **kwargs):
+    # After the commit: invalidating earlier lets another process cache the
+    # old row again before the new one is visible. QuerySet.update() (and
+    # the soft delete of QuerySet.delete()) send no signal; see studio_cache
+    previous_slug = getattr(instance, "_previous_slug", None)
+    transaction.on_commit(lambda: studio_cache.invalidate(instance, previous_slug))
@@ -0,0 +1,254 @@
+"""
+Celery tasks for the studio app.
+
+drain_ingest_stream applies listener/play payloads buffered in Redis by the
+ingest endpoints when INGEST_ASYNC is enabled.
+
+refresh_listener_rollups keeps ListenerDailyRollup current and
+downsample_listener_buckets compacts MINUTE stat buckets into FIVE_MIN/HOUR
+ones (both run by beat).
+"""
+
+from __future__ import annotations
+
+import datetime
+import json
+import logging
+from collections import OrderedDict
+
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from apps.studio.models import Studio
+from apps.studio.services import ingest_queue
+from apps.studio.services.downsampling import (
+    downsample_window,
+    purge_minute_buckets,
+    uncompacted_hours,
+)
+from apps.studio.services.ingest import apply_listener_payload
+from apps.studio.services.play_ingest import apply_play_events
+from apps.studio.services.rollups import rollup_listener_days
+
+logger = logging.getLogger(__name__)
+
+# Old hours compacted per downsample run before their MINUTE rows are purged;
+# a large backlog is better cleared with the downsample_listener_buckets command
+UNCOMPACTED_HOURS_PER_RUN = 48
+
+
+def _apply_listener_entries(studio: Studio, entries) -> None:
+    """Fold every listener payload of one studio into a single bulk apply."""
+    sessions, buckets = [], []
+    now = None
+    for _entry_id, fields in entries:
+        payload = json.loads(fields["payload"])
+        sessions.extend(payload.get("sessions") or [])
+        buckets.extend(payload.get("buckets") or [])
+        received_at = parse_datetime(fields.get("received_at") or "")
+        if received_at and (now is None or received_at > now):
+            now = received_at
+    apply_listener_payload(studio, sessions, buckets, now or timezone.now())
+
+
+def _apply_play_entries(studio: Studio, entries) -> None:
+    # Start/end ordering matters, so payloads are applied one by one
+    for _entry_id, fields in entries:
+        payload = json.loads(fields["payload"])
+        events = payload if isinstance(payload, list) else [payload]
+        _created, _updated, errors = apply_play_events(studio, events)
+        if errors:
+            logger.warning(
+                "drain_ingest_stream: %d play events rejected for studio %s",
+                len(errors),
+                studio.pk,
+            )
+
+
+def _apply_group(studio: Studio, kind: str, entries) -> None:
+    with transaction.atomic():
+        if kind == ingest_queue.KIND_LISTENER:
+            _apply_listener_entries(studio, entries)
+        else:
+            _apply_play_entries(studio, entries)
+
+
+def _apply_entries_one_by_one(client, studio: Studio, kind: str, entries) -> int:
+    """
+    Apply the entries of a failed group separately, so one bad payload does
+    not hold back the others. A failing entry stays pending for a retry, or
+    is dead-lettered once delivered INGEST_MAX_DELIVERIES times. Returns the
+    number applied.
+    """
+    applied = 0
+    for entry_id, fields in entries:
+        try:
+            _apply_group(studio, kind, [(entry_id, fields)])
+        except Exception as e:
+            deliveries = ingest_queue.delivery_count(client, entry_id)
+            if deliveries >= settings.INGEST_MAX_DELIVERIES:
+                logger.error(
+                    "drain_ingest_stream: dead-lettering entry %s after %d "
+                    "deliveries: %s",
+                    entry_id,
+                    deliveries,
+                    e,
+                )
+                ingest_queue.dead_letter(client, entry_id, fields, repr(e))
+            else:
+                logger.warning(
+                    "drain_ingest_stream: entry %s failed (delivery %d): %s",
+                    entry_id,
+                    deliveries,
+                    e,
+                )
+            continue
+        ingest_queue.ack(client, [entry_id])
+        applied += 1
+    return applied
+
+
+@shared_task(ignore_result=True)
+def drain_ingest_stream():
+    """
+    Apply buffered ingest payloads in micro-batches until the stream is empty.
+
+    Entries are grouped per (kind, studio) and applied in one transaction per
+    group; they are acknowledged only after that transaction commits. When a
+    group fails its entries are applied one by one: the failing ones stay
+    pending and are retried once reclaimed (a drain is scheduled for then),
+    up to INGEST_MAX_DELIVERIES times before being dead-lettered.
+    """
+    client = ingest_queue.get_client()
+    ingest_queue.clear_drain_flag(client)
+    consumer = ingest_queue.consumer_name()
+    batch_size = settings.INGEST_DRAIN_BATCH
+    applied = 0
+
+    for _ in range(settings.INGEST_DRAIN_MAX_BATCHES):
+        entries = ingest_queue.read_batch(client, consumer, batch_size)
+        if not entries:
+            break
+
+        groups: OrderedDict = OrderedDict()
+        for entry_id, fields in entries:
+            key = (fields.get("kind"), fields.get("studio_id"))
+            groups.setdefault(key, []).append((entry_id, fields))
+
+        studio_ids = {studio_id for _kind, studio_id in groups if studio_id}
+        studios = {
+            str(pk): studio for pk, studio in Studio.objects.in_bulk(studio_ids).items()
+        }
+        for (kind, studio_id), group in groups.items():
+            entry_ids = [entry_id for entry_id, _fields in group]
+            studio = studios.get(studio_id)
+            if studio is None or kind not in (
+                ingest_queue.KIND_LISTENER,
+                ingest_queue.KIND_PLAY,
+            ):
+                logger.warning(
+                    "drain_ingest_stream: dropping %d entries (kind=%s studio=%s)",
+                    len(group),
+                    kind,
+                    studio_id,
+                )
+                ingest_queue.ack(client, entry_ids)
+                continue
+            if len(group) == 1:
+                applied += _apply_entries_one_by_one(client, studio, kind, group)
+                continue
+            try:
+                _apply_group(studio, kind, group)
+            except Exception:
+                logger.exception(
+                    "drain_ingest_stream: failed to apply %d %s entries for studio %s",
+                    len(group),
+                    kind,
+                    studio_id,
+                )
+                applied += _apply_entries_one_by_one(client, studio, kind, group)
+                continue
+            ingest_queue.ack(client, entry_ids)
+            applied += len(group)
+
+        if len(entries) < batch_size:
+            break
+    else:
+        # Still backlogged after the per-run cap: hand over to a fresh task
+        ingest_queue.schedule_drain(client)
+
+    stats = ingest_queue.queue_stats(client)
+    if stats["pending"]:
+        # Failed entries are only reclaimed once idle: come back by then even
+        # if no new payload arrives
+        ingest_queue.schedule_drain(
+            client, delay=settings.INGEST_CLAIM_IDLE_MS / 1000 + 1
+        )
+    logger.info(
+        "drain_ingest_stream: applied=%d depth=%d pending=%d dead=%d lag=%.3fs",
+        applied,
+        stats["depth"],
+        stats["pending"],
+        stats["dead"],
+        stats["lag_seconds"],
+    )
+    return applied
+
+
+@shared_task(ignore_result=True)
+def refresh_listener_rollups():
+    """
+    Recompute the daily listener rollups of the last closed days.
+
+    Late sessions and buckets can still land after midnight, so the last
+    LISTENER_ROLLUP_LOOKBACK_DAYS days are recomputed on every run rather
+    than only yesterday.
+    """
+    today = timezone.now().date()
+    first_day = today - datetime.timedelta(days=settings.LISTENER_ROLLUP_LOOKBACK_DAYS)
+    last_day = today - datetime.timedelta(days=1)
+    written = rollup_listener_days(first_day, last_day)
+    logger.info(
+        "refresh_listener_rollups: %s..%s rows=%d", first_day, last_day, written
+    )
+    return written
+
+
+@shared_task(ignore_result=True)
+def downsample_listener_buckets():
+    """
+    Compact recent MINUTE buckets into FIVE_MIN and HOUR ones, then purge
+    MINUTE rows older than LISTENER_MINUTE_RETENTION_DAYS that an HOUR bucket
+    covers. Up to UNCOMPACTED_HOURS_PER_RUN older hours not compacted yet are
+    compacted first, so nothing is purged before it is summarized.
+
+    The last LISTENER_DOWNSAMPLE_LOOKBACK_MINUTES are rebuilt on every run so
+    the current (partial) buckets and late relay flushes are picked up.
+    """
+    now = timezone.now()
+    since = now - datetime.timedelta(
+        minutes=settings.LISTENER_DOWNSAMPLE_LOOKBACK_MINUTES
+    )
+    with transaction.atomic():
+        written = downsample_window(since, now, now)
+
+    purged = 0
+    retention_days = settings.LISTENER_MINUTE_RETENTION_DAYS
+    if retention_days > 0:
+        older_than = now - datetime.timedelta(days=retention_days)
+        # Hours missed by the lookback (beat outage, history from before the
+        # compaction) are compacted before their MINUTE rows may go
+        for hour in uncompacted_hours(older_than, UNCOMPACTED_HOURS_PER_RUN):
+            with transaction.atomic():
+                downsample_window(hour, hour + datetime.timedelta(hours=1), now)
+        purged = purge_minute_buckets(older_than, settings.LISTENER_PURGE_BATCH_SIZE)
+    logger.info(
+        "downsample_listener_buckets: five_min=%d hour=%d purged_minutes=%d",
+        written["FIVE_MIN"],
+        written["HOUR"],
+        purged,
+    )
+    return written
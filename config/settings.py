@@ -23,6 +23,10 @@ RADIO_STUDIOS_ROOT = RADIO_ROOT / "studios"
 # Target bitrate for normalized MP3 when publishing
 DEFAULT_TARGET_BITRATE_KBPS = int(os.getenv("DEFAULT_TARGET_BITRATE_KBPS", "128"))
 
+# Keep each consumed upload under originals/ (RAW_ORIGINAL asset) so READY
+# tracks can be re-encoded from the source by renormalize_studio
+KEEP_ORIGINALS = os.getenv("KEEP_ORIGINALS", "True") == "True"
+
 # Upload streaming memory caps
 FILE_UPLOAD_MAX_MEMORY_SIZE = 2 * 1024 * 1024
 DATA_UPLOAD_MAX_MEMORY_SIZE = 2 * 1024 * 1024
@@ -202,5 +206,125 @@ PASSWORD_HASHERS = [
 # Celery (example)
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://127.0.0.1:6379/1")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://127.0.0.1:6379/2")
+# Periodic tasks; needs a beat process (CELERY_BEAT=True in start-single-service.sh)
+CELERY_BEAT_SCHEDULE = {
+    "refresh-listener-rollups": {
+        "task": "apps.studio.tasks.refresh_listener_rollups",
+        "schedule": int(os.getenv("LISTENER_ROLLUP_INTERVAL", "900")),
+    },
+    "downsample-listener-buckets": {
+        "task": "apps.studio.tasks.downsample_listener_buckets",
+        "schedule": int(os.getenv("LISTENER_DOWNSAMPLE_INTERVAL", "300")),
+    },
+    "kick-transcode-workers": {
+        "task": "apps.medias.tasks.run_transcode_jobs",
+        "schedule": int(os.getenv("TRANSCODE_KICK_INTERVAL", "60")),
+    },
+}
+# Transcodes run on their own queue, served by a dedicated (niced) worker
+TRANSCODE_QUEUE = os.getenv("TRANSCODE_QUEUE", "transcode")
+CELERY_TASK_ROUTES = {
+    "apps.medias.tasks.run_transcode_jobs": {"queue": TRANSCODE_QUEUE},
+}
 
 STUDIO_TOKEN = os.getenv("STUDIO_TOKEN", "")
+
+# Listener-events ingest: set-based upserts (one statement per batch) instead of
+# the per-session update_or_create loop
+LISTENER_INGEST_BULK = os.getenv("LISTENER_INGEST_BULK", "True") == "True"
+LISTENER_INGEST_BATCH_SIZE = int(os.getenv("LISTENER_INGEST_BATCH_SIZE", "1000"))
+# Caps on listener-events bodies after gzip decoding (413 beyond them)
+LISTENER_INGEST_MAX_BYTES = int(
+    os.getenv("LISTENER_INGEST_MAX_BYTES", str(64 * 1024 * 1024))
+)
+LISTENER_INGEST_MAX_LINE_BYTES = int(
+    os.getenv("LISTENER_INGEST_MAX_LINE_BYTES", str(64 * 1024))
+)
+
+# Queue-backed ingest: validate, append to a Redis stream and answer 202; a
+# Celery task applies the stream in micro-batches (needs Redis >= 6.2)
+INGEST_ASYNC = os.getenv("INGEST_ASYNC", "False") == "True"
+INGEST_QUEUE_URL = os.getenv("INGEST_QUEUE_URL", CELERY_BROKER_URL)
+INGEST_STREAM_MAXLEN = int(os.getenv("INGEST_STREAM_MAXLEN", "1000000"))
+INGEST_DRAIN_DELAY = int(os.getenv("INGEST_DRAIN_DELAY", "1"))
+INGEST_DRAIN_BATCH = int(os.getenv("INGEST_DRAIN_BATCH", "500"))
+INGEST_DRAIN_MAX_BATCHES = int(os.getenv("INGEST_DRAIN_MAX_BATCHES", "100"))
+INGEST_CLAIM_IDLE_MS = int(os.getenv("INGEST_CLAIM_IDLE_MS", "300000"))
+# Deliveries of a failing payload before it moves to ingest:events:dead
+INGEST_MAX_DELIVERIES = int(os.getenv("INGEST_MAX_DELIVERIES", "5"))
+
+# Studio lookup cache used by get_studio (per process, optionally shared
+# through the Django cache named by STUDIO_CACHE_ALIAS, e.g. "default")
+STUDIO_CACHE_TTL = int(os.getenv("STUDIO_CACHE_TTL", "60"))
+STUDIO_CACHE_MAX_ENTRIES = int(os.getenv("STUDIO_CACHE_MAX_ENTRIES", "256"))
+STUDIO_CACHE_ALIAS = os.getenv("STUDIO_CACHE_ALIAS", "")
+# Seconds between studio cache hit/miss log lines of each worker (0: never)
+STUDIO_CACHE_STATS_INTERVAL = int(os.getenv("STUDIO_CACHE_STATS_INTERVAL", "300"))
+
+# Daily listener rollups: closed days recomputed on every refresh_listener_rollups run
+LISTENER_ROLLUP_LOOKBACK_DAYS = int(os.getenv("LISTENER_ROLLUP_LOOKBACK_DAYS", "3"))
+
+# Stat bucket compaction (MINUTE -> FIVE_MIN -> HOUR). MINUTE rows are purged
+# after LISTENER_MINUTE_RETENTION_DAYS (0 keeps them); keep it above the rollup
+# lookback, daily rollups sum listener minutes from MINUTE rows
+LISTENER_DOWNSAMPLE_LOOKBACK_MINUTES = int(
+    os.getenv("LISTENER_DOWNSAMPLE_LOOKBACK_MINUTES", "120")
+)
+LISTENER_MINUTE_RETENTION_DAYS = int(os.getenv("LISTENER_MINUTE_RETENTION_DAYS", "7"))
+LISTENER_PURGE_BATCH_SIZE = int(os.getenv("LISTENER_PURGE_BATCH_SIZE", "5000"))
+
+# Live "active now" presence: "redis" (shared), "memory" (single process only)
+# or empty to count recently seen ListenerSession rows in the database. Redis
+# calls give up after LISTENER_PRESENCE_TIMEOUT seconds (ingest goes on)
+LISTENER_PRESENCE_BACKEND = os.getenv("LISTENER_PRESENCE_BACKEND", "")
+LISTENER_PRESENCE_URL = os.getenv("LISTENER_PRESENCE_URL", CELERY_BROKER_URL)
+LISTENER_PRESENCE_TIMEOUT = float(os.getenv("LISTENER_PRESENCE_TIMEOUT", "0.5"))
+LISTENER_ACTIVE_WINDOW_SECONDS = int(os.getenv("LISTENER_ACTIVE_WINDOW_SECONDS", "20"))
+
+# Track streaming: "file" (range-aware FileResponse, sendfile under gunicorn)
+# or "accel" (empty response with X-Accel-Redirect; nginx sends the bytes)
+TRACK_SERVE_MODE = os.getenv("TRACK_SERVE_MODE", "file")
+TRACK_ACCEL_REDIRECT_PREFIX = os.getenv("TRACK_ACCEL_REDIRECT_PREFIX", "/_radio/")
+# Browser/CDN lifetime of READY track responses: versioned URLs (?v=) are sent
+# as immutable, others are revalidated after the shorter unversioned max-age
+TRACK_CACHE_MAX_AGE = int(os.getenv("TRACK_CACHE_MAX_AGE", "31536000"))
+TRACK_CACHE_UNVERSIONED_MAX_AGE = int(
+    os.getenv("TRACK_CACHE_UNVERSIONED_MAX_AGE", "300")
+)
+
+# Transcode jobs (TranscodeJob ledger, fair per studio): attempts per track,
+# delay before a retry, ffmpeg niceness/threads and the hard limit of one job,
+# probe, analysis and encode included (RUNNING jobs older than twice that are
+# requeued)
+TRANSCODE_MAX_ATTEMPTS = int(os.getenv("TRANSCODE_MAX_ATTEMPTS", "3"))
+TRANSCODE_RETRY_DELAY = int(os.getenv("TRANSCODE_RETRY_DELAY", "30"))
+TRANSCODE_NICE = int(os.getenv("TRANSCODE_NICE", "10"))
+TRANSCODE_FFMPEG_THREADS = int(os.getenv("TRANSCODE_FFMPEG_THREADS", "1"))
+TRANSCODE_TIMEOUT = int(os.getenv("TRANSCODE_TIMEOUT", "3600"))
+# Seconds between encode progress writes to the job row (also when a canceled
+# job is noticed and its ffmpeg stopped)
+TRANSCODE_PROGRESS_INTERVAL = int(os.getenv("TRANSCODE_PROGRESS_INTERVAL", "5"))
+
+# Largest upload accepted by requestUpload (its .part file is preallocated to
+# the announced size); 0 disables the limit
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+# Running SHA-256 states of in-progress uploads kept per process
+UPLOAD_HASHERS_MAX = int(os.getenv("UPLOAD_HASHERS_MAX", "64"))
+
+# Chunked upload progress: "redis" (shared), "memory" (single process only) or
+# empty to record every chunk on the UploadSession row. With a backend the row
+# is checkpointed every UPLOAD_CHECKPOINT_BYTES and chunk PUTs check the token
+# against a ticket cached for UPLOAD_TICKET_TTL seconds
+UPLOAD_PROGRESS_BACKEND = os.getenv("UPLOAD_PROGRESS_BACKEND", "")
+UPLOAD_PROGRESS_URL = os.getenv("UPLOAD_PROGRESS_URL", CELERY_BROKER_URL)
+UPLOAD_PROGRESS_TTL = int(os.getenv("UPLOAD_PROGRESS_TTL", "86400"))
+UPLOAD_CHECKPOINT_BYTES = int(os.getenv("UPLOAD_CHECKPOINT_BYTES", "16777216"))
+UPLOAD_TICKET_TTL = int(os.getenv("UPLOAD_TICKET_TTL", "300"))
+
+# Seconds the tracks query's totalCount is cached per studio and filters
+# (default Django cache; 0 counts on every request)
+TRACK_COUNT_CACHE_TTL = int(os.getenv("TRACK_COUNT_CACHE_TTL", "60"))
+
+# Per-process LRU of play-event track tokens (file name/title) -> track id
+TRACK_TOKEN_CACHE_SIZE = int(os.getenv("TRACK_TOKEN_CACHE_SIZE", "4096"))
@@ -20,7 +20,7 @@ from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
 from graphene_django.views import GraphQLView
 
-from apps.medias.views import serve_track, upload_chunk_view
+from apps.medias.views import serve_track, serve_waveform, upload_chunk_view
 from apps.studio.api.ingest import ingest_listener_events
 from apps.studio.api.play_ingest import ingest_play_events
 from apps.studio.views import studio_playlist
@@ -54,4 +54,9 @@ urlpatterns = [
         serve_track,
         name="serve-track",
     ),
+    path(
+        "api/studios/<str:studio_slug>/tracks/<str:track_id>/waveform",
+        serve_waveform,
+        name="serve-track-waveform",
+    ),
 ]
@@ -8,6 +8,15 @@ HOST="${HOST:-0.0.0.0}"
 PORT="${PORT:-7080}"
 GUNICORN_WORKERS="${GUNICORN_WORKERS:-2}"
 CELERY_CONCURRENCY="${CELERY_CONCURRENCY:-2}"
+# Embed the beat scheduler in the worker (periodic tasks such as listener rollups)
+CELERY_BEAT="${CELERY_BEAT:-True}"
+# Dedicated transcode worker: one ffmpeg per slot, one CPU left to gunicorn
+CPU_COUNT="$(nproc 2>/dev/null || echo 2)"
+TRANSCODE_CONCURRENCY="${TRANSCODE_CONCURRENCY:-$(( CPU_COUNT > 1 ? CPU_COUNT - 1 : 1 ))}"
+TRANSCODE_QUEUE="${TRANSCODE_QUEUE:-transcode}"
+TRANSCODE_NICE="${TRANSCODE_NICE:-10}"
+# Optional cgroup CPU cap for the transcode worker, e.g. "150%" (needs systemd-run)
+TRANSCODE_CPU_QUOTA="${TRANSCODE_CPU_QUOTA:-}"
 
 cd "$APP_ROOT"
 
@@ -36,6 +45,10 @@ cleanup() {
     kill "$celery_pid" 2>/dev/null || true
     wait "$celery_pid" 2>/dev/null || true
   fi
+  if [ -n "${transcode_pid:-}" ]; then
+    kill "$transcode_pid" 2>/dev/null || true
+    wait "$transcode_pid" 2>/dev/null || true
+  fi
   exit "$exit_code"
 }
 
@@ -47,10 +60,26 @@ trap cleanup EXIT INT TERM
 
 gunicorn_pid=$!
 
-"$VENV_DIR/bin/celery" -A config.celery worker -l info --concurrency "$CELERY_CONCURRENCY" &
+celery_args=(-A config.celery worker -l info --concurrency "$CELERY_CONCURRENCY")
+if [ "$CELERY_BEAT" = "True" ]; then
+  celery_args+=(-B)
+fi
+
+"$VENV_DIR/bin/celery" "${celery_args[@]}" &
 celery_pid=$!
 
-wait -n "$gunicorn_pid" "$celery_pid"
+# Prefetch 1: a worker slot only takes a wake-up message when it is free
+transcode_args=(-A config.celery worker -l info -Q "$TRANSCODE_QUEUE" -n "transcode@%h"
+  --concurrency "$TRANSCODE_CONCURRENCY" --prefetch-multiplier 1 -O fair)
+transcode_cmd=(nice -n "$TRANSCODE_NICE" "$VENV_DIR/bin/celery" "${transcode_args[@]}")
+if [ -n "$TRANSCODE_CPU_QUOTA" ] && command -v systemd-run >/dev/null 2>&1; then
+  transcode_cmd=(systemd-run --user --scope -p "CPUQuota=$TRANSCODE_CPU_QUOTA" "${transcode_cmd[@]}")
+fi
+
+"${transcode_cmd[@]}" &
+transcode_pid=$!
+
+wait -n "$gunicorn_pid" "$celery_pid" "$transcode_pid"
 
-kill "$gunicorn_pid" "$celery_pid" 2>/dev/null || true
-wait "$gunicorn_pid" "$celery_pid" 2>/dev/null || true
+kill "$gunicorn_pid" "$celery_pid" "$transcode_pid" 2>/dev/null || true
+wait "$gunicorn_pid" "$celery_pid" "$transcode_pid" 2>/dev/null || true